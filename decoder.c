@@ -22,6 +22,7 @@
 #include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
 #include "libsigrokdecode.h"
 #include <glib.h>
+#include <glib/gstdio.h>
 
 /**
  * @file
@@ -170,10 +171,24 @@ static void decoder_free(struct srd_decoder *dec)
 		return;
 
 	gstate = PyGILState_Ensure();
+	if (dec->ann_strings)
+		Py_XDECREF(dec->ann_strings->py_index);
 	Py_XDECREF(dec->py_dec);
 	Py_XDECREF(dec->py_mod);
 	PyGILState_Release(gstate);
 
+	if (dec->annotation_index)
+		g_ptr_array_free(dec->annotation_index, TRUE);
+	if (dec->binary_index)
+		g_ptr_array_free(dec->binary_index, TRUE);
+	if (dec->logic_output_index)
+		g_ptr_array_free(dec->logic_output_index, TRUE);
+	if (dec->ann_strings) {
+		g_ptr_array_free(dec->ann_strings->strings, TRUE);
+		g_string_chunk_free(dec->ann_strings->chunk);
+		g_free(dec->ann_strings);
+	}
+
 	g_slist_free_full(dec->options, &decoder_option_free);
 	g_slist_free_full(dec->binary, (GDestroyNotify)&g_strfreev);
 	g_slist_free_full(dec->annotation_rows, &annotation_row_free);
@@ -767,6 +782,124 @@ SRD_PRIV long srd_decoder_apiver(const struct srd_decoder *d)
 	return apiver;
 }
 
+/**
+ * Determine which of the optional methods a decoder implements.
+ *
+ * This is done once when a decoder gets loaded or instantiated, so that
+ * the per-chunk code paths need not look up attributes by name.
+ *
+ * @param py_obj The Decoder class or instance. Must not be NULL.
+ *
+ * @return A combination of SRD_HOOK_* flags.
+ *
+ * @private
+ */
+SRD_PRIV unsigned int srd_decoder_hooks_find(PyObject *py_obj)
+{
+	static const struct {
+		const char *name;
+		unsigned int flag;
+	} hooks[] = {
+		{ "start", SRD_HOOK_START, },
+		{ "decode", SRD_HOOK_DECODE, },
+		{ "reset", SRD_HOOK_RESET, },
+		{ "flush", SRD_HOOK_FLUSH, },
+		{ "metadata", SRD_HOOK_METADATA, },
+	};
+	unsigned int flags;
+	size_t i;
+	PyGILState_STATE gstate;
+
+	gstate = PyGILState_Ensure();
+
+	flags = 0;
+	for (i = 0; i < G_N_ELEMENTS(hooks); i++) {
+		if (PyObject_HasAttrString(py_obj, hooks[i].name))
+			flags |= hooks[i].flag;
+	}
+
+	PyGILState_Release(gstate);
+
+	return flags;
+}
+
+/* Maximum number of annotation texts which get interned per decoder. */
+#define STRING_TABLE_SIZE (64 * 1024)
+
+/**
+ * Get the interned C string for an annotation text of a decoder.
+ *
+ * Each distinct text gets converted only once. The string remains valid
+ * (and at the same address) until the decoder gets unloaded, and must
+ * not be modified. The caller must hold the Python GIL.
+ *
+ * @param dec The decoder. Must not be NULL.
+ * @param py_str The annotation text, a Python str object.
+ *
+ * @return The interned string, or NULL when the decoder's string table
+ *         is exhausted. NULL with a pending Python exception upon errors.
+ *
+ * @private
+ */
+SRD_PRIV const char *srd_decoder_string_intern(struct srd_decoder *dec,
+		PyObject *py_str)
+{
+	struct srd_string_table *table;
+	PyObject *py_idx, *py_bytes;
+	char *str;
+	int ret;
+
+	table = dec->ann_strings;
+	if (!table) {
+		table = g_malloc0(sizeof(*table));
+		table->py_index = PyDict_New();
+		if (!table->py_index) {
+			g_free(table);
+			return NULL;
+		}
+		table->strings = g_ptr_array_new();
+		table->chunk = g_string_chunk_new(4096);
+		dec->ann_strings = table;
+	}
+
+	py_idx = PyDict_GetItem(table->py_index, py_str);
+	if (py_idx)
+		return g_ptr_array_index(table->strings, PyLong_AsLong(py_idx));
+
+	if (table->strings->len >= STRING_TABLE_SIZE)
+		return NULL;
+
+	py_bytes = PyUnicode_AsUTF8String(py_str);
+	if (!py_bytes)
+		return NULL;
+	str = g_string_chunk_insert(table->chunk, PyBytes_AsString(py_bytes));
+	Py_DECREF(py_bytes);
+
+	py_idx = PyLong_FromLong(table->strings->len);
+	if (!py_idx)
+		return NULL;
+	ret = PyDict_SetItem(table->py_index, py_str, py_idx);
+	Py_DECREF(py_idx);
+	if (ret < 0)
+		return NULL;
+	g_ptr_array_add(table->strings, str);
+
+	return str;
+}
+
+/* Get an array of a list's items, for lookups by index. */
+static GPtrArray *list_index_new(const GSList *list)
+{
+	GPtrArray *index;
+	const GSList *l;
+
+	index = g_ptr_array_new();
+	for (l = list; l; l = l->next)
+		g_ptr_array_add(index, l->data);
+
+	return index;
+}
+
 static gboolean contains_duplicates(GSList *list)
 {
 	for (GSList *l1 = list; l1; l1 = l1->next) {
@@ -814,65 +947,465 @@ static gboolean contains_duplicate_row_ids(GSList *list1, GSList *list2)
 	return FALSE;
 }
 
+/*
+ * The decoder index holds the metadata of decoders which were imported
+ * before, so that later runs need not import every decoder's module.
+ * It maps the path of a decoder's directory to a tuple of the directory's
+ * stamp (see index_stamp()) and a dict of the Decoder class attributes.
+ * The index is kept in a file in marshal format, see index_path().
+ */
+
+/* Class attributes which get recorded in the decoder index. */
+static const char *const index_attrs[] = {
+	"api_version", "id", "name", "longname", "desc", "license",
+	"inputs", "outputs", "tags", "options", "channels",
+	"optional_channels", "annotations", "annotation_rows", "binary",
+	"logic_output_channels", NULL,
+};
+
+/* The decoder index, NULL if not (yet) read or if disabled. */
+static PyObject *py_index = NULL;
+static PyObject *py_marshal = NULL;
+static char *index_file = NULL;
+static gboolean index_opened = FALSE;
+static gboolean index_dirty = FALSE;
+
+/* Names of the modules which were loaded (possibly from the index). */
+static GHashTable *pd_modules = NULL;
+
+/* Paths of the modules in decoder bundles (bundle file + module name). */
+static GHashTable *bundle_modules = NULL;
+
+/*
+ * Stamps of directories and bundles which several decoders share, see
+ * index_checksum() and index_stamp_bundle().
+ */
+static GHashTable *stamp_cache = NULL;
+
+/*
+ * The index file is taken from the SIGROKDECODE_INDEX environment
+ * variable, an empty value disables the index. The default is a file
+ * in the user's cache directory.
+ */
+static char *index_path(void)
+{
+	const char *env_path;
+
+	if ((env_path = g_getenv("SIGROKDECODE_INDEX")))
+		return *env_path ? g_strdup(env_path) : NULL;
+
+	return g_build_filename(g_get_user_cache_dir(), "libsigrokdecode",
+			"decoders.index", NULL);
+}
+
+/* Index files from other library or Python versions are not used. */
+static PyObject *index_version(void)
+{
+	return PyUnicode_FromFormat("%s %x", SRD_LIB_VERSION_STRING,
+			(unsigned int)PY_VERSION_HEX);
+}
+
+/* Read the decoder index (once). Must be called with the GIL held. */
+static PyObject *index_open(void)
+{
+	PyObject *py_bytes, *py_data, *py_version, *py_decoders;
+	char *contents;
+	gsize len;
+
+	if (index_opened)
+		return py_index;
+	index_opened = TRUE;
+
+	if (!(index_file = index_path()))
+		return NULL;
+
+	py_marshal = py_import_by_name("marshal");
+	py_index = PyDict_New();
+	if (!py_marshal || !py_index) {
+		PyErr_Clear();
+		Py_CLEAR(py_marshal);
+		Py_CLEAR(py_index);
+		return NULL;
+	}
+
+	if (!g_file_get_contents(index_file, &contents, &len, NULL))
+		return py_index;
+
+	py_data = NULL;
+	if ((py_bytes = PyBytes_FromStringAndSize(contents, len))) {
+		py_data = PyObject_CallMethod(py_marshal, "loads", "O", py_bytes);
+		Py_DECREF(py_bytes);
+	}
+	g_free(contents);
+
+	py_version = index_version();
+	if (py_data && py_version && PyDict_Check(py_data)
+			&& PyObject_RichCompareBool(py_version,
+				PyDict_GetItemString(py_data, "version"), Py_EQ) == 1
+			&& (py_decoders = PyDict_GetItemString(py_data, "decoders"))
+			&& PyDict_Check(py_decoders)) {
+		PyDict_Update(py_index, py_decoders);
+	} else {
+		srd_dbg("Ignoring decoder index %s.", index_file);
+	}
+	PyErr_Clear();
+	Py_XDECREF(py_version);
+	Py_XDECREF(py_data);
+
+	return py_index;
+}
+
+/* Write the decoder index if it changed. Must be called with the GIL held. */
+static void index_save(void)
+{
+	PyObject *py_data, *py_version, *py_bytes;
+	char *dir, *buf;
+	Py_ssize_t size;
+
+	if (!py_index || !index_dirty)
+		return;
+	index_dirty = FALSE;
+
+	py_bytes = NULL;
+	py_version = index_version();
+	py_data = Py_BuildValue("{s:O,s:O}", "version", py_version,
+			"decoders", py_index);
+	if (py_data)
+		py_bytes = PyObject_CallMethod(py_marshal, "dumps", "O", py_data);
+	if (py_bytes && PyBytes_AsStringAndSize(py_bytes, &buf, &size) == 0) {
+		dir = g_path_get_dirname(index_file);
+		g_mkdir_with_parents(dir, 0755);
+		g_free(dir);
+		if (!g_file_set_contents(index_file, buf, size, NULL))
+			srd_dbg("Cannot write decoder index %s.", index_file);
+	}
+	PyErr_Clear();
+	Py_XDECREF(py_bytes);
+	Py_XDECREF(py_data);
+	Py_XDECREF(py_version);
+}
+
+/*
+ * Find the directory which a decoder's module gets imported from. For
+ * modules in a decoder bundle the bundle file is returned in *bundle.
+ */
+static char *index_module_dir(const char *module_name, const char **bundle)
+{
+	GSList *l;
+	char *path, *init;
+	gboolean found;
+
+	*bundle = NULL;
+	for (l = searchpaths; l; l = l->next) {
+		path = g_build_filename(l->data, module_name, NULL);
+		if (bundle_modules && g_hash_table_contains(bundle_modules, path)) {
+			*bundle = l->data;
+			return path;
+		}
+		init = g_build_filename(path, "__init__.py", NULL);
+		found = g_file_test(init, G_FILE_TEST_IS_REGULAR);
+		g_free(init);
+		if (found)
+			return path;
+		g_free(path);
+	}
+
+	return NULL;
+}
+
+/*
+ * Add the names and contents of a directory's files to a checksum, also
+ * of those in subdirectories (except for Python's bytecode caches). The
+ * entries are handled in the order of their names.
+ */
+static void index_checksum_dir(GChecksum *checksum, const char *path)
+{
+	GDir *dir;
+	const gchar *direntry;
+	GSList *names, *l;
+	char *file, *contents;
+	gsize len;
+
+	if (!(dir = g_dir_open(path, 0, NULL)))
+		return;
+	names = NULL;
+	while ((direntry = g_dir_read_name(dir)) != NULL)
+		names = g_slist_insert_sorted(names, g_strdup(direntry),
+				(GCompareFunc)strcmp);
+	g_dir_close(dir);
+
+	for (l = names; l; l = l->next) {
+		file = g_build_filename(path, l->data, NULL);
+		if (g_file_test(file, G_FILE_TEST_IS_DIR)) {
+			if (strcmp(l->data, "__pycache__")) {
+				g_checksum_update(checksum, l->data, strlen(l->data) + 1);
+				index_checksum_dir(checksum, file);
+			}
+		} else if (g_file_get_contents(file, &contents, &len, NULL)) {
+			g_checksum_update(checksum, l->data, strlen(l->data) + 1);
+			g_checksum_update(checksum, (const guchar *)contents, len);
+			g_free(contents);
+		}
+		g_free(file);
+	}
+	g_slist_free_full(names, g_free);
+}
+
+/*
+ * Get the checksum of a directory's contents (see index_checksum_dir()).
+ * Directories which many decoders share get checked once, the results
+ * are kept until srd_decoder_index_free().
+ */
+static const char *index_checksum(const char *path)
+{
+	GChecksum *checksum;
+	char *digest;
+
+	if (!stamp_cache)
+		stamp_cache = g_hash_table_new_full(g_str_hash, g_str_equal,
+				g_free, g_free);
+	else if ((digest = g_hash_table_lookup(stamp_cache, path)))
+		return digest;
+
+	checksum = g_checksum_new(G_CHECKSUM_SHA1);
+	index_checksum_dir(checksum, path);
+	digest = g_strdup(g_checksum_get_string(checksum));
+	g_checksum_free(checksum);
+	g_hash_table_insert(stamp_cache, g_strdup(path), digest);
+
+	return digest;
+}
+
+/*
+ * Get the stamp of a decoder's directory: the checksums of its contents,
+ * and of the contents of the 'common' directory next to it (which has
+ * modules that decoders import). Checksums catch modifications which
+ * don't change file sizes, within the (coarse) resolution of mtimes.
+ */
+static PyObject *index_stamp(const char *path)
+{
+	PyObject *py_stamp;
+	char *parent, *common;
+	GChecksum *checksum;
+
+	if (!g_file_test(path, G_FILE_TEST_IS_DIR))
+		return NULL;
+
+	parent = g_path_get_dirname(path);
+	common = g_build_filename(parent, "common", NULL);
+	g_free(parent);
+
+	checksum = g_checksum_new(G_CHECKSUM_SHA1);
+	index_checksum_dir(checksum, path);
+	py_stamp = Py_BuildValue("(ss)", g_checksum_get_string(checksum),
+			index_checksum(common));
+	g_checksum_free(checksum);
+	g_free(common);
+
+	return py_stamp;
+}
+
+/*
+ * Get the stamp of a decoder bundle, which is a single file. All of the
+ * bundle's decoders share the stamp, the file gets checked once.
+ */
+static PyObject *index_stamp_bundle(const char *path)
+{
+	GStatBuf st;
+	char *stamp;
+
+	if (!stamp_cache)
+		stamp_cache = g_hash_table_new_full(g_str_hash, g_str_equal,
+				g_free, g_free);
+	if (!(stamp = g_hash_table_lookup(stamp_cache, path))) {
+		if (g_stat(path, &st) != 0)
+			return NULL;
+		stamp = g_strdup_printf("%lld %lld", (long long)st.st_mtime,
+				(long long)st.st_size);
+		g_hash_table_insert(stamp_cache, g_strdup(path), stamp);
+	}
+
+	return Py_BuildValue("(s)", stamp);
+}
+
+/*
+ * Look up a decoder in the index. Returns a stand-in for its Decoder
+ * class (a new reference), or NULL if the index has no up to date entry.
+ * The decoder's directory and its stamp are returned for index_add().
+ * Must be called with the GIL held.
+ */
+static PyObject *index_lookup(const char *module_name, char **dir,
+		PyObject **py_stamp)
+{
+	PyObject *py_entry, *py_attrs, *py_standin;
+	const char *bundle;
+
+	*dir = NULL;
+	*py_stamp = NULL;
+
+	if (!index_open())
+		return NULL;
+
+	if (!(*dir = index_module_dir(module_name, &bundle)))
+		return NULL;
+
+	*py_stamp = bundle ? index_stamp_bundle(bundle) : index_stamp(*dir);
+	if (!*py_stamp) {
+		PyErr_Clear();
+		return NULL;
+	}
+
+	py_entry = PyDict_GetItemString(py_index, *dir);
+	if (!py_entry || !PyTuple_Check(py_entry) || PyTuple_Size(py_entry) != 2)
+		return NULL;
+
+	if (PyObject_RichCompareBool(PyTuple_GetItem(py_entry, 0),
+			*py_stamp, Py_EQ) != 1) {
+		PyErr_Clear();
+		return NULL;
+	}
+
+	py_attrs = PyTuple_GetItem(py_entry, 1);
+	if (!PyDict_Check(py_attrs))
+		return NULL;
+
+	/* The stand-in is a plain class which has the recorded attributes. */
+	py_standin = PyObject_CallFunction((PyObject *)&PyType_Type, "s()O",
+			"Decoder", py_attrs);
+	if (!py_standin)
+		PyErr_Clear();
+
+	return py_standin;
+}
+
+/*
+ * Record the metadata of an imported decoder in the index. Decoders
+ * whose attributes cannot be marshalled are not recorded.
+ * Must be called with the GIL held.
+ */
+static void index_add(const struct srd_decoder *d, const char *module_name,
+		const char *dir, PyObject *py_stamp)
+{
+	PyObject *py_attrs, *py_attr, *py_bytes, *py_entry;
+	const char *const *name;
+
+	if (!py_index || !dir || !py_stamp)
+		return;
+
+	if (!(py_attrs = PyDict_New()))
+		goto err;
+
+	for (name = index_attrs; *name; name++) {
+		if (!PyObject_HasAttrString(d->py_dec, *name))
+			continue;
+		if (!(py_attr = PyObject_GetAttrString(d->py_dec, *name)))
+			goto err;
+		PyDict_SetItemString(py_attrs, *name, py_attr);
+		Py_DECREF(py_attr);
+	}
+
+	/* The module's docstring, see srd_decoder_doc_get(). */
+	if (!(py_attr = PyObject_GetAttrString(d->py_mod, "__doc__")))
+		goto err;
+	PyDict_SetItemString(py_attrs, "__doc__", py_attr);
+	Py_DECREF(py_attr);
+
+	/* The module name, see srd_decoder_import(). */
+	if (!(py_attr = PyUnicode_FromString(module_name)))
+		goto err;
+	PyDict_SetItemString(py_attrs, "__module__", py_attr);
+	Py_DECREF(py_attr);
+
+	if (!(py_bytes = PyObject_CallMethod(py_marshal, "dumps", "O", py_attrs)))
+		goto err;
+	Py_DECREF(py_bytes);
+
+	if (!(py_entry = Py_BuildValue("(OO)", py_stamp, py_attrs)))
+		goto err;
+	PyDict_SetItemString(py_index, dir, py_entry);
+	Py_DECREF(py_entry);
+	Py_DECREF(py_attrs);
+	index_dirty = TRUE;
+
+	return;
+
+err:
+	srd_dbg("Decoder %s not added to the index.", module_name);
+	PyErr_Clear();
+	Py_XDECREF(py_attrs);
+}
+
 /**
- * Load a protocol decoder module into the embedded Python interpreter.
- *
- * @param module_name The module name to be loaded.
+ * Write the decoder index if it changed, and release it.
  *
- * @return SRD_OK upon success, a (negative) error code otherwise.
- *
- * @since 0.1.0
+ * @private
  */
-SRD_API int srd_decoder_load(const char *module_name)
+SRD_PRIV void srd_decoder_index_free(void)
 {
-	PyObject *py_basedec;
-	struct srd_decoder *d;
-	long apiver;
-	int is_subclass;
-	const char *fail_txt;
 	PyGILState_STATE gstate;
-	size_t ann_cls_count;
 
-	if (!srd_check_init())
-		return SRD_ERR;
+	if (py_index || py_marshal) {
+		gstate = PyGILState_Ensure();
+		index_save();
+		Py_CLEAR(py_index);
+		Py_CLEAR(py_marshal);
+		PyGILState_Release(gstate);
+	}
 
-	if (!module_name)
-		return SRD_ERR_ARG;
+	g_free(index_file);
+	index_file = NULL;
+	index_opened = FALSE;
 
-	gstate = PyGILState_Ensure();
+	if (pd_modules) {
+		g_hash_table_destroy(pd_modules);
+		pd_modules = NULL;
+	}
 
-	if (PyDict_GetItemString(PyImport_GetModuleDict(), module_name)) {
-		/* Module was already imported. */
-		PyGILState_Release(gstate);
-		return SRD_OK;
+	if (bundle_modules) {
+		g_hash_table_destroy(bundle_modules);
+		bundle_modules = NULL;
 	}
 
-	d = g_malloc0(sizeof(struct srd_decoder));
-	fail_txt = NULL;
+	if (stamp_cache) {
+		g_hash_table_destroy(stamp_cache);
+		stamp_cache = NULL;
+	}
+}
+
+/*
+ * Import a decoder's module and check its Decoder class. Must be called
+ * with the GIL held. Upon failure *fail_txt may hold the reason.
+ */
+static int decoder_import_class(struct srd_decoder *d, const char *module_name,
+		const char **fail_txt)
+{
+	PyObject *py_basedec;
+	long apiver;
+	int is_subclass;
 
 	d->py_mod = py_import_by_name(module_name);
 	if (!d->py_mod) {
-		fail_txt = "import by name failed";
-		goto except_out;
+		*fail_txt = "import by name failed";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (!mod_sigrokdecode) {
 		srd_err("sigrokdecode module not loaded.");
-		fail_txt = "sigrokdecode(3) not loaded";
-		goto err_out;
+		*fail_txt = "sigrokdecode(3) not loaded";
+		return SRD_ERR_PYTHON;
 	}
 
 	/* Get the 'Decoder' class as Python object. */
 	d->py_dec = PyObject_GetAttrString(d->py_mod, "Decoder");
 	if (!d->py_dec) {
-		fail_txt = "no 'Decoder' attribute in imported module";
-		goto except_out;
+		*fail_txt = "no 'Decoder' attribute in imported module";
+		return SRD_ERR_PYTHON;
 	}
 
 	py_basedec = PyObject_GetAttrString(mod_sigrokdecode, "Decoder");
 	if (!py_basedec) {
-		fail_txt = "no 'Decoder' attribute in sigrokdecode(3)";
-		goto except_out;
+		*fail_txt = "no 'Decoder' attribute in sigrokdecode(3)";
+		return SRD_ERR_PYTHON;
 	}
 
 	is_subclass = PyObject_IsSubclass(d->py_dec, py_basedec);
@@ -881,8 +1414,8 @@ SRD_API int srd_decoder_load(const char *module_name)
 	if (!is_subclass) {
 		srd_err("Decoder class in protocol decoder module %s is not "
 			"a subclass of sigrokdecode.Decoder.", module_name);
-		fail_txt = "not a subclass of sigrokdecode.Decoder";
-		goto err_out;
+		*fail_txt = "not a subclass of sigrokdecode.Decoder";
+		return SRD_ERR_PYTHON;
 	}
 
 	/*
@@ -893,162 +1426,280 @@ SRD_API int srd_decoder_load(const char *module_name)
 	if (apiver != 3) {
 		srd_exception_catch("Only PD API version 3 is supported, "
 			"decoder %s has version %ld", module_name, apiver);
-		fail_txt = "API version mismatch";
-		goto err_out;
+		*fail_txt = "API version mismatch";
+		return SRD_ERR_PYTHON;
 	}
 
 	/* Check Decoder class for required methods. */
 
 	if (check_method(d->py_dec, module_name, "reset") != SRD_OK) {
-		fail_txt = "no 'reset()' method";
-		goto err_out;
+		*fail_txt = "no 'reset()' method";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (check_method(d->py_dec, module_name, "start") != SRD_OK) {
-		fail_txt = "no 'start()' method";
-		goto err_out;
+		*fail_txt = "no 'start()' method";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (check_method(d->py_dec, module_name, "decode") != SRD_OK) {
-		fail_txt = "no 'decode()' method";
-		goto err_out;
+		*fail_txt = "no 'decode()' method";
+		return SRD_ERR_PYTHON;
 	}
 
+	d->hooks = srd_decoder_hooks_find(d->py_dec);
+
+	return SRD_OK;
+}
+
+/*
+ * Convert the attributes of a Decoder class (or of its stand-in from the
+ * decoder index) to C. Must be called with the GIL held. Upon failure
+ * *fail_txt holds the reason.
+ */
+static int decoder_parse(struct srd_decoder *d, const char **fail_txt)
+{
+	size_t ann_cls_count;
+
 	/* Store required fields in newly allocated strings. */
 	if (py_attr_as_str(d->py_dec, "id", &(d->id)) != SRD_OK) {
-		fail_txt = "no 'id' attribute";
-		goto err_out;
+		*fail_txt = "no 'id' attribute";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (py_attr_as_str(d->py_dec, "name", &(d->name)) != SRD_OK) {
-		fail_txt = "no 'name' attribute";
-		goto err_out;
+		*fail_txt = "no 'name' attribute";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (py_attr_as_str(d->py_dec, "longname", &(d->longname)) != SRD_OK) {
-		fail_txt = "no 'longname' attribute";
-		goto err_out;
+		*fail_txt = "no 'longname' attribute";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (py_attr_as_str(d->py_dec, "desc", &(d->desc)) != SRD_OK) {
-		fail_txt = "no 'desc' attribute";
-		goto err_out;
+		*fail_txt = "no 'desc' attribute";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (py_attr_as_str(d->py_dec, "license", &(d->license)) != SRD_OK) {
-		fail_txt = "no 'license' attribute";
-		goto err_out;
+		*fail_txt = "no 'license' attribute";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (py_attr_as_strlist(d->py_dec, "inputs", &(d->inputs)) != SRD_OK) {
-		fail_txt = "missing or malformed 'inputs' attribute";
-		goto err_out;
+		*fail_txt = "missing or malformed 'inputs' attribute";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (py_attr_as_strlist(d->py_dec, "outputs", &(d->outputs)) != SRD_OK) {
-		fail_txt = "missing or malformed 'outputs' attribute";
-		goto err_out;
+		*fail_txt = "missing or malformed 'outputs' attribute";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (py_attr_as_strlist(d->py_dec, "tags", &(d->tags)) != SRD_OK) {
-		fail_txt = "missing or malformed 'tags' attribute";
-		goto err_out;
+		*fail_txt = "missing or malformed 'tags' attribute";
+		return SRD_ERR_PYTHON;
 	}
 
 	/* All options and their default values. */
 	if (get_options(d) != SRD_OK) {
-		fail_txt = "cannot get options";
-		goto err_out;
+		*fail_txt = "cannot get options";
+		return SRD_ERR_PYTHON;
 	}
 
 	/* Check and import required channels. */
 	if (get_channels(d, "channels", &d->channels, 0) != SRD_OK) {
-		fail_txt = "cannot get channels";
-		goto err_out;
+		*fail_txt = "cannot get channels";
+		return SRD_ERR_PYTHON;
 	}
 
 	/* Check and import optional channels. */
 	if (get_channels(d, "optional_channels", &d->opt_channels,
 				g_slist_length(d->channels)) != SRD_OK) {
-		fail_txt = "cannot get optional channels";
-		goto err_out;
+		*fail_txt = "cannot get optional channels";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (get_annotations(d, &ann_cls_count) != SRD_OK) {
-		fail_txt = "cannot get annotations";
-		goto err_out;
+		*fail_txt = "cannot get annotations";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (get_annotation_rows(d, ann_cls_count) != SRD_OK) {
-		fail_txt = "cannot get annotation rows";
-		goto err_out;
+		*fail_txt = "cannot get annotation rows";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (get_binary_classes(d) != SRD_OK) {
-		fail_txt = "cannot get binary classes";
-		goto err_out;
+		*fail_txt = "cannot get binary classes";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (contains_duplicates(d->inputs)) {
-		fail_txt = "duplicate input IDs";
-		goto err_out;
+		*fail_txt = "duplicate input IDs";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (contains_duplicates(d->outputs)) {
-		fail_txt = "duplicate output IDs";
-		goto err_out;
+		*fail_txt = "duplicate output IDs";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (contains_duplicates(d->tags)) {
-		fail_txt = "duplicate tags";
-		goto err_out;
+		*fail_txt = "duplicate tags";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (contains_duplicate_ids(d->channels, d->channels)) {
-		fail_txt = "duplicate channel IDs";
-		goto err_out;
+		*fail_txt = "duplicate channel IDs";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (contains_duplicate_ids(d->opt_channels, d->opt_channels)) {
-		fail_txt = "duplicate optional channel IDs";
-		goto err_out;
+		*fail_txt = "duplicate optional channel IDs";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (contains_duplicate_ids(d->channels, d->opt_channels)) {
-		fail_txt = "channel and optional channel IDs contain duplicates";
-		goto err_out;
+		*fail_txt = "channel and optional channel IDs contain duplicates";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (contains_duplicate_ids(d->options, d->options)) {
-		fail_txt = "duplicate option IDs";
-		goto err_out;
+		*fail_txt = "duplicate option IDs";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (contains_duplicate_ids(d->annotations, d->annotations)) {
-		fail_txt = "duplicate annotation class IDs";
-		goto err_out;
+		*fail_txt = "duplicate annotation class IDs";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (contains_duplicate_row_ids(d->annotation_rows, d->annotation_rows)) {
-		fail_txt = "duplicate annotation row IDs";
-		goto err_out;
+		*fail_txt = "duplicate annotation row IDs";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (contains_duplicate_ids(d->annotations, d->annotation_rows)) {
-		fail_txt = "annotation class/row IDs contain duplicates";
-		goto err_out;
+		*fail_txt = "annotation class/row IDs contain duplicates";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (contains_duplicate_ids(d->binary, d->binary)) {
-		fail_txt = "duplicate binary class IDs";
-		goto err_out;
+		*fail_txt = "duplicate binary class IDs";
+		return SRD_ERR_PYTHON;
 	}
 
 	if (get_logic_output_channels(d) != SRD_OK) {
-		fail_txt = "cannot get logic output channels";
-		goto err_out;
+		*fail_txt = "cannot get logic output channels";
+		return SRD_ERR_PYTHON;
+	}
+
+	return SRD_OK;
+}
+
+/* Log why a decoder could not be loaded or imported. */
+static void decoder_load_fail(const char *module_name, const char *fail_txt)
+{
+	if (PyErr_Occurred()) {
+		/* Don't show a message for the "common" directory, it's not a PD. */
+		if (strcmp(module_name, "common"))
+			srd_exception_catch("Failed to load decoder %s: %s",
+					module_name, fail_txt);
+		else
+			PyErr_Clear();
+	} else if (fail_txt) {
+		srd_err("Failed to load decoder %s: %s", module_name, fail_txt);
 	}
+}
 
+/**
+ * Load a protocol decoder module into the embedded Python interpreter.
+ *
+ * When the decoder index holds up to date metadata for the decoder, the
+ * module is not imported yet. This happens when the decoder gets
+ * instantiated for the first time.
+ *
+ * @param module_name The module name to be loaded.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.1.0
+ */
+SRD_API int srd_decoder_load(const char *module_name)
+{
+	struct srd_decoder *d;
+	PyObject *py_stamp;
+	const char *fail_txt;
+	char *index_dir;
+	struct srd_startup_mark mark;
+	int ret;
+	PyGILState_STATE gstate;
+
+	if (!srd_check_init())
+		return SRD_ERR;
+
+	if (!module_name)
+		return SRD_ERR_ARG;
+
+	gstate = PyGILState_Ensure();
+
+	if (PyDict_GetItemString(PyImport_GetModuleDict(), module_name)
+			|| (pd_modules && g_hash_table_contains(pd_modules, module_name))) {
+		/* Module was already imported (or loaded from the index). */
+		PyGILState_Release(gstate);
+		return SRD_OK;
+	}
+
+	d = g_malloc0(sizeof(struct srd_decoder));
+	fail_txt = NULL;
+
+	/* Take the decoder's metadata from the index if it is up to date. */
+	srd_startup_begin(&mark);
+	d->py_dec = index_lookup(module_name, &index_dir, &py_stamp);
+	srd_startup_end(&mark, SRD_STARTUP_DECODER_INDEX, module_name);
+	if (d->py_dec) {
+		srd_startup_begin(&mark);
+		ret = decoder_parse(d, &fail_txt);
+		srd_startup_end(&mark, SRD_STARTUP_DECODER_METADATA, module_name);
+		if (ret == SRD_OK) {
+			srd_dbg("Loaded decoder %s from the index.", module_name);
+			goto loaded;
+		}
+		/* Import the module instead. */
+		PyErr_Clear();
+		decoder_free(d);
+		d = g_malloc0(sizeof(struct srd_decoder));
+		fail_txt = NULL;
+	}
+
+	srd_startup_begin(&mark);
+	ret = decoder_import_class(d, module_name, &fail_txt);
+	srd_startup_end(&mark, SRD_STARTUP_DECODER_IMPORT, module_name);
+	if (ret != SRD_OK)
+		goto err_out;
+
+	srd_startup_begin(&mark);
+	ret = decoder_parse(d, &fail_txt);
+	srd_startup_end(&mark, SRD_STARTUP_DECODER_METADATA, module_name);
+	if (ret != SRD_OK)
+		goto err_out;
+
+	index_add(d, module_name, index_dir, py_stamp);
+
+loaded:
+	d->annotation_index = list_index_new(d->annotations);
+	d->binary_index = list_index_new(d->binary);
+	d->logic_output_index = list_index_new(d->logic_output_channels);
+
+	if (!pd_modules)
+		pd_modules = g_hash_table_new_full(g_str_hash, g_str_equal,
+				g_free, NULL);
+	g_hash_table_insert(pd_modules, g_strdup(module_name), NULL);
+
+	Py_XDECREF(py_stamp);
+	g_free(index_dir);
 	PyGILState_Release(gstate);
 
 	/* Append it to the list of loaded decoders. */
@@ -1056,23 +1707,72 @@ SRD_API int srd_decoder_load(const char *module_name)
 
 	return SRD_OK;
 
-except_out:
-	/* Don't show a message for the "common" directory, it's not a PD. */
-	if (strcmp(module_name, "common")) {
-		srd_exception_catch("Failed to load decoder %s: %s",
-				    module_name, fail_txt);
-	}
-	fail_txt = NULL;
-
 err_out:
-	if (fail_txt)
-		srd_err("Failed to load decoder %s: %s", module_name, fail_txt);
+	decoder_load_fail(module_name, fail_txt);
 	decoder_free(d);
+	Py_XDECREF(py_stamp);
+	g_free(index_dir);
 	PyGILState_Release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
 
+/**
+ * Import the module of a decoder which was loaded from the decoder index.
+ *
+ * The stand-in for the Decoder class gets replaced by the real class.
+ * Nothing is done when the module was imported already.
+ *
+ * @param d The decoder to import. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_decoder_import(struct srd_decoder *d)
+{
+	PyObject *py_standin;
+	const char *fail_txt;
+	char *module_name;
+	struct srd_startup_mark mark;
+	int ret;
+	PyGILState_STATE gstate;
+
+	gstate = PyGILState_Ensure();
+
+	if (d->py_mod) {
+		PyGILState_Release(gstate);
+		return SRD_OK;
+	}
+
+	if (py_attr_as_str(d->py_dec, "__module__", &module_name) != SRD_OK) {
+		PyGILState_Release(gstate);
+		return SRD_ERR_PYTHON;
+	}
+
+	srd_dbg("Importing decoder %s.", module_name);
+
+	py_standin = d->py_dec;
+	d->py_dec = NULL;
+	fail_txt = NULL;
+	srd_startup_begin(&mark);
+	ret = decoder_import_class(d, module_name, &fail_txt);
+	srd_startup_end(&mark, SRD_STARTUP_DECODER_IMPORT, module_name);
+	if (ret == SRD_OK) {
+		Py_DECREF(py_standin);
+	} else {
+		decoder_load_fail(module_name, fail_txt);
+		Py_CLEAR(d->py_mod);
+		Py_XDECREF(d->py_dec);
+		d->py_dec = py_standin;
+	}
+
+	g_free(module_name);
+	PyGILState_Release(gstate);
+
+	return ret;
+}
+
 /**
  * Return a protocol decoder's docstring.
  *
@@ -1085,22 +1785,32 @@ err_out:
  */
 SRD_API char *srd_decoder_doc_get(const struct srd_decoder *dec)
 {
-	PyObject *py_str;
+	PyObject *py_obj, *py_str;
 	char *doc;
 	PyGILState_STATE gstate;
 
 	if (!srd_check_init())
 		return NULL;
 
-	if (!dec || !dec->py_mod)
+	if (!dec)
+		return NULL;
+
+	/*
+	 * Decoders loaded from the index have the docstring in the stand-in.
+	 * Only trust py_dec of decoders which were actually loaded.
+	 */
+	py_obj = dec->py_mod;
+	if (!py_obj && g_slist_find(pd_list, dec))
+		py_obj = dec->py_dec;
+	if (!py_obj)
 		return NULL;
 
 	gstate = PyGILState_Ensure();
 
-	if (!PyObject_HasAttrString(dec->py_mod, "__doc__"))
+	if (!PyObject_HasAttrString(py_obj, "__doc__"))
 		goto err;
 
-	if (!(py_str = PyObject_GetAttrString(dec->py_mod, "__doc__"))) {
+	if (!(py_str = PyObject_GetAttrString(py_obj, "__doc__"))) {
 		srd_exception_catch("Failed to get docstring");
 		goto err;
 	}
@@ -1159,6 +1869,46 @@ SRD_API int srd_decoder_unload(struct srd_decoder *dec)
 	return SRD_OK;
 }
 
+/*
+ * Load the decoders which the MANIFEST of a decoder bundle lists. See
+ * tools/install-decoders for how bundles get created. Returns SRD_OK if
+ * the zip archive is a bundle. Must be called with the GIL held.
+ */
+static int srd_decoder_load_all_bundle(const char *zip_path,
+		PyObject *zipimporter)
+{
+	PyObject *manifest;
+	char **lines, **line, *module_name;
+
+	manifest = PyObject_CallMethod(zipimporter, "get_data", "s", "MANIFEST");
+	if (!manifest || !PyBytes_Check(manifest)) {
+		PyErr_Clear();
+		Py_XDECREF(manifest);
+		return SRD_ERR;
+	}
+
+	srd_dbg("Loading decoder bundle %s.", zip_path);
+
+	if (!bundle_modules)
+		bundle_modules = g_hash_table_new_full(g_str_hash, g_str_equal,
+				g_free, NULL);
+
+	lines = g_strsplit(PyBytes_AsString(manifest), "\n", 0);
+	Py_DECREF(manifest);
+
+	for (line = lines; *line; line++) {
+		module_name = g_strstrip(*line);
+		if (!*module_name || *module_name == '#')
+			continue;
+		g_hash_table_insert(bundle_modules,
+			g_build_filename(zip_path, module_name, NULL), NULL);
+		srd_decoder_load(module_name);
+	}
+	g_strfreev(lines);
+
+	return SRD_OK;
+}
+
 static void srd_decoder_load_all_zip_path(char *zip_path)
 {
 	PyObject *zipimport_mod, *zipimporter_class, *zipimporter;
@@ -1184,6 +1934,10 @@ static void srd_decoder_load_all_zip_path(char *zip_path)
 	if (zipimporter == NULL)
 		goto err_out;
 
+	/* Bundles need not be scanned, other zip archives do. */
+	if (srd_decoder_load_all_bundle(zip_path, zipimporter) == SRD_OK)
+		goto err_out;
+
 	prefix_obj = PyObject_GetAttrString(zipimporter, "prefix");
 	if (prefix_obj == NULL)
 		goto err_out;
@@ -1276,13 +2030,24 @@ static void srd_decoder_load_all_path(char *path)
 SRD_API int srd_decoder_load_all(void)
 {
 	GSList *l;
+	struct srd_startup_mark mark;
+	PyGILState_STATE gstate;
 
 	if (!srd_check_init())
 		return SRD_ERR;
 
+	srd_startup_begin(&mark);
+
 	for (l = searchpaths; l; l = l->next)
 		srd_decoder_load_all_path(l->data);
 
+	/* Have the metadata of newly imported decoders written out. */
+	gstate = PyGILState_Ensure();
+	index_save();
+	PyGILState_Release(gstate);
+
+	srd_startup_end(&mark, SRD_STARTUP_LOAD_ALL, NULL);
+
 	return SRD_OK;
 }
 
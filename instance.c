@@ -352,10 +352,15 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 		return NULL;
 	}
 
+	/* Decoders which were loaded from the index get imported now. */
+	if (srd_decoder_import(dec) != SRD_OK)
+		return NULL;
+
 	di = g_malloc0(sizeof(struct srd_decoder_inst));
 
 	di->decoder = dec;
 	di->sess = sess;
+	di->pd_output_index = g_ptr_array_new();
 
 	if (options) {
 		inst_id = g_hash_table_lookup(options, "id");
@@ -403,24 +408,39 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 					decoder_id);
 		PyGILState_Release(gstate);
 		g_free(di->dec_channelmap);
+		g_ptr_array_free(di->pd_output_index, TRUE);
 		g_free(di);
 		return NULL;
 	}
+	srd_Decoder_inst_set(di->py_inst, di);
+	di->hooks = srd_decoder_hooks_find(di->py_inst);
 
 	PyGILState_Release(gstate);
 
 	if (options && srd_inst_option_set(di, options) != SRD_OK) {
+		gstate = PyGILState_Ensure();
+		srd_Decoder_inst_set(di->py_inst, NULL);
+		Py_DECREF(di->py_inst);
+		PyGILState_Release(gstate);
 		g_free(di->dec_channelmap);
+		g_ptr_array_free(di->pd_output_index, TRUE);
 		g_free(di);
 		return NULL;
 	}
 
-	di->condition_list = NULL;
+	di->cond_list = g_array_new(FALSE, TRUE, sizeof(struct srd_condition));
+	di->term_list = g_array_new(FALSE, TRUE, sizeof(struct srd_term));
+	di->cond_cache = g_malloc0(sizeof(struct srd_cond_cache));
 	di->match_array = NULL;
 	di->abs_start_samplenum = 0;
 	di->abs_end_samplenum = 0;
 	di->inbuf = NULL;
 	di->inbuflen = 0;
+	di->inbuf_run_ends = NULL;
+	di->inbuf_num_runs = 0;
+	di->chunk_queue = NULL;
+	di->ann_batch = NULL;
+	di->stack_queue = NULL;
 	di->abs_cur_samplenum = 0;
 	di->thread_handle = NULL;
 	di->got_new_samples = FALSE;
@@ -482,6 +502,39 @@ static void srd_inst_join_decode_thread(struct srd_decoder_inst *di)
 	g_mutex_init(&di->data_mutex);
 }
 
+/* Drop pending annotations, keep the batch's storage for re-use. */
+static void annotation_batch_clear(struct srd_decoder_inst *di)
+{
+	struct srd_ann_batch *batch;
+
+	batch = di->ann_batch;
+	if (!batch)
+		return;
+
+	g_array_set_size(batch->pdata, 0);
+	g_array_set_size(batch->pda, 0);
+	g_array_set_size(batch->text_start, 0);
+	g_ptr_array_set_size(batch->texts, 0);
+	g_string_chunk_clear(batch->strings);
+}
+
+static void annotation_batch_free(struct srd_decoder_inst *di)
+{
+	struct srd_ann_batch *batch;
+
+	batch = di->ann_batch;
+	if (!batch)
+		return;
+
+	g_array_free(batch->pdata, TRUE);
+	g_array_free(batch->pda, TRUE);
+	g_array_free(batch->text_start, TRUE);
+	g_ptr_array_free(batch->texts, TRUE);
+	g_string_chunk_free(batch->strings);
+	g_free(batch);
+	di->ann_batch = NULL;
+}
+
 static void srd_inst_reset_state(struct srd_decoder_inst *di)
 {
 	if (!di)
@@ -491,12 +544,22 @@ static void srd_inst_reset_state(struct srd_decoder_inst *di)
 
 	/* Reset internal state of the decoder. */
 	condition_list_free(di);
+	condition_cache_free(di);
 	match_array_free(di);
 	di->abs_start_samplenum = 0;
 	di->abs_end_samplenum = 0;
 	di->inbuf = NULL;
 	di->inbuflen = 0;
+	di->inbuf_run_ends = NULL;
+	di->inbuf_num_runs = 0;
+	if (di->chunk_queue) {
+		di->chunk_queue->first = 0;
+		di->chunk_queue->count = 0;
+	}
+	annotation_batch_clear(di);
 	di->abs_cur_samplenum = 0;
+	memset(&di->stats, 0, sizeof(di->stats));
+	di->stats_python_start = 0;
 	oldpins_array_free(di);
 	di->got_new_samples = FALSE;
 	di->handled_all_samples = FALSE;
@@ -678,6 +741,322 @@ SRD_API int srd_inst_initial_pins_set_all(struct srd_decoder_inst *di, GArray *i
 	return SRD_OK;
 }
 
+/**
+ * Get the counters of a decoder instance.
+ *
+ * The counters accumulate over the lifetime of the instance, and are
+ * reset when the instance gets reset (e.g. by srd_session_terminate_reset()).
+ * They are updated without locking, so values read while the session
+ * is decoding may be slightly out of date.
+ *
+ * @param di Decoder instance to use. Must not be NULL.
+ * @param stats Pointer to a struct which receives the counters.
+ *              Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_inst_stats_get(const struct srd_decoder_inst *di,
+		struct srd_inst_stats *stats)
+{
+	if (!di || !stats)
+		return SRD_ERR_ARG;
+
+	*stats = di->stats;
+	stats->samples_per_wait = 0;
+	if (stats->wait_calls)
+		stats->samples_per_wait = (double)stats->samples_scanned /
+			stats->wait_calls;
+
+	return SRD_OK;
+}
+
+/*
+ * Worker thread of a stacked decoder instance in pipelined mode. Feeds
+ * queued items to the instance's decode() method, and runs flush
+ * requests in the order in which they were queued.
+ */
+static gpointer stack_worker(gpointer data)
+{
+	struct srd_decoder_inst *di;
+	struct srd_stack_queue *queue;
+	struct srd_stack_item item;
+	PyObject *py_res;
+	PyGILState_STATE gstate;
+	uint64_t start;
+
+	di = data;
+	queue = di->stack_queue;
+
+	gstate = PyGILState_Ensure();
+	srd_profile_thread_begin(di);
+	srd_profile_state_set(SRD_PROF_BLOCKED);
+	PyGILState_Release(gstate);
+
+	g_mutex_lock(&queue->mutex);
+	while (TRUE) {
+		while (!queue->count && !queue->terminate)
+			g_cond_wait(&queue->got_item_cond, &queue->mutex);
+		if (queue->terminate)
+			break;
+		item = queue->slots[queue->first];
+		g_mutex_unlock(&queue->mutex);
+
+		if (item.py_data) {
+			gstate = PyGILState_Ensure();
+			srd_profile_state_set(SRD_PROF_PYTHON);
+			start = srd_time_ns();
+			py_res = PyObject_CallMethod(di->py_inst, "decode",
+				"KKO", item.start_sample, item.end_sample,
+				item.py_data);
+			di->stats.python_ns += srd_time_ns() - start;
+			srd_profile_state_set(SRD_PROF_BLOCKED);
+			if (!py_res) {
+				srd_exception_catch("Calling %s decode() failed",
+							di->inst_id);
+			}
+			Py_XDECREF(py_res);
+			Py_DECREF(item.py_data);
+			PyGILState_Release(gstate);
+		} else {
+			srd_inst_flush(di);
+		}
+
+		g_mutex_lock(&queue->mutex);
+		queue->first = (queue->first + 1) % queue->num_slots;
+		queue->count--;
+		g_cond_broadcast(&queue->took_item_cond);
+	}
+	g_mutex_unlock(&queue->mutex);
+
+	gstate = PyGILState_Ensure();
+	srd_profile_thread_end();
+	PyGILState_Release(gstate);
+
+	return NULL;
+}
+
+/* Have a stacked decoder instance run on a worker thread of its own. */
+static void stack_queue_start(struct srd_decoder_inst *di,
+		unsigned int num_slots)
+{
+	struct srd_stack_queue *queue;
+
+	if (di->stack_queue || !num_slots)
+		return;
+
+	srd_dbg("%s: Creating stack worker thread, %u queue slots.",
+		di->inst_id, num_slots);
+
+	queue = g_malloc0(sizeof(*queue));
+	queue->num_slots = num_slots;
+	queue->slots = g_new0(struct srd_stack_item, num_slots);
+	g_mutex_init(&queue->mutex);
+	g_cond_init(&queue->got_item_cond);
+	g_cond_init(&queue->took_item_cond);
+	di->stack_queue = queue;
+	queue->thread = g_thread_new(di->inst_id, stack_worker, di);
+}
+
+/*
+ * Terminate a stacked decoder instance's worker thread, and drop the
+ * items which were not handled yet. Must be called without holding
+ * the Python GIL, the worker might need it to finish its current item.
+ */
+static void stack_queue_stop(struct srd_decoder_inst *di)
+{
+	struct srd_stack_queue *queue;
+	PyGILState_STATE gstate;
+	unsigned int i;
+
+	queue = di->stack_queue;
+	if (!queue)
+		return;
+
+	srd_dbg("%s: Joining stack worker thread.", di->inst_id);
+
+	g_mutex_lock(&queue->mutex);
+	queue->terminate = TRUE;
+	g_cond_broadcast(&queue->got_item_cond);
+	g_cond_broadcast(&queue->took_item_cond);
+	g_mutex_unlock(&queue->mutex);
+	(void)g_thread_join(queue->thread);
+
+	gstate = PyGILState_Ensure();
+	for (i = 0; i < queue->count; i++)
+		Py_XDECREF(queue->slots[(queue->first + i) % queue->num_slots].py_data);
+	PyGILState_Release(gstate);
+
+	g_cond_clear(&queue->took_item_cond);
+	g_cond_clear(&queue->got_item_cond);
+	g_mutex_clear(&queue->mutex);
+	g_free(queue->slots);
+	g_free(queue);
+	di->stack_queue = NULL;
+}
+
+/* Stop the worker threads of all instances stacked on top of this one. */
+static void stack_queue_stop_all(struct srd_decoder_inst *di)
+{
+	GSList *l;
+
+	for (l = di->next_di; l; l = l->next) {
+		stack_queue_stop(l->data);
+		stack_queue_stop_all(l->data);
+	}
+}
+
+/*
+ * Wait until the instances stacked on top of this one have handled all
+ * of their queued input, lower stack levels first.
+ */
+static void stack_queue_drain_all(struct srd_decoder_inst *di)
+{
+	struct srd_decoder_inst *next_di;
+	struct srd_stack_queue *queue;
+	PyGILState_STATE gstate;
+	GSList *l;
+
+	for (l = di->next_di; l; l = l->next) {
+		next_di = l->data;
+		queue = next_di->stack_queue;
+		if (queue) {
+			/* The worker might need the GIL to make progress. */
+			gstate = PyGILState_Ensure();
+			Py_BEGIN_ALLOW_THREADS
+			g_mutex_lock(&queue->mutex);
+			while (queue->count && !queue->terminate)
+				g_cond_wait(&queue->took_item_cond, &queue->mutex);
+			g_mutex_unlock(&queue->mutex);
+			Py_END_ALLOW_THREADS
+			PyGILState_Release(gstate);
+		}
+		stack_queue_drain_all(next_di);
+	}
+}
+
+/*
+ * Copy a lower decoder's output for a stack queue. Decoders can modify
+ * the lists (and dicts) which they passed to put() after the call
+ * returned, while the item still waits in the queue. Builtin containers
+ * get copied (also nested ones, up to a sane depth), other objects are
+ * shared.
+ */
+static PyObject *stack_data_copy(PyObject *py_obj, int depth)
+{
+	PyObject *py_copy, *py_key, *py_value, *py_item;
+	Py_ssize_t i, size, pos;
+	gboolean is_list;
+	int ret;
+
+	is_list = PyList_CheckExact(py_obj);
+	if (depth >= 16 || (!is_list && !PyTuple_CheckExact(py_obj)
+			&& !PyDict_CheckExact(py_obj))) {
+		Py_INCREF(py_obj);
+		return py_obj;
+	}
+
+	if (PyDict_CheckExact(py_obj)) {
+		if (!(py_copy = PyDict_New()))
+			return NULL;
+		pos = 0;
+		while (PyDict_Next(py_obj, &pos, &py_key, &py_value)) {
+			if (!(py_item = stack_data_copy(py_value, depth + 1))) {
+				Py_DECREF(py_copy);
+				return NULL;
+			}
+			ret = PyDict_SetItem(py_copy, py_key, py_item);
+			Py_DECREF(py_item);
+			if (ret < 0) {
+				Py_DECREF(py_copy);
+				return NULL;
+			}
+		}
+		return py_copy;
+	}
+
+	size = is_list ? PyList_Size(py_obj) : PyTuple_Size(py_obj);
+	py_copy = is_list ? PyList_New(size) : PyTuple_New(size);
+	if (!py_copy)
+		return NULL;
+	for (i = 0; i < size; i++) {
+		py_item = is_list ? PyList_GetItem(py_obj, i) : PyTuple_GetItem(py_obj, i);
+		if (!(py_item = stack_data_copy(py_item, depth + 1))) {
+			Py_DECREF(py_copy);
+			return NULL;
+		}
+		/* Steals the reference to the item. */
+		if (is_list)
+			PyList_SetItem(py_copy, i, py_item);
+		else
+			PyTuple_SetItem(py_copy, i, py_item);
+	}
+
+	return py_copy;
+}
+
+/**
+ * Queue an item of input for a stacked decoder instance which runs on
+ * a worker thread of its own.
+ *
+ * Waits while the instance's queue is full.
+ *
+ * @param di The stacked decoder instance. Must not be NULL, and must
+ *           have a stack queue.
+ * @param start_sample The start sample of the lower decoder's output.
+ * @param end_sample The end sample of the lower decoder's output.
+ * @param py_data The lower decoder's output, or NULL to have the
+ *                instance flushed when it gets to this item. Lists,
+ *                tuples and dicts get copied, see stack_data_copy().
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_stack_push(struct srd_decoder_inst *di,
+		uint64_t start_sample, uint64_t end_sample, PyObject *py_data)
+{
+	struct srd_stack_queue *queue;
+	struct srd_stack_item *item;
+	PyObject *py_copy;
+	gboolean dropped;
+	PyGILState_STATE gstate;
+
+	queue = di->stack_queue;
+
+	gstate = PyGILState_Ensure();
+	if (py_data) {
+		py_copy = stack_data_copy(py_data, 0);
+		if (!py_copy) {
+			srd_exception_catch("Failed to copy the input of %s",
+				di->inst_id);
+			Py_INCREF(py_data);
+			py_copy = py_data;
+		}
+		py_data = py_copy;
+	}
+
+	/* Let other stack levels run while waiting for a free slot. */
+	Py_BEGIN_ALLOW_THREADS
+	g_mutex_lock(&queue->mutex);
+	while (queue->count == queue->num_slots && !queue->terminate)
+		g_cond_wait(&queue->took_item_cond, &queue->mutex);
+	dropped = queue->terminate;
+	if (!dropped) {
+		item = &queue->slots[(queue->first + queue->count) % queue->num_slots];
+		item->start_sample = start_sample;
+		item->end_sample = end_sample;
+		item->py_data = py_data;
+		queue->count++;
+		g_cond_signal(&queue->got_item_cond);
+	}
+	g_mutex_unlock(&queue->mutex);
+	Py_END_ALLOW_THREADS
+
+	if (dropped)
+		Py_XDECREF(py_data);
+	PyGILState_Release(gstate);
+}
+
 /** @private */
 SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di)
 {
@@ -713,6 +1092,7 @@ SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di)
 	/* Start all the PDs stacked on top of this one. */
 	for (l = di->next_di; l; l = l->next) {
 		next_di = l->data;
+		stack_queue_start(next_di, di->sess->stack_queue_size);
 		if ((ret = srd_inst_start(next_di)) != SRD_OK)
 			return ret;
 	}
@@ -779,50 +1159,326 @@ static inline gboolean sample_matches(uint8_t old_sample, uint8_t sample, struct
 	return FALSE;
 }
 
-/** @private */
+/**
+ * Mark the match array as empty.
+ *
+ * The array's storage is kept, and gets re-used by the next find_match()
+ * invocation.
+ *
+ * @private
+ */
 SRD_PRIV void match_array_free(struct srd_decoder_inst *di)
 {
 	if (!di || !di->match_array)
 		return;
 
-	g_array_free(di->match_array, TRUE);
-	di->match_array = NULL;
+	g_array_set_size(di->match_array, 0);
 }
 
-/** @private */
+static void term_list_release(GArray *term_list)
+{
+	struct srd_term *term;
+	unsigned int i;
+	PyGILState_STATE gstate;
+
+	gstate = PyGILState_Ensure();
+	for (i = 0; i < term_list->len; i++) {
+		term = &g_array_index(term_list, struct srd_term, i);
+		Py_XDECREF(term->py_key);
+		Py_XDECREF(term->py_value);
+	}
+	PyGILState_Release(gstate);
+
+	g_array_set_size(term_list, 0);
+}
+
+/**
+ * Empty the condition list and its term list.
+ *
+ * The arrays' storage is kept for the next condition list. References to
+ * Python objects which terms were created from get released.
+ *
+ * @private
+ */
 SRD_PRIV void condition_list_free(struct srd_decoder_inst *di)
 {
-	GSList *l, *ll;
+	if (!di || !di->term_list)
+		return;
+
+	term_list_release(di->term_list);
+	g_array_set_size(di->cond_list, 0);
+
+	if (di->cond_program)
+		di->cond_program->valid = FALSE;
+}
+
+static void cond_program_destroy(struct srd_cond_program *prog)
+{
+	if (!prog)
+		return;
+
+	g_free(prog->never);
+	g_free(prog->skip_term);
+	g_free(prog->masks);
+	g_free(prog->watch);
+	g_free(prog);
+}
 
+static void cond_program_free(struct srd_decoder_inst *di)
+{
 	if (!di)
 		return;
 
-	for (l = di->condition_list; l; l = l->next) {
-		ll = l->data;
-		if (ll)
-			g_slist_free_full(ll, g_free);
+	cond_program_destroy(di->cond_program);
+	di->cond_program = NULL;
+}
+
+/** @private */
+SRD_PRIV void condition_cache_entry_free(struct srd_cond_cache_entry *entry)
+{
+	if (!entry)
+		return;
+
+	term_list_release(entry->term_list);
+	g_array_free(entry->term_list, TRUE);
+	g_array_free(entry->condition_list, TRUE);
+	cond_program_destroy(entry->cond_program);
+	g_free(entry);
+}
+
+/**
+ * Drop all previously used condition lists of an instance.
+ *
+ * @private
+ */
+SRD_PRIV void condition_cache_free(struct srd_decoder_inst *di)
+{
+	if (!di || !di->cond_cache)
+		return;
+
+	g_slist_free_full(di->cond_cache->entries,
+		(GDestroyNotify)condition_cache_entry_free);
+	di->cond_cache->entries = NULL;
+	di->cond_cache->num_entries = 0;
+	di->cond_cache->have_hash = FALSE;
+}
+
+/*
+ * Translate the condition list to bitmasks (see struct srd_cond_program).
+ * Only lists which exclusively consist of level and edge terms for
+ * channels which are mapped to input data, or of single SKIP terms, get
+ * compiled. Lists which contain other terms (like 'skip' combined with
+ * channel terms in one condition) are left to the generic code path.
+ */
+static gboolean cond_program_compile(struct srd_decoder_inst *di)
+{
+	struct srd_cond_program *prog;
+	const struct srd_condition *cond;
+	struct srd_term *term;
+	unsigned int num_conditions, c, t;
+	int unitsize, i, ch, byte_offset;
+	uint8_t bit, *lvl_mask, *lvl_val, *edge_mask, *noedge_mask, word[8];
+	gboolean use_level, level;
+
+	if (!di->cond_program)
+		di->cond_program = g_malloc0(sizeof(*di->cond_program));
+	prog = di->cond_program;
+
+	unitsize = di->data_unitsize;
+	num_conditions = di->cond_list->len;
+	prog->valid = TRUE;
+	prog->usable = FALSE;
+	prog->unitsize = unitsize;
+	prog->num_conditions = num_conditions;
+	if (unitsize <= 0 || !di->dec_channelmap)
+		return FALSE;
+
+	if (num_conditions > prog->alloc_conditions || unitsize > prog->alloc_unitsize) {
+		prog->alloc_conditions = MAX(num_conditions, prog->alloc_conditions);
+		prog->alloc_unitsize = MAX(unitsize, prog->alloc_unitsize);
+		g_free(prog->never);
+		g_free(prog->skip_term);
+		g_free(prog->masks);
+		g_free(prog->watch);
+		prog->never = g_malloc(prog->alloc_conditions * sizeof(gboolean));
+		prog->skip_term = g_malloc(prog->alloc_conditions * sizeof(struct srd_term *));
+		prog->masks = g_malloc(prog->alloc_conditions * 4 * prog->alloc_unitsize);
+		prog->watch = g_malloc(prog->alloc_unitsize);
+	}
+	memset(prog->never, 0, num_conditions * sizeof(gboolean));
+	memset(prog->skip_term, 0, num_conditions * sizeof(struct srd_term *));
+	memset(prog->masks, 0, num_conditions * 4 * unitsize);
+	memset(prog->watch, 0, unitsize);
+
+	for (c = 0; c < num_conditions; c++) {
+		cond = &g_array_index(di->cond_list, struct srd_condition, c);
+		lvl_mask = &prog->masks[(4 * c + 0) * unitsize];
+		lvl_val = &prog->masks[(4 * c + 1) * unitsize];
+		edge_mask = &prog->masks[(4 * c + 2) * unitsize];
+		noedge_mask = &prog->masks[(4 * c + 3) * unitsize];
+
+		/* Empty conditions never match (see find_match()). */
+		if (!cond->num_terms) {
+			prog->never[c] = TRUE;
+			continue;
+		}
+
+		/* Single SKIP terms get resolved from their counters. */
+		term = &g_array_index(di->term_list, struct srd_term, cond->first_term);
+		if (term->type == SRD_TERM_SKIP && cond->num_terms == 1) {
+			prog->skip_term[c] = term;
+			continue;
+		}
+
+		for (t = 0; t < cond->num_terms; t++, term++) {
+			if (term->type == SRD_TERM_ALWAYS_FALSE) {
+				prog->never[c] = TRUE;
+				continue;
+			}
+			if (term->type < SRD_TERM_HIGH || term->type > SRD_TERM_NO_EDGE)
+				return FALSE;
+			ch = di->dec_channelmap[term->channel];
+			if (ch < 0 || ch / 8 >= unitsize)
+				return FALSE;
+			byte_offset = ch / 8;
+			bit = 1 << (ch % 8);
+
+			use_level = TRUE;
+			level = FALSE;
+			switch (term->type) {
+			case SRD_TERM_HIGH:
+				level = TRUE;
+				break;
+			case SRD_TERM_LOW:
+				break;
+			case SRD_TERM_RISING_EDGE:
+				edge_mask[byte_offset] |= bit;
+				level = TRUE;
+				break;
+			case SRD_TERM_FALLING_EDGE:
+				edge_mask[byte_offset] |= bit;
+				break;
+			case SRD_TERM_EITHER_EDGE:
+				edge_mask[byte_offset] |= bit;
+				use_level = FALSE;
+				break;
+			case SRD_TERM_NO_EDGE:
+				noedge_mask[byte_offset] |= bit;
+				use_level = FALSE;
+				break;
+			}
+
+			/* Contradicting terms (channels may share an input bit). */
+			if (use_level && (lvl_mask[byte_offset] & bit) &&
+					!!(lvl_val[byte_offset] & bit) != level)
+				prog->never[c] = TRUE;
+			if (edge_mask[byte_offset] & noedge_mask[byte_offset])
+				prog->never[c] = TRUE;
+			if (use_level) {
+				lvl_mask[byte_offset] |= bit;
+				if (level)
+					lvl_val[byte_offset] |= bit;
+			}
+		}
+
+		if (prog->never[c])
+			continue;
+		for (i = 0; i < unitsize; i++)
+			prog->watch[i] |= lvl_mask[i] | edge_mask[i] | noedge_mask[i];
+	}
+
+	prog->have_watch = FALSE;
+	for (i = 0; i < unitsize; i++)
+		prog->have_watch |= prog->watch[i] != 0;
+
+	prog->watch_word = 0;
+	if (8 % unitsize == 0) {
+		for (i = 0; i < 8; i++)
+			word[i] = prog->watch[i % unitsize];
+		memcpy(&prog->watch_word, word, sizeof(word));
 	}
 
-	g_slist_free(di->condition_list);
-	di->condition_list = NULL;
+	prog->usable = TRUE;
+
+	return TRUE;
+}
+
+static gboolean cond_program_prepare(struct srd_decoder_inst *di)
+{
+	struct srd_cond_program *prog;
+
+	prog = di->cond_program;
+	if (prog && prog->valid && prog->unitsize == di->data_unitsize)
+		return prog->usable;
+
+	return cond_program_compile(di);
 }
 
 static gboolean have_non_null_conds(const struct srd_decoder_inst *di)
 {
-	GSList *l, *cond;
+	unsigned int i;
 
 	if (!di)
 		return FALSE;
 
-	for (l = di->condition_list; l; l = l->next) {
-		cond = l->data;
-		if (cond)
+	for (i = 0; i < di->cond_list->len; i++) {
+		if (g_array_index(di->cond_list, struct srd_condition, i).num_terms)
 			return TRUE;
 	}
 
 	return FALSE;
 }
 
+/* Index of the run which holds the (chunk relative) sample 'pos'. */
+static uint64_t inst_run_index(const struct srd_decoder_inst *di, uint64_t pos)
+{
+	uint64_t lo, hi, mid;
+
+	lo = 0;
+	hi = di->inbuf_num_runs;
+	while (lo < hi) {
+		mid = lo + (hi - lo) / 2;
+		if (di->inbuf_run_ends[mid] <= pos)
+			lo = mid + 1;
+		else
+			hi = mid;
+	}
+
+	return lo;
+}
+
+/* The (chunk relative) sample number where a run starts. */
+static inline uint64_t inst_run_start(const struct srd_decoder_inst *di,
+		uint64_t run)
+{
+	return run ? di->inbuf_run_ends[run - 1] : 0;
+}
+
+/**
+ * Get the data of a sample in the current chunk.
+ *
+ * Covers both plain and run-length encoded chunks.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param samplenum The absolute sample number, which must be within
+ *                  the current chunk.
+ *
+ * @return A pointer to the sample's data (unitsize bytes).
+ *
+ * @private
+ */
+SRD_PRIV const uint8_t *srd_inst_sample_pos(const struct srd_decoder_inst *di,
+		uint64_t samplenum)
+{
+	uint64_t pos;
+
+	pos = samplenum - di->abs_start_samplenum;
+	if (di->inbuf_run_ends)
+		pos = inst_run_index(di, pos);
+
+	return di->inbuf + pos * di->data_unitsize;
+}
+
 static void update_old_pins_array(struct srd_decoder_inst *di,
 		const uint8_t *sample_pos)
 {
@@ -852,7 +1508,7 @@ static void update_old_pins_array_initial_pins(struct srd_decoder_inst *di)
 	if (!di || !di->dec_channelmap)
 		return;
 
-	sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+	sample_pos = srd_inst_sample_pos(di, di->abs_cur_samplenum);
 
 	oldpins_array_seed(di);
 	for (i = 0; i < di->dec_num_channels; i++) {
@@ -888,15 +1544,15 @@ static gboolean term_matches(const struct srd_decoder_inst *di,
 }
 
 static gboolean all_terms_match(const struct srd_decoder_inst *di,
-		const GSList *cond, const uint8_t *sample_pos)
+		const struct srd_condition *cond, const uint8_t *sample_pos)
 {
-	const GSList *l;
 	struct srd_term *term;
+	unsigned int i;
 
 	/* Caller ensures di, cond, sample_pos != NULL. */
 
-	for (l = cond; l; l = l->next) {
-		term = l->data;
+	term = &g_array_index(di->term_list, struct srd_term, cond->first_term);
+	for (i = 0; i < cond->num_terms; i++, term++) {
 		if (term->type == SRD_TERM_ALWAYS_FALSE)
 			return FALSE;
 		if (!term_matches(di, term, sample_pos))
@@ -921,19 +1577,323 @@ static gboolean at_least_one_condition_matched(
 	return FALSE;
 }
 
-static gboolean find_match(struct srd_decoder_inst *di)
+__attribute__((always_inline))
+static inline gboolean cond_program_matches(const struct srd_cond_program *prog,
+		unsigned int cond, const uint8_t *sample_pos, const uint8_t *prev_pos)
 {
-	uint64_t i, j, num_samples_to_process;
-	GSList *l, *cond;
-	const uint8_t *sample_pos;
-	unsigned int num_conditions;
+	const uint8_t *lvl_mask, *lvl_val, *edge_mask, *noedge_mask;
+	uint8_t diff;
+	int i, unitsize;
 
-	/* Caller ensures di != NULL. */
+	if (prog->never[cond])
+		return FALSE;
 
-	/* Check whether the condition list is NULL/empty. */
-	if (!di->condition_list) {
-		srd_dbg("NULL/empty condition list, automatic match.");
-		return TRUE;
+	unitsize = prog->unitsize;
+	lvl_mask = &prog->masks[(4 * cond + 0) * unitsize];
+	lvl_val = &prog->masks[(4 * cond + 1) * unitsize];
+	edge_mask = &prog->masks[(4 * cond + 2) * unitsize];
+	noedge_mask = &prog->masks[(4 * cond + 3) * unitsize];
+	for (i = 0; i < unitsize; i++) {
+		diff = sample_pos[i] ^ prev_pos[i];
+		if ((sample_pos[i] ^ lvl_val[i]) & lvl_mask[i])
+			return FALSE;
+		if ((diff & edge_mask[i]) != edge_mask[i])
+			return FALSE;
+		if (diff & noedge_mask[i])
+			return FALSE;
+	}
+
+	return TRUE;
+}
+
+/*
+ * Find the first sample in the range [from, count) of the buffer, which
+ * differs from its predecessor in any of the bits that are inspected by
+ * the compiled conditions. Returns 'count' if there is no such sample.
+ * Inspects a 64bit word (several samples) per step where the unitsize
+ * allows, and falls back to individual samples otherwise. Caller
+ * ensures 'from' is not 0, i.e. there always is a predecessor.
+ */
+static uint64_t cond_program_next_change(const struct srd_cond_program *prog,
+		const uint8_t *inbuf, uint64_t from, uint64_t count)
+{
+	const uint8_t *sample_pos;
+	uint64_t w0, w1, w2, w3, p0, p1, p2, p3, step;
+	int i, unitsize;
+
+	unitsize = prog->unitsize;
+	if (!prog->have_watch)
+		return count;
+
+	if (prog->watch_word) {
+		step = 8 / unitsize;
+		sample_pos = inbuf + from * unitsize;
+		while (from + 4 * step <= count) {
+			memcpy(&w0, sample_pos, 8);
+			memcpy(&w1, sample_pos + 8, 8);
+			memcpy(&w2, sample_pos + 16, 8);
+			memcpy(&w3, sample_pos + 24, 8);
+			memcpy(&p0, sample_pos - unitsize, 8);
+			memcpy(&p1, sample_pos - unitsize + 8, 8);
+			memcpy(&p2, sample_pos - unitsize + 16, 8);
+			memcpy(&p3, sample_pos - unitsize + 24, 8);
+			if (((w0 ^ p0) | (w1 ^ p1) | (w2 ^ p2) | (w3 ^ p3)) & prog->watch_word)
+				break;
+			from += 4 * step;
+			sample_pos += 32;
+		}
+		while (from + step <= count) {
+			memcpy(&w0, sample_pos, 8);
+			memcpy(&p0, sample_pos - unitsize, 8);
+			if ((w0 ^ p0) & prog->watch_word)
+				break;
+			from += step;
+			sample_pos += 8;
+		}
+	}
+
+	for (; from < count; from++) {
+		sample_pos = inbuf + from * unitsize;
+		for (i = 0; i < unitsize; i++) {
+			if ((sample_pos[i] ^ sample_pos[i - unitsize]) & prog->watch[i])
+				return from;
+		}
+	}
+
+	return count;
+}
+
+/*
+ * Like cond_program_next_change(), but looks up the session's index of
+ * sample changes instead of inspecting every sample. 'offset' is the
+ * chunk relative position of 'inbuf'.
+ */
+static uint64_t change_index_next_change(const struct srd_change_index *idx,
+		const struct srd_cond_program *prog, const uint8_t *inbuf,
+		uint64_t offset, uint64_t from, uint64_t count)
+{
+	const uint64_t *positions;
+	const uint8_t *sample_pos;
+	guint lo, hi, mid;
+	uint64_t pos;
+	int i, unitsize;
+
+	if (!prog->have_watch)
+		return count;
+
+	unitsize = prog->unitsize;
+	positions = (const uint64_t *)idx->positions->data;
+
+	/* Find the first change at or after 'from'. */
+	lo = 0;
+	hi = idx->positions->len;
+	while (lo < hi) {
+		mid = lo + (hi - lo) / 2;
+		if (positions[mid] < offset + from)
+			lo = mid + 1;
+		else
+			hi = mid;
+	}
+
+	/* Find the first change in one of the inspected bits. */
+	for (; lo < idx->positions->len; lo++) {
+		pos = positions[lo] - offset;
+		if (pos >= count)
+			break;
+		sample_pos = inbuf + pos * unitsize;
+		for (i = 0; i < unitsize; i++) {
+			if ((sample_pos[i] ^ sample_pos[i - unitsize]) & prog->watch[i])
+				return pos;
+		}
+	}
+
+	return count;
+}
+
+/*
+ * Like cond_program_next_change(), for run-length encoded chunks. Only
+ * the first sample of a run can differ from its predecessor. 'run' is
+ * the run which holds the current sample, 'offset' is the chunk relative
+ * position which 'from' and 'count' are relative to.
+ */
+static uint64_t cond_program_next_change_rle(const struct srd_cond_program *prog,
+		const struct srd_decoder_inst *di, uint64_t run, uint64_t offset,
+		uint64_t count)
+{
+	const uint8_t *sample_pos;
+	uint64_t pos;
+	int i, unitsize;
+
+	if (!prog->have_watch)
+		return count;
+
+	unitsize = prog->unitsize;
+	for (run++; run < di->inbuf_num_runs; run++) {
+		pos = inst_run_start(di, run) - offset;
+		if (pos >= count)
+			break;
+		sample_pos = di->inbuf + run * unitsize;
+		for (i = 0; i < unitsize; i++) {
+			if ((sample_pos[i] ^ sample_pos[i - unitsize]) & prog->watch[i])
+				return pos;
+		}
+	}
+
+	return count;
+}
+
+/*
+ * Variant of find_match() for compiled condition lists. Semantics are
+ * identical: Conditions get checked sample by sample, and the first
+ * sample where at least one condition matches is reported. A sample
+ * which neither matches nor differs from its predecessor in one of the
+ * inspected bits can't be followed by a match before the next change in
+ * these bits, so all samples up to that change get skipped in bulk.
+ *
+ * SKIP terms count the samples which they get checked against, and
+ * match when the number of samples to skip was reached. Since every
+ * sample gets checked until a match is found, the position where a
+ * SKIP condition will match is known in advance. Scans don't extend
+ * beyond that position, and counters get updated in a single step.
+ *
+ * Run-length encoded chunks only get inspected at the start of runs
+ * (and the sample after that), in addition to the above positions.
+ */
+static gboolean find_match_compiled(struct srd_decoder_inst *di,
+		unsigned int num_conditions)
+{
+	const struct srd_cond_program *prog;
+	const struct srd_change_index *idx;
+	const uint8_t *buf, *sample_pos, *prev_pos;
+	uint64_t i, num_samples_to_process, skip_pos, pos, offset, run;
+	unsigned int j;
+	int unitsize;
+	gboolean found, changed;
+	struct srd_term *term;
+
+	prog = di->cond_program;
+	unitsize = di->data_unitsize;
+	num_samples_to_process = di->abs_end_samplenum - di->abs_cur_samplenum;
+	if (!num_samples_to_process)
+		return FALSE;
+	offset = di->abs_cur_samplenum - di->abs_start_samplenum;
+	buf = NULL;
+	run = 0;
+	if (di->inbuf_run_ends)
+		run = inst_run_index(di, offset);
+	else
+		buf = di->inbuf + (offset * unitsize);
+
+	/* Use the session's index of sample changes when it's available. */
+	idx = NULL;
+	if (di->sess && di->sess->change_index.valid &&
+			di->sess->change_index.inbuf == di->inbuf &&
+			di->sess->change_index.unitsize == (uint64_t)unitsize)
+		idx = &di->sess->change_index;
+
+	/* Determine the (chunk relative) position of the first SKIP match. */
+	skip_pos = UINT64_MAX;
+	for (j = 0; j < num_conditions; j++) {
+		term = prog->skip_term[j];
+		if (!term)
+			continue;
+		pos = term->num_samples_to_skip - term->num_samples_already_skipped;
+		skip_pos = MIN(skip_pos, pos);
+	}
+
+	i = 0;
+	while (i < num_samples_to_process) {
+		if (di->inbuf_run_ends) {
+			while (di->inbuf_run_ends[run] <= offset + i)
+				run++;
+			sample_pos = di->inbuf + run * unitsize;
+			prev_pos = sample_pos;
+			if (inst_run_start(di, run) == offset + i && run)
+				prev_pos -= unitsize;
+		} else {
+			sample_pos = buf + i * unitsize;
+			prev_pos = sample_pos - unitsize;
+		}
+
+		/*
+		 * The first sample compares against the "old" pins (the
+		 * previous chunk, or the initial pin state), which need not
+		 * be available in the input buffer. Use the generic check
+		 * of channel terms for this sample.
+		 */
+		found = FALSE;
+		for (j = 0; j < num_conditions; j++) {
+			term = prog->skip_term[j];
+			if (term) {
+				pos = term->num_samples_to_skip - term->num_samples_already_skipped;
+				di->match_array->data[j] = pos == i;
+			} else if (i == 0) {
+				di->match_array->data[j] = !prog->never[j] &&
+					all_terms_match(di, &g_array_index(di->cond_list,
+						struct srd_condition, j), sample_pos);
+			} else {
+				di->match_array->data[j] = cond_program_matches(prog,
+					j, sample_pos, prev_pos);
+			}
+			found |= di->match_array->data[j];
+		}
+		if (found)
+			break;
+
+		if (i == 0) {
+			i++;
+		} else {
+			changed = FALSE;
+			for (j = 0; j < (unsigned int)unitsize; j++)
+				changed |= (sample_pos[j] ^ prev_pos[j]) & prog->watch[j];
+			if (changed)
+				i++;
+			else if (di->inbuf_run_ends)
+				i = cond_program_next_change_rle(prog, di, run, offset,
+					MIN(num_samples_to_process, skip_pos));
+			else if (idx)
+				i = change_index_next_change(idx, prog, buf, offset,
+					i + 1, MIN(num_samples_to_process, skip_pos));
+			else
+				i = cond_program_next_change(prog, buf, i + 1,
+					MIN(num_samples_to_process, skip_pos));
+		}
+		i = MIN(i, skip_pos);
+	}
+
+	/* Account for all samples that were checked, including the match. */
+	if (!found)
+		i = num_samples_to_process - 1;
+	for (j = 0; j < num_conditions; j++) {
+		term = prog->skip_term[j];
+		if (!term)
+			continue;
+		if (found && di->match_array->data[j])
+			term->num_samples_already_skipped = term->num_samples_to_skip;
+		else
+			term->num_samples_already_skipped += i + 1;
+	}
+
+	update_old_pins_array(di, srd_inst_sample_pos(di, di->abs_cur_samplenum + i));
+	di->abs_cur_samplenum += found ? i : i + 1;
+
+	return found;
+}
+
+static gboolean find_match(struct srd_decoder_inst *di)
+{
+	uint64_t i, j, num_samples_to_process, run, run_end;
+	const struct srd_condition *cond;
+	const uint8_t *sample_pos;
+	unsigned int num_conditions;
+	gboolean skip_runs;
+
+	/* Caller ensures di != NULL. */
+
+	/* Check whether the condition list is NULL/empty. */
+	if (!di->cond_list->len) {
+		srd_dbg("NULL/empty condition list, automatic match.");
+		return TRUE;
 	}
 
 	/* Check whether we have any non-NULL conditions. */
@@ -943,25 +1903,53 @@ static gboolean find_match(struct srd_decoder_inst *di)
 	}
 
 	num_samples_to_process = di->abs_end_samplenum - di->abs_cur_samplenum;
-	num_conditions = g_slist_length(di->condition_list);
+	num_conditions = di->cond_list->len;
 
-	/* di->match_array is NULL here. Create a new GArray. */
-	di->match_array = g_array_sized_new(FALSE, TRUE, sizeof(gboolean), num_conditions);
+	/* Re-use the match array's storage, start with "no match". */
+	if (!di->match_array)
+		di->match_array = g_array_sized_new(FALSE, TRUE, sizeof(gboolean), num_conditions);
 	g_array_set_size(di->match_array, num_conditions);
+	memset(di->match_array->data, 0, num_conditions * sizeof(gboolean));
 
 	/* Sample 0: Set di->old_pins_array for SRD_INITIAL_PIN_SAME_AS_SAMPLE0 pins. */
 	if (di->abs_cur_samplenum == 0)
 		update_old_pins_array_initial_pins(di);
 
+	/* Use bitmask operations when the conditions allow it. */
+	if (cond_program_prepare(di))
+		return find_match_compiled(di, num_conditions);
+
+	/*
+	 * Within runs of identical samples (of run-length encoded chunks),
+	 * results don't change after the second sample of the run, unless
+	 * SKIP terms count the samples.
+	 */
+	run = 0;
+	skip_runs = FALSE;
+	if (di->inbuf_run_ends) {
+		run = inst_run_index(di, di->abs_cur_samplenum - di->abs_start_samplenum);
+		skip_runs = TRUE;
+		for (j = 0; j < di->term_list->len; j++) {
+			if (g_array_index(di->term_list, struct srd_term, j).type == SRD_TERM_SKIP)
+				skip_runs = FALSE;
+		}
+	}
+
 	for (i = 0; i < num_samples_to_process; i++, (di->abs_cur_samplenum)++) {
 
-		sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+		if (di->inbuf_run_ends) {
+			while (di->inbuf_run_ends[run] <= di->abs_cur_samplenum - di->abs_start_samplenum)
+				run++;
+			sample_pos = di->inbuf + run * di->data_unitsize;
+		} else {
+			sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+		}
 
 		/* Check whether the current sample matches at least one of the conditions (logical OR). */
 		/* IMPORTANT: We need to check all conditions, even if there was a match already! */
-		for (l = di->condition_list, j = 0; l; l = l->next, j++) {
-			cond = l->data;
-			if (!cond)
+		for (j = 0; j < num_conditions; j++) {
+			cond = &g_array_index(di->cond_list, struct srd_condition, j);
+			if (!cond->num_terms)
 				continue;
 			/* All terms in 'cond' must match (logical AND). */
 			di->match_array->data[j] = all_terms_match(di, cond, sample_pos);
@@ -972,6 +1960,15 @@ static gboolean find_match(struct srd_decoder_inst *di)
 		/* If at least one condition matched we're done. */
 		if (at_least_one_condition_matched(di, num_conditions))
 			return TRUE;
+
+		/* Continue at the run's last sample. */
+		if (skip_runs && i > 0 && di->abs_cur_samplenum - di->abs_start_samplenum >
+				inst_run_start(di, run)) {
+			run_end = di->abs_start_samplenum + di->inbuf_run_ends[run];
+			run_end = MIN(run_end, di->abs_end_samplenum);
+			i += run_end - 1 - di->abs_cur_samplenum;
+			di->abs_cur_samplenum = run_end - 1;
+		}
 	}
 
 	return FALSE;
@@ -1027,6 +2024,48 @@ SRD_PRIV int process_samples_until_condition_match(struct srd_decoder_inst *di,
 	return SRD_OK;
 }
 
+/**
+ * Look for another match in the currently available samples.
+ *
+ * Like process_samples_until_condition_match(), but does not continue
+ * into the next chunk. When no further match is found, the position and
+ * the previous pin values are left at the most recent match, such that
+ * a subsequent .wait() call resumes from there.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param found_match Will be set to TRUE if at least one condition matched,
+ *                    FALSE otherwise. Must not be NULL.
+ *
+ * @retval SRD_OK No errors occured, see found_match for the result.
+ * @retval SRD_ERR_ARG Invalid arguments.
+ *
+ * @private
+ */
+SRD_PRIV int process_samples_until_next_match(struct srd_decoder_inst *di, gboolean *found_match)
+{
+	uint64_t last_samplenum;
+
+	if (!di || !found_match)
+		return SRD_ERR_ARG;
+
+	*found_match = FALSE;
+	if (di->want_wait_terminate)
+		return SRD_OK;
+
+	last_samplenum = di->abs_cur_samplenum;
+	if (last_samplenum < di->abs_end_samplenum)
+		*found_match = find_match(di);
+	if (*found_match && di->abs_cur_samplenum < di->abs_end_samplenum)
+		return SRD_OK;
+
+	*found_match = FALSE;
+	di->abs_cur_samplenum = last_samplenum;
+	if (last_samplenum < di->abs_end_samplenum)
+		update_old_pins_array(di, srd_inst_sample_pos(di, last_samplenum));
+
+	return SRD_OK;
+}
+
 /**
  * Worker thread (per PD-stack).
  *
@@ -1057,7 +2096,13 @@ static gpointer di_thread(gpointer data)
 	 */
 	Py_INCREF(di->py_inst);
 	srd_dbg("%s: Calling decode().", di->inst_id);
+	srd_profile_thread_begin(di);
+	di->stats_python_start = srd_time_ns();
 	py_res = PyObject_CallMethod(di->py_inst, "decode", NULL);
+	if (di->stats_python_start)
+		di->stats.python_ns += srd_time_ns() - di->stats_python_start;
+	di->stats_python_start = 0;
+	srd_profile_thread_end();
 	srd_dbg("%s: decode() terminated.", di->inst_id);
 
 	/*
@@ -1132,6 +2177,360 @@ static gpointer di_thread(gpointer data)
 	return NULL;
 }
 
+/* Start the worker thread if necessary, before handing it a chunk. */
+static void inst_prepare_chunk(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		uint64_t inbuflen, uint64_t unitsize)
+{
+	srd_dbg("Decoding: abs start sample %" PRIu64 ", abs end sample %"
+		PRIu64 " (%" PRIu64 " samples, %" PRIu64 " bytes, unitsize = "
+		"%" PRIu64 "), instance %s.", abs_start_samplenum, abs_end_samplenum,
+		abs_end_samplenum - abs_start_samplenum, inbuflen, unitsize,
+		di->inst_id);
+
+	/* If this is the first call, start the worker thread. */
+	if (!di->thread_handle) {
+		srd_dbg("No worker thread for this decoder stack "
+			"exists yet, creating one: %s.", di->inst_id);
+		di->thread_handle = g_thread_new(di->inst_id,
+						 di_thread, di);
+	}
+}
+
+static void chunk_queue_free(struct srd_decoder_inst *di)
+{
+	struct srd_chunk_queue *queue;
+	unsigned int i;
+
+	queue = di->chunk_queue;
+	if (!queue)
+		return;
+
+	for (i = 0; i < queue->num_slots; i++)
+		g_free(queue->slots[i].data);
+	g_free(queue->slots);
+	g_free(queue);
+	di->chunk_queue = NULL;
+}
+
+/*
+ * Wait until the worker thread has handled all queued chunks. Returns
+ * an error when the decoder failed, or when it terminated before it
+ * handled all of them, which queued srd_inst_decode() calls could not
+ * report.
+ */
+static int chunk_queue_drain(struct srd_decoder_inst *di)
+{
+	int ret;
+
+	if (!di->chunk_queue)
+		return SRD_OK;
+
+	g_mutex_lock(&di->data_mutex);
+	while (di->chunk_queue->count && !di->want_wait_terminate)
+		g_cond_wait(&di->handled_all_samples_cond, &di->data_mutex);
+	ret = di->decoder_state;
+	if (ret == SRD_OK && di->chunk_queue->count)
+		ret = SRD_ERR_TERM_REQ;
+	g_mutex_unlock(&di->data_mutex);
+
+	return ret;
+}
+
+/* Have the worker thread process the oldest queued chunk. Caller holds the mutex. */
+static void chunk_queue_install(struct srd_decoder_inst *di)
+{
+	const struct srd_chunk *chunk;
+
+	chunk = &di->chunk_queue->slots[di->chunk_queue->first];
+	di->abs_start_samplenum = chunk->abs_start_samplenum;
+	di->abs_end_samplenum = chunk->abs_end_samplenum;
+	di->inbuf = chunk->data;
+	di->inbuflen = chunk->len;
+	di->data_unitsize = chunk->unitsize;
+	di->inbuf_run_ends = NULL;
+	di->inbuf_num_runs = 0;
+	di->got_new_samples = TRUE;
+	di->handled_all_samples = FALSE;
+
+	/* Signal the thread that we have new data. */
+	g_cond_signal(&di->got_new_samples_cond);
+}
+
+/**
+ * Continue with the next queued chunk.
+ *
+ * Gets called by the worker thread (with the data mutex held) when it
+ * has handled all samples of the current chunk. Releases the chunk's
+ * queue slot, and makes the next queued chunk (if any) the current one.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @return TRUE if another chunk is to be processed, FALSE otherwise.
+ *
+ * @private
+ */
+SRD_PRIV gboolean srd_inst_next_chunk(struct srd_decoder_inst *di)
+{
+	struct srd_chunk_queue *queue;
+
+	queue = di->chunk_queue;
+	if (!queue || !queue->count)
+		return FALSE;
+
+	queue->first = (queue->first + 1) % queue->num_slots;
+	queue->count--;
+
+	/* Signal the main thread that there is room for another chunk. */
+	g_cond_signal(&di->handled_all_samples_cond);
+
+	if (!queue->count)
+		return FALSE;
+
+	chunk_queue_install(di);
+
+	return TRUE;
+}
+
+/*
+ * Queue a copy of a chunk of samples for the instance's worker thread.
+ * Only blocks while all of the queue's slots are occupied.
+ */
+static int chunk_queue_push(struct srd_decoder_inst *di,
+		unsigned int num_slots, uint64_t abs_start_samplenum,
+		uint64_t abs_end_samplenum, const uint8_t *inbuf,
+		uint64_t inbuflen, uint64_t unitsize)
+{
+	struct srd_chunk_queue *queue;
+	struct srd_chunk *chunk;
+	uint64_t expected;
+	int ret;
+
+	/* (Re-)allocate the queue when its size changed. */
+	queue = di->chunk_queue;
+	if (queue && queue->num_slots != num_slots) {
+		ret = chunk_queue_drain(di);
+		if (ret != SRD_OK)
+			return ret;
+		chunk_queue_free(di);
+		queue = NULL;
+	}
+	if (!queue) {
+		queue = g_malloc0(sizeof(*queue));
+		queue->num_slots = num_slots;
+		queue->slots = g_malloc0(num_slots * sizeof(queue->slots[0]));
+		g_mutex_lock(&di->data_mutex);
+		di->chunk_queue = queue;
+		g_mutex_unlock(&di->data_mutex);
+	}
+
+	g_mutex_lock(&di->data_mutex);
+
+	/* The chunk must follow the last queued (or processed) one. */
+	expected = di->abs_cur_samplenum;
+	if (queue->count) {
+		chunk = &queue->slots[(queue->first + queue->count - 1) % num_slots];
+		expected = chunk->abs_end_samplenum;
+	}
+	if (abs_start_samplenum != expected) {
+		srd_dbg("Incorrect sample numbers: start=%" PRIu64 ", cur=%"
+			PRIu64 ", end=%" PRIu64 ".", abs_start_samplenum,
+			expected, abs_end_samplenum);
+		g_mutex_unlock(&di->data_mutex);
+		return SRD_ERR_ARG;
+	}
+
+	/* Wait for a free slot. */
+	while (queue->count == num_slots && !di->want_wait_terminate)
+		g_cond_wait(&di->handled_all_samples_cond, &di->data_mutex);
+	if (di->want_wait_terminate) {
+		g_mutex_unlock(&di->data_mutex);
+		return SRD_ERR_TERM_REQ;
+	}
+	chunk = &queue->slots[(queue->first + queue->count) % num_slots];
+
+	g_mutex_unlock(&di->data_mutex);
+
+	/* The worker thread doesn't access free slots, fill in the copy. */
+	if (chunk->alloc < inbuflen) {
+		g_free(chunk->data);
+		chunk->data = g_malloc(inbuflen);
+		chunk->alloc = inbuflen;
+	}
+	memcpy(chunk->data, inbuf, inbuflen);
+	chunk->len = inbuflen;
+	chunk->unitsize = unitsize;
+	chunk->abs_start_samplenum = abs_start_samplenum;
+	chunk->abs_end_samplenum = abs_end_samplenum;
+
+	inst_prepare_chunk(di, abs_start_samplenum, abs_end_samplenum,
+		inbuflen, unitsize);
+
+	g_mutex_lock(&di->data_mutex);
+	queue->count++;
+	if (queue->count == 1)
+		chunk_queue_install(di);
+	g_mutex_unlock(&di->data_mutex);
+
+	return SRD_OK;
+}
+
+/* Hand a (validated) chunk of samples to the instance's worker thread. */
+/* Hand a chunk of samples to the instance's worker thread. */
+static void inst_submit_chunk(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen,
+		const uint64_t *run_ends, uint64_t num_runs, uint64_t unitsize)
+{
+	inst_prepare_chunk(di, abs_start_samplenum, abs_end_samplenum,
+		inbuflen, unitsize);
+	di->data_unitsize = unitsize;
+
+	/* Push the new sample chunk to the worker thread. */
+	g_mutex_lock(&di->data_mutex);
+	di->abs_start_samplenum = abs_start_samplenum;
+	di->abs_end_samplenum = abs_end_samplenum;
+	di->inbuf = inbuf;
+	di->inbuflen = inbuflen;
+	di->inbuf_run_ends = run_ends;
+	di->inbuf_num_runs = num_runs;
+	di->got_new_samples = TRUE;
+	di->handled_all_samples = FALSE;
+
+	/* Signal the thread that we have new data. */
+	g_cond_signal(&di->got_new_samples_cond);
+	g_mutex_unlock(&di->data_mutex);
+}
+
+/* Wait until the worker thread has handled the submitted chunk. */
+static int inst_finish_chunk(struct srd_decoder_inst *di)
+{
+	/* When all samples in this chunk were handled, return. */
+	g_mutex_lock(&di->data_mutex);
+	while (!di->handled_all_samples && !di->want_wait_terminate)
+		g_cond_wait(&di->handled_all_samples_cond, &di->data_mutex);
+	g_mutex_unlock(&di->data_mutex);
+
+	/* Flush all PDs in the stack that can be flushed */
+	srd_inst_flush(di);
+
+	if (di->want_wait_terminate)
+		return SRD_ERR_TERM_REQ;
+
+	return SRD_OK;
+}
+
+static int inst_decode_chunk(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen,
+		const uint64_t *run_ends, uint64_t num_runs, uint64_t unitsize)
+{
+	inst_submit_chunk(di, abs_start_samplenum, abs_end_samplenum,
+		inbuf, inbuflen, run_ends, num_runs, unitsize);
+
+	return inst_finish_chunk(di);
+}
+
+/* Check the caller provided description of a chunk of samples. */
+static int inst_check_chunk(const struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	/* Return an error upon unusable input. */
+	if (!di) {
+		srd_dbg("empty decoder instance");
+		return SRD_ERR_ARG;
+	}
+	if (!inbuf) {
+		srd_dbg("NULL buffer pointer");
+		return SRD_ERR_ARG;
+	}
+	if (inbuflen == 0) {
+		srd_dbg("empty buffer");
+		return SRD_ERR_ARG;
+	}
+	if (unitsize == 0) {
+		srd_dbg("unitsize 0");
+		return SRD_ERR_ARG;
+	}
+
+	if (abs_end_samplenum < abs_start_samplenum) {
+		srd_dbg("Incorrect sample numbers: start=%" PRIu64
+			", end=%" PRIu64 ".", abs_start_samplenum,
+			abs_end_samplenum);
+		return SRD_ERR_ARG;
+	}
+
+	return SRD_OK;
+}
+
+/**
+ * Start decoding a chunk of samples, without waiting for the decoder.
+ *
+ * Hands the chunk to the instance's worker thread. Callers must follow
+ * up with srd_inst_decode_end() when this routine succeeded, and must
+ * keep the chunk's memory unchanged until then. See srd_inst_decode()
+ * for the requirements on the sample numbers.
+ *
+ * @param di The decoder instance to call. Must not be NULL.
+ * @param abs_start_samplenum The absolute starting sample number for the
+ *              buffer's sample set, relative to the start of capture.
+ * @param abs_end_samplenum The absolute ending sample number for the
+ *              buffer's sample set, relative to the start of capture.
+ * @param inbuf The buffer to decode. Must not be NULL.
+ * @param inbuflen Length of the buffer. Must be > 0.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_decode_begin(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	int ret;
+
+	ret = inst_check_chunk(di, abs_start_samplenum, abs_end_samplenum,
+		inbuf, inbuflen, unitsize);
+	if (ret != SRD_OK)
+		return ret;
+
+	ret = chunk_queue_drain(di);
+	if (ret != SRD_OK)
+		return ret;
+
+	if (abs_start_samplenum != di->abs_cur_samplenum) {
+		srd_dbg("Incorrect sample numbers: start=%" PRIu64 ", cur=%"
+			PRIu64 ", end=%" PRIu64 ".", abs_start_samplenum,
+			di->abs_cur_samplenum, abs_end_samplenum);
+		return SRD_ERR_ARG;
+	}
+
+	inst_submit_chunk(di, abs_start_samplenum, abs_end_samplenum,
+		inbuf, inbuflen, NULL, 0, unitsize);
+
+	return SRD_OK;
+}
+
+/**
+ * Wait until a decoder instance has handled the chunk which was passed
+ * to srd_inst_decode_begin(), and flush the instance's stack.
+ *
+ * @param di The decoder instance to call. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_decode_end(struct srd_decoder_inst *di)
+{
+	if (!di)
+		return SRD_ERR_ARG;
+
+	return inst_finish_chunk(di);
+}
+
 /**
  * Decode a chunk of samples.
  *
@@ -1186,76 +2585,169 @@ SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
 {
+	int ret;
+
 	/* Return an error upon unusable input. */
-	if (!di) {
-		srd_dbg("empty decoder instance");
-		return SRD_ERR_ARG;
-	}
-	if (!inbuf) {
-		srd_dbg("NULL buffer pointer");
-		return SRD_ERR_ARG;
-	}
-	if (inbuflen == 0) {
-		srd_dbg("empty buffer");
-		return SRD_ERR_ARG;
-	}
-	if (unitsize == 0) {
-		srd_dbg("unitsize 0");
+	ret = inst_check_chunk(di, abs_start_samplenum, abs_end_samplenum,
+		inbuf, inbuflen, unitsize);
+	if (ret != SRD_OK)
+		return ret;
+
+	/* Queue the chunk when the session asks for it. */
+	if (di->sess && di->sess->send_queue_size)
+		return chunk_queue_push(di, di->sess->send_queue_size,
+			abs_start_samplenum, abs_end_samplenum, inbuf, inbuflen,
+			unitsize);
+
+	ret = srd_inst_decode_begin(di, abs_start_samplenum,
+		abs_end_samplenum, inbuf, inbuflen, unitsize);
+	if (ret != SRD_OK)
+		return ret;
+
+	return srd_inst_decode_end(di);
+}
+
+/**
+ * Decode a chunk of run-length encoded samples.
+ *
+ * Like srd_inst_decode(), but the chunk consists of runs of identical
+ * samples. 'inbuf' holds one sample per run, 'run_ends' holds the end
+ * of each run as a sample number relative to 'abs_start_samplenum'.
+ * The last run ends at 'abs_end_samplenum'.
+ *
+ * @param di The decoder instance to call. Must not be NULL.
+ * @param abs_start_samplenum The absolute starting sample number for the
+ * 		chunk's sample set, relative to the start of capture.
+ * @param abs_end_samplenum The absolute ending sample number for the
+ * 		chunk's sample set, relative to the start of capture.
+ * @param inbuf The runs' sample values. Must not be NULL.
+ * @param run_ends The (chunk relative) end of each run, in ascending
+ * 		order. Must not be NULL.
+ * @param num_runs The number of runs. Must be > 0.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_decode_rle(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, const uint64_t *run_ends, uint64_t num_runs,
+		uint64_t unitsize)
+{
+	int ret;
+
+	/* Return an error upon unusable input. */
+	if (!di || !inbuf || !run_ends || !num_runs || !unitsize)
 		return SRD_ERR_ARG;
-	}
+
+	/* Queued chunks (if any) come first. */
+	ret = chunk_queue_drain(di);
+	if (ret != SRD_OK)
+		return ret;
 
 	if (abs_start_samplenum != di->abs_cur_samplenum ||
-	    abs_end_samplenum < abs_start_samplenum) {
+	    abs_end_samplenum - abs_start_samplenum != run_ends[num_runs - 1]) {
 		srd_dbg("Incorrect sample numbers: start=%" PRIu64 ", cur=%"
 			PRIu64 ", end=%" PRIu64 ".", abs_start_samplenum,
 			di->abs_cur_samplenum, abs_end_samplenum);
 		return SRD_ERR_ARG;
 	}
 
-	di->data_unitsize = unitsize;
+	return inst_decode_chunk(di, abs_start_samplenum, abs_end_samplenum,
+		inbuf, num_runs * unitsize, run_ends, num_runs, unitsize);
+}
 
-	srd_dbg("Decoding: abs start sample %" PRIu64 ", abs end sample %"
-		PRIu64 " (%" PRIu64 " samples, %" PRIu64 " bytes, unitsize = "
-		"%d), instance %s.", abs_start_samplenum, abs_end_samplenum,
-		abs_end_samplenum - abs_start_samplenum, inbuflen, di->data_unitsize,
-		di->inst_id);
 
-	/* If this is the first call, start the worker thread. */
-	if (!di->thread_handle) {
-		srd_dbg("No worker thread for this decoder stack "
-			"exists yet, creating one: %s.", di->inst_id);
-		di->thread_handle = g_thread_new(di->inst_id,
-						 di_thread, di);
-	}
+/**
+ * Get a decoder instance's collection of pending annotations.
+ *
+ * The collection gets created upon first use.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @return The instance's annotation batch.
+ *
+ * @private
+ */
+SRD_PRIV struct srd_ann_batch *annotation_batch_get(struct srd_decoder_inst *di)
+{
+	struct srd_ann_batch *batch;
 
-	/* Push the new sample chunk to the worker thread. */
-	g_mutex_lock(&di->data_mutex);
-	di->abs_start_samplenum = abs_start_samplenum;
-	di->abs_end_samplenum = abs_end_samplenum;
-	di->inbuf = inbuf;
-	di->inbuflen = inbuflen;
-	di->got_new_samples = TRUE;
-	di->handled_all_samples = FALSE;
+	if (di->ann_batch)
+		return di->ann_batch;
 
-	/* Signal the thread that we have new data. */
-	g_cond_signal(&di->got_new_samples_cond);
-	g_mutex_unlock(&di->data_mutex);
+	batch = g_malloc0(sizeof(*batch));
+	batch->pdata = g_array_new(FALSE, FALSE, sizeof(struct srd_proto_data));
+	batch->pda = g_array_new(FALSE, FALSE,
+		sizeof(struct srd_proto_data_annotation));
+	batch->text_start = g_array_new(FALSE, FALSE, sizeof(guint));
+	batch->texts = g_ptr_array_new();
+	batch->strings = g_string_chunk_new(4096);
+	di->ann_batch = batch;
 
-	/* When all samples in this chunk were handled, return. */
-	g_mutex_lock(&di->data_mutex);
-	while (!di->handled_all_samples && !di->want_wait_terminate)
-		g_cond_wait(&di->handled_all_samples_cond, &di->data_mutex);
-	g_mutex_unlock(&di->data_mutex);
+	return batch;
+}
 
-	/* Flush all PDs in the stack that can be flushed */
-	srd_inst_flush(di);
+/**
+ * Pass a decoder instance's pending annotations to the frontend.
+ *
+ * Batch callbacks receive all records at once, other callbacks get
+ * called for each of the records.
+ * Must be called from the context which puts annotations (or while
+ * that context is idle), and without holding the Python GIL.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void annotation_batch_flush(struct srd_decoder_inst *di)
+{
+	struct srd_ann_batch *batch;
+	GPtrArray *cbs;
+	struct srd_pd_callback *cb;
+	struct srd_proto_data *pdata;
+	struct srd_proto_data_annotation *pda;
+	guint c, i, start;
+
+	batch = di->ann_batch;
+	if (!batch || !batch->pdata->len)
+		return;
 
-	if (di->want_wait_terminate)
-		return SRD_ERR_TERM_REQ;
+	/*
+	 * The arrays may have moved while annotations were added, have
+	 * the records reference their texts and annotation details now.
+	 */
+	cbs = srd_pd_output_callbacks_find(di->sess, SRD_OUTPUT_ANN);
+	if (!cbs) {
+		annotation_batch_clear(di);
+		return;
+	}
 
-	return SRD_OK;
-}
+	for (i = 0; i < batch->pdata->len; i++) {
+		pdata = &g_array_index(batch->pdata, struct srd_proto_data, i);
+		pda = &g_array_index(batch->pda, struct srd_proto_data_annotation, i);
+		start = g_array_index(batch->text_start, guint, i);
+		pda->ann_text = (char **)&batch->texts->pdata[start];
+		pdata->data = pda;
+	}
+	g_mutex_lock(&di->sess->callback_mutex);
+	for (c = 0; c < cbs->len; c++) {
+		cb = g_ptr_array_index(cbs, c);
+		if (cb->batch_cb) {
+			cb->batch_cb((struct srd_proto_data *)batch->pdata->data,
+				batch->pdata->len, cb->cb_data);
+			continue;
+		}
+		for (i = 0; i < batch->pdata->len; i++) {
+			pdata = &g_array_index(batch->pdata, struct srd_proto_data, i);
+			cb->cb(pdata, cb->cb_data);
+		}
+	}
+	g_mutex_unlock(&di->sess->callback_mutex);
 
+	annotation_batch_clear(di);
+}
 
 /**
  * Flush all data that is pending, bottom decoder first up to the top of the stack.
@@ -1276,13 +2768,25 @@ SRD_PRIV int srd_inst_flush(struct srd_decoder_inst *di)
 	if (!di)
 		return SRD_ERR_ARG;
 
-	gstate = PyGILState_Ensure();
-	if (PyObject_HasAttrString(di->py_inst, "flush")) {
+	/*
+	 * Stacked instances which run on a worker thread of their own
+	 * get flushed after they have handled their queued input.
+	 */
+	if (di->stack_queue && g_thread_self() != di->stack_queue->thread) {
+		srd_inst_stack_push(di, 0, 0, NULL);
+		return SRD_OK;
+	}
+
+	if (di->hooks & SRD_HOOK_FLUSH) {
+		gstate = PyGILState_Ensure();
 		srd_dbg("Calling flush() of instance %s", di->inst_id);
 		py_ret = PyObject_CallMethod(di->py_inst, "flush", NULL);
 		Py_XDECREF(py_ret);
+		PyGILState_Release(gstate);
 	}
-	PyGILState_Release(gstate);
+
+	/* Deliver annotations which were collected for the batch callback. */
+	annotation_batch_flush(di);
 
 	/* Pass the "flush" request to all stacked decoders. */
 	for (l = di->next_di; l; l = l->next) {
@@ -1306,7 +2810,7 @@ SRD_PRIV int srd_inst_flush(struct srd_decoder_inst *di)
 SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di)
 {
 	GSList *l;
-	int ret;
+	int ret, queue_ret;
 
 	if (!di)
 		return SRD_ERR_ARG;
@@ -1322,10 +2826,18 @@ SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di)
 		return SRD_OK;
 	}
 
+	/*
+	 * Have queued chunks handled first. Still communicate EOF when
+	 * the decoder failed on one of them, but report the failure.
+	 */
+	queue_ret = chunk_queue_drain(di);
+
 	/* Signal the thread about the EOF condition. */
 	g_mutex_lock(&di->data_mutex);
 	di->inbuf = NULL;
 	di->inbuflen = 0;
+	di->inbuf_run_ends = NULL;
+	di->inbuf_num_runs = 0;
 	di->got_new_samples = TRUE;
 	di->handled_all_samples = FALSE;
 	di->want_wait_terminate = TRUE;
@@ -1342,6 +2854,9 @@ SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di)
 	/* Flush the decoder instance which handled EOF. */
 	srd_inst_flush(di);
 
+	/* Have pipelined stack levels handle all of their input. */
+	stack_queue_drain_all(di);
+
 	/* Pass EOF to all stacked decoders. */
 	for (l = di->next_di; l; l = l->next) {
 		ret = srd_inst_send_eof(l->data);
@@ -1349,7 +2864,7 @@ SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di)
 			return ret;
 	}
 
-	return SRD_OK;
+	return queue_ret;
 }
 
 /**
@@ -1389,6 +2904,7 @@ SRD_PRIV int srd_inst_terminate_reset(struct srd_decoder_inst *di)
 	 */
 	srd_dbg("Terminating instance %s", di->inst_id);
 	srd_inst_join_decode_thread(di);
+	stack_queue_stop(di);
 	srd_inst_reset_state(di);
 
 	/*
@@ -1398,13 +2914,13 @@ SRD_PRIV int srd_inst_terminate_reset(struct srd_decoder_inst *di)
 	 * that was allocated in previous calls gets released by Python
 	 * as it's not referenced any longer.
 	 */
-	gstate = PyGILState_Ensure();
-	if (PyObject_HasAttrString(di->py_inst, "reset")) {
+	if (di->hooks & SRD_HOOK_RESET) {
+		gstate = PyGILState_Ensure();
 		srd_dbg("Calling reset() of instance %s", di->inst_id);
 		py_ret = PyObject_CallMethod(di->py_inst, "reset", NULL);
 		Py_XDECREF(py_ret);
+		PyGILState_Release(gstate);
 	}
-	PyGILState_Release(gstate);
 
 	/* Pass the "restart" request to all stacked decoders. */
 	for (l = di->next_di; l; l = l->next) {
@@ -1426,16 +2942,27 @@ SRD_PRIV void srd_inst_free(struct srd_decoder_inst *di)
 	srd_dbg("Freeing instance %s.", di->inst_id);
 
 	srd_inst_join_decode_thread(di);
+	stack_queue_stop(di);
+	stack_queue_stop_all(di);
 
 	srd_inst_reset_state(di);
 
 	gstate = PyGILState_Ensure();
+	srd_Decoder_inst_set(di->py_inst, NULL);
 	Py_DECREF(di->py_inst);
 	PyGILState_Release(gstate);
 
 	g_free(di->inst_id);
 	g_free(di->dec_channelmap);
 	g_free(di->channel_samples);
+	g_array_free(di->cond_list, TRUE);
+	g_array_free(di->term_list, TRUE);
+	if (di->match_array)
+		g_array_free(di->match_array, TRUE);
+	cond_program_free(di);
+	g_free(di->cond_cache);
+	chunk_queue_free(di);
+	annotation_batch_free(di);
 	g_slist_free(di->next_di);
 	for (l = di->pd_output; l; l = l->next) {
 		pdo = l->data;
@@ -1443,6 +2970,7 @@ SRD_PRIV void srd_inst_free(struct srd_decoder_inst *di)
 		g_free(pdo);
 	}
 	g_slist_free(di->pd_output);
+	g_ptr_array_free(di->pd_output_index, TRUE);
 	g_free(di);
 }
 
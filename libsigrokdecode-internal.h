@@ -26,6 +26,7 @@
 
 #include <Python.h> /* First, so we avoid a _POSIX_C_SOURCE warning. */
 #include "libsigrokdecode.h"
+#include <time.h>
 
 /*
  * Static definition of tables ending with an all-zero sentinel entry
@@ -38,6 +39,18 @@
 #  define ALL_ZERO { 0 }
 #endif
 
+/* Number of SRD_OUTPUT_* types. */
+#define NUM_OUTPUT_TYPES (SRD_OUTPUT_META + 1)
+
+/* Optional methods of a decoder, resolved when it gets loaded/instantiated. */
+enum {
+	SRD_HOOK_START    = 1 << 0,
+	SRD_HOOK_DECODE   = 1 << 1,
+	SRD_HOOK_RESET    = 1 << 2,
+	SRD_HOOK_FLUSH    = 1 << 3,
+	SRD_HOOK_METADATA = 1 << 4,
+};
+
 enum {
 	SRD_TERM_ALWAYS_FALSE,
 	SRD_TERM_HIGH,
@@ -54,6 +67,159 @@ struct srd_term {
 	int channel;
 	uint64_t num_samples_to_skip;
 	uint64_t num_samples_already_skipped;
+	/* The dict item which the term was created from (if any). */
+	PyObject *py_key;
+	PyObject *py_value;
+};
+
+/* A condition's terms are a range in the instance's term list. */
+struct srd_condition {
+	unsigned int first_term;
+	unsigned int num_terms;
+};
+
+/*
+ * Compiled form of a decoder instance's condition list. Each condition
+ * gets translated to bitmasks which cover the unitsize bytes of an input
+ * sample, which allows to check all of its terms at once, and to skip
+ * runs of samples which don't change in any of the inspected bits.
+ * Conditions which consist of a single SKIP term are resolved from the
+ * term's counters, without inspecting samples.
+ */
+struct srd_cond_program {
+	/* Program reflects the current condition list. */
+	gboolean valid;
+	/* Condition list could get compiled (channel terms, or skip). */
+	gboolean usable;
+	int unitsize;
+	unsigned int num_conditions;
+	unsigned int alloc_conditions;
+	int alloc_unitsize;
+	/* Per condition: The condition can never match. */
+	gboolean *never;
+	/* Per condition: The condition's only term is a SKIP term. */
+	struct srd_term **skip_term;
+	/*
+	 * Per condition: Level mask, level value, edge mask, and no-edge
+	 * mask, each of them unitsize bytes long.
+	 */
+	uint8_t *masks;
+	/* All bits which are inspected by any of the conditions. */
+	uint8_t *watch;
+	gboolean have_watch;
+	/* The 'watch' mask repeated to 64 bits (unitsize 1, 2, 4, 8). */
+	uint64_t watch_word;
+};
+
+/* A previously used condition list, with its compiled form. */
+struct srd_cond_cache_entry {
+	uint64_t hash;
+	GArray *condition_list;
+	GArray *term_list;
+	struct srd_cond_program *cond_program;
+};
+
+/*
+ * Recently used condition lists of a decoder instance, which get
+ * re-activated when .wait() gets called with the same conditions.
+ */
+struct srd_cond_cache {
+	/* Content hash of the conditions of the instance's current list. */
+	uint64_t hash;
+	gboolean have_hash;
+	/* Most recently used entries first. */
+	GSList *entries;
+	unsigned int num_entries;
+};
+
+/*
+ * Positions of the samples in a chunk of input data which differ from
+ * their predecessor, in ascending order (chunk relative sample numbers).
+ * Gets built once per srd_session_send() call when several decoder
+ * instances inspect the same chunk, and is shared by all of them.
+ */
+struct srd_change_index {
+	/* Index reflects the chunk which currently gets decoded. */
+	gboolean valid;
+	const uint8_t *inbuf;
+	uint64_t unitsize;
+	GArray *positions;
+};
+
+/* A chunk of samples which got queued for a decoder instance. */
+struct srd_chunk {
+	uint64_t abs_start_samplenum;
+	uint64_t abs_end_samplenum;
+	uint8_t *data;
+	uint64_t len;
+	uint64_t alloc;
+	uint64_t unitsize;
+};
+
+/*
+ * Bounded ring of chunks which were passed to a decoder instance but
+ * were not yet handled completely. The oldest chunk is the one which
+ * the instance currently processes. Slots (and their buffers) get
+ * re-used.
+ */
+struct srd_chunk_queue {
+	unsigned int num_slots;
+	unsigned int first;
+	unsigned int count;
+	struct srd_chunk *slots;
+};
+
+/* An item of input for a stacked decoder instance. */
+struct srd_stack_item {
+	uint64_t start_sample;
+	uint64_t end_sample;
+	/* The lower decoder's output, or NULL to request a flush. */
+	PyObject *py_data;
+};
+
+/*
+ * Bounded queue of input items for a stacked decoder instance, which
+ * runs on a worker thread of its own (pipelined stack execution).
+ */
+struct srd_stack_queue {
+	unsigned int num_slots;
+	unsigned int first;
+	/* Number of items, including the one which currently gets handled. */
+	unsigned int count;
+	struct srd_stack_item *slots;
+	gboolean terminate;
+	GThread *thread;
+	GMutex mutex;
+	GCond got_item_cond;
+	GCond took_item_cond;
+};
+
+/*
+ * Annotations of a decoder instance which were not yet delivered to the
+ * frontend's callback. Texts are interned by the decoder, or live in a
+ * string arena. The arrays get re-used after each delivery.
+ */
+struct srd_ann_batch {
+	/* Per annotation: sample range and output. */
+	GArray *pdata;
+	/* Per annotation: class, text list gets assigned upon delivery. */
+	GArray *pda;
+	/* Per annotation: index of the first text in 'texts'. */
+	GArray *text_start;
+	/* Text lists of all annotations, each terminated by NULL. */
+	GPtrArray *texts;
+	GStringChunk *strings;
+};
+
+/*
+ * Annotation texts which a decoder has submitted, converted to C strings
+ * once and kept until the decoder gets unloaded.
+ */
+struct srd_string_table {
+	/* Python dict, maps a text to its index in 'strings'. */
+	PyObject *py_index;
+	GPtrArray *strings;
+	GStringChunk *chunk;
 };
 
 /* Custom Python types: */
@@ -76,24 +242,157 @@ struct srd_session {
 
 	/* List of frontend callbacks to receive decoder output. */
 	GSList *callbacks;
+
+	/* The callbacks per output type, in the order of registration. */
+	GPtrArray *output_callbacks[NUM_OUTPUT_TYPES];
+
+	/* Sample changes in the chunk which currently gets decoded. */
+	struct srd_change_index change_index;
+
+	/* Number of chunks which can be queued per instance (0: none). */
+	unsigned int send_queue_size;
+
+	/* Number of items which can be queued per stacked instance (0: none). */
+	unsigned int stack_queue_size;
+
+	/* Instances which work on the chunk of the current send call. */
+	GPtrArray *send_pending;
+
+	/*
+	 * Serializes the invocation of frontend callbacks. Never lock it
+	 * while holding the Python GIL: Release the GIL first, and take it
+	 * again after the mutex was locked, where needed. Otherwise threads
+	 * which take both in the opposite order deadlock.
+	 */
+	GMutex callback_mutex;
+
+	/* Sampling profiler, see srd_session_profile_set() (NULL: none). */
+	struct srd_profile *profile;
+};
+
+/* What a thread which runs decoders does, as seen by the profiler. */
+enum {
+	SRD_PROF_PYTHON,   /* Runs Python code (or holds the GIL). */
+	SRD_PROF_SCAN,     /* Checks samples against wait() conditions. */
+	SRD_PROF_BLOCKED,  /* Waits for input (or wait() overhead), not accounted. */
+};
+
+/*
+ * Sampling profiler of a session. Threads which run decoders measure
+ * the time which they spend per stack of decoder instances and state,
+ * when the instance or the state changes. The sampler thread
+ * periodically inspects their Python stacks, the samples split the
+ * measured time across Python functions. The sampler thread's control
+ * and the measured times are protected by the mutex, which must not
+ * be locked while waiting for the GIL.
+ */
+struct srd_profile {
+	GThread *thread;
+	GMutex mutex;
+	GCond cond;
+	gboolean terminate;
+	unsigned int interval_us;
+
+	/* Threads which run decoders (struct srd_prof_thread), GIL. */
+	GPtrArray *threads;
+
+	/*
+	 * Maps a stack of instance IDs (plus ";[scan]" for the SCAN state)
+	 * to the time spent in it (struct srd_prof_stack).
+	 */
+	GHashTable *stacks;
+};
+
+/* Time spent in a stack of instances, and the samples taken in there. */
+struct srd_prof_stack {
+	uint64_t time_ns;
+	/* Maps a collapsed Python stack to its number of samples (uint64_t). */
+	GHashTable *samples;
+	uint64_t num_samples;
+};
+
+/* Decoder instance which got called at a Python stack depth. */
+struct srd_prof_level {
+	struct srd_decoder_inst *di;
+	unsigned int depth;
+	/* IDs of the instances up to this level, separated by ';'. */
+	char *key;
+	/* The level's entries in the profile, per state (looked up once). */
+	struct srd_prof_stack *stacks[SRD_PROF_BLOCKED];
+};
+
+/* A thread which runs decoders, registered with the profiler. */
+struct srd_prof_thread {
+	struct srd_profile *profile;
+	unsigned long thread_id;
+	/* Active instances, from the bottom of the stack up. */
+	GArray *levels;
+	gint state;
+	/* When the current level or state was entered (srd_time_ns()). */
+	uint64_t since;
+};
+
+/* Start of a timed startup phase, see srd_startup_profile_get(). */
+struct srd_startup_mark {
+	gboolean active;
+	gint64 start;
+	int64_t py_blocks;
 };
 
+/* Monotonic timestamp in nanoseconds, for the instance counters. */
+static inline uint64_t srd_time_ns(void)
+{
+#ifdef CLOCK_MONOTONIC
+	struct timespec ts;
+
+	if (clock_gettime(CLOCK_MONOTONIC, &ts) == 0)
+		return (uint64_t)ts.tv_sec * 1000000000 + ts.tv_nsec;
+#endif
+	return (uint64_t)g_get_monotonic_time() * 1000;
+}
+
 /* srd.c */
 SRD_PRIV int srd_decoder_searchpath_add(const char *path);
+SRD_PRIV void srd_startup_begin(struct srd_startup_mark *mark);
+SRD_PRIV void srd_startup_end(const struct srd_startup_mark *mark,
+		int phase, const char *name);
 
 /* session.c */
-SRD_PRIV struct srd_pd_callback *srd_pd_output_callback_find(struct srd_session *sess,
+SRD_PRIV GPtrArray *srd_pd_output_callbacks_find(struct srd_session *sess,
 		int output_type);
+SRD_PRIV void srd_profile_thread_begin(struct srd_decoder_inst *di);
+SRD_PRIV void srd_profile_thread_end(void);
+SRD_PRIV gboolean srd_profile_push(struct srd_decoder_inst *di);
+SRD_PRIV void srd_profile_pop(void);
+SRD_PRIV void srd_profile_state_set(int state);
 
 /* instance.c */
 SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di);
 SRD_PRIV void match_array_free(struct srd_decoder_inst *di);
 SRD_PRIV void condition_list_free(struct srd_decoder_inst *di);
+SRD_PRIV void condition_cache_entry_free(struct srd_cond_cache_entry *entry);
+SRD_PRIV void condition_cache_free(struct srd_decoder_inst *di);
 SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+SRD_PRIV int srd_inst_decode_begin(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+SRD_PRIV int srd_inst_decode_end(struct srd_decoder_inst *di);
+SRD_PRIV int srd_inst_decode_rle(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, const uint64_t *run_ends, uint64_t num_runs,
+		uint64_t unitsize);
+SRD_PRIV gboolean srd_inst_next_chunk(struct srd_decoder_inst *di);
+SRD_PRIV const uint8_t *srd_inst_sample_pos(const struct srd_decoder_inst *di,
+		uint64_t samplenum);
 SRD_PRIV int process_samples_until_condition_match(struct srd_decoder_inst *di, gboolean *found_match);
+SRD_PRIV int process_samples_until_next_match(struct srd_decoder_inst *di, gboolean *found_match);
 SRD_PRIV int srd_inst_flush(struct srd_decoder_inst *di);
+SRD_PRIV void srd_inst_stack_push(struct srd_decoder_inst *di,
+		uint64_t start_sample, uint64_t end_sample, PyObject *py_data);
+SRD_PRIV struct srd_ann_batch *annotation_batch_get(struct srd_decoder_inst *di);
+SRD_PRIV void annotation_batch_flush(struct srd_decoder_inst *di);
 SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di);
 SRD_PRIV int srd_inst_terminate_reset(struct srd_decoder_inst *di);
 SRD_PRIV void srd_inst_free(struct srd_decoder_inst *di);
@@ -119,9 +418,16 @@ SRD_PRIV int srd_log(int loglevel, const char *format, ...) G_GNUC_PRINTF(2, 3);
 
 /* decoder.c */
 SRD_PRIV long srd_decoder_apiver(const struct srd_decoder *d);
+SRD_PRIV unsigned int srd_decoder_hooks_find(PyObject *py_obj);
+SRD_PRIV int srd_decoder_import(struct srd_decoder *d);
+SRD_PRIV void srd_decoder_index_free(void);
+SRD_PRIV const char *srd_decoder_string_intern(struct srd_decoder *dec,
+		PyObject *py_str);
 
 /* type_decoder.c */
 SRD_PRIV PyObject *srd_Decoder_type_new(void);
+SRD_PRIV void srd_Decoder_inst_set(PyObject *py_inst,
+		struct srd_decoder_inst *di);
 SRD_PRIV const char *output_type_name(unsigned int idx);
 
 /* type_logic.c */
@@ -141,6 +141,16 @@ enum srd_configkey {
 	SRD_CONF_SAMPLERATE = 10000,
 };
 
+/** Phases of the startup which get timed, see srd_startup_profile_get(). */
+enum srd_startup_phase {
+	SRD_STARTUP_PYTHON_INIT,      /**< Python interpreter initialization. */
+	SRD_STARTUP_SEARCHPATHS,      /**< Setup of the decoder search paths. */
+	SRD_STARTUP_LOAD_ALL,         /**< All of srd_decoder_load_all(). */
+	SRD_STARTUP_DECODER_INDEX,    /**< Lookup of a decoder in the index. */
+	SRD_STARTUP_DECODER_IMPORT,   /**< Import of a decoder's module. */
+	SRD_STARTUP_DECODER_METADATA, /**< Conversion of a decoder's metadata. */
+};
+
 struct srd_decoder {
 	/** The decoder ID. Must be non-NULL and unique for all decoders. */
 	char *id;
@@ -206,6 +216,21 @@ struct srd_decoder {
 
 	/** sigrokdecode.Decoder class. */
 	void *py_dec;
+
+	/** Interned annotation texts. */
+	struct srd_string_table *ann_strings;
+
+	/** Items of the 'annotations' list, indexed by class. */
+	GPtrArray *annotation_index;
+
+	/** Items of the 'binary' list, indexed by class. */
+	GPtrArray *binary_index;
+
+	/** Items of the 'logic_output_channels' list, indexed by group. */
+	GPtrArray *logic_output_index;
+
+	/** Methods which the Decoder class implements (SRD_HOOK_* flags). */
+	unsigned int hooks;
 };
 
 enum srd_initial_pin {
@@ -247,6 +272,29 @@ struct srd_decoder_logic_output_channel {
 	char *desc;
 };
 
+/** Counters of a decoder instance, see srd_inst_stats_get(). */
+struct srd_inst_stats {
+	/** Number of wait() and wait_many() calls. */
+	uint64_t wait_calls;
+	/** Number of samples which the condition checks advanced over. */
+	uint64_t samples_scanned;
+	/** Number of matches which wait() and wait_many() calls returned. */
+	uint64_t matches;
+	/** Average number of samples scanned per wait() call. */
+	double samples_per_wait;
+	/** Number of put() calls, indexed by output type (SRD_OUTPUT_*). */
+	uint64_t put_calls[SRD_OUTPUT_META + 1];
+	/** Nanoseconds spent checking samples against conditions (in C). */
+	uint64_t scan_ns;
+	/**
+	 * Nanoseconds spent in the decoder's Python code. This includes the
+	 * put() calls, and decoders stacked on top which run synchronously.
+	 */
+	uint64_t python_ns;
+	/** Nanoseconds spent waiting for the data mutex and new samples. */
+	uint64_t blocked_ns;
+};
+
 struct srd_decoder_inst {
 	struct srd_decoder *decoder;
 	struct srd_session *sess;
@@ -259,7 +307,7 @@ struct srd_decoder_inst {
 	uint8_t *channel_samples;
 	GSList *next_di;
 
-	/** List of conditions a PD wants to wait for. */
+	/** Unused, the conditions are kept in 'cond_list'. */
 	GSList *condition_list;
 
 	/** Array of booleans denoting which conditions matched. */
@@ -304,6 +352,48 @@ struct srd_decoder_inst {
 	GCond got_new_samples_cond;
 	GCond handled_all_samples_cond;
 	GMutex data_mutex;
+
+	/** Items of the 'pd_output' list, indexed by output ID. */
+	GPtrArray *pd_output_index;
+
+	/** Methods which the Python instance implements (SRD_HOOK_* flags). */
+	unsigned int hooks;
+
+	/** Conditions a PD wants to wait for (struct srd_condition). */
+	GArray *cond_list;
+
+	/** Terms of all conditions in the list (struct srd_term). */
+	GArray *term_list;
+
+	/** Compiled (bitmask) form of the condition list. */
+	struct srd_cond_program *cond_program;
+
+	/** Recently used condition lists. */
+	struct srd_cond_cache *cond_cache;
+
+	/**
+	 * End (chunk relative sample number) of each run, when the chunk
+	 * is run-length encoded. The buffer then holds one sample per run.
+	 */
+	const uint64_t *inbuf_run_ends;
+
+	/** Number of runs in a run-length encoded chunk. */
+	uint64_t inbuf_num_runs;
+
+	/** Chunks which were queued for the worker thread. */
+	struct srd_chunk_queue *chunk_queue;
+
+	/** Input of a stacked instance which runs on its own thread. */
+	struct srd_stack_queue *stack_queue;
+
+	/** Annotations which are pending for delivery to callbacks. */
+	struct srd_ann_batch *ann_batch;
+
+	/** Counters, see srd_inst_stats_get(). */
+	struct srd_inst_stats stats;
+
+	/** Time (srd_time_ns()) at which Python code started running. */
+	uint64_t stats_python_start;
 };
 
 struct srd_pd_output {
@@ -325,7 +415,7 @@ struct srd_proto_data {
 };
 struct srd_proto_data_annotation {
 	int ann_class; /* Index into "struct srd_decoder"->annotations. */
-	char **ann_text;
+	char **ann_text; /* Owned by the library, texts can be interned. */
 };
 struct srd_proto_data_binary {
 	int bin_class; /* Index into "struct srd_decoder"->binary. */
@@ -340,17 +430,34 @@ struct srd_proto_data_logic {
 
 typedef void (*srd_pd_output_callback)(struct srd_proto_data *pdata,
 					void *cb_data);
+typedef void (*srd_pd_output_batch_callback)(struct srd_proto_data *pdata,
+					unsigned int num_pdata, void *cb_data);
 
 struct srd_pd_callback {
 	int output_type;
 	srd_pd_output_callback cb;
 	void *cb_data;
+	srd_pd_output_batch_callback batch_cb;
+};
+
+/** A timed phase of the startup, see srd_startup_profile_get(). */
+struct srd_startup_record {
+	/** The phase (enum srd_startup_phase). */
+	int phase;
+	/** The decoder's module name for decoder phases, NULL otherwise. */
+	char *name;
+	/** Duration in microseconds. */
+	uint64_t duration;
+	/** Change of the number of memory blocks which Python allocated. */
+	int64_t py_blocks;
 };
 
 /* srd.c */
 SRD_API int srd_init(const char *path);
 SRD_API int srd_exit(void);
 SRD_API GSList *srd_searchpaths_get(void);
+SRD_API int srd_startup_profile_set(gboolean enable);
+SRD_API const GSList *srd_startup_profile_get(void);
 
 /* session.c */
 SRD_API int srd_session_new(struct srd_session **sess);
@@ -360,11 +467,27 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 SRD_API int srd_session_send(struct srd_session *sess,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+SRD_API int srd_session_send_rle(struct srd_session *sess,
+		uint64_t abs_start_samplenum, const uint8_t *values,
+		const uint64_t *run_lengths, uint64_t num_runs, uint64_t unitsize);
+SRD_API int srd_session_send_file(struct srd_session *sess,
+		const char *filename, uint64_t abs_start_samplenum,
+		uint64_t unitsize, uint64_t window_size);
+SRD_API int srd_session_send_queue_set(struct srd_session *sess,
+		unsigned int num_chunks);
+SRD_API int srd_session_stack_queue_set(struct srd_session *sess,
+		unsigned int num_items);
+SRD_API int srd_session_profile_set(struct srd_session *sess,
+		unsigned int interval_us);
+SRD_API char *srd_session_profile_get(struct srd_session *sess);
 SRD_API int srd_session_send_eof(struct srd_session *sess);
 SRD_API int srd_session_terminate_reset(struct srd_session *sess);
 SRD_API int srd_session_destroy(struct srd_session *sess);
 SRD_API int srd_pd_output_callback_add(struct srd_session *sess,
 		int output_type, srd_pd_output_callback cb, void *cb_data);
+SRD_API int srd_pd_output_callback_add_batch(struct srd_session *sess,
+		int output_type, srd_pd_output_batch_callback batch_cb,
+		void *cb_data);
 
 /* decoder.c */
 SRD_API const GSList *srd_decoder_list(void);
@@ -388,6 +511,8 @@ SRD_API struct srd_decoder_inst *srd_inst_find_by_id(struct srd_session *sess,
 		const char *inst_id);
 SRD_API int srd_inst_initial_pins_set_all(struct srd_decoder_inst *di,
 		GArray *initial_pins);
+SRD_API int srd_inst_stats_get(const struct srd_decoder_inst *di,
+		struct srd_inst_stats *stats);
 
 /* log.c */
 typedef int (*srd_log_callback)(void *cb_data, int loglevel,
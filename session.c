@@ -23,6 +23,10 @@
 #include "libsigrokdecode.h"
 #include <inttypes.h>
 #include <glib.h>
+#include <string.h>
+#ifdef HAVE_SYS_MMAN_H
+#include <sys/mman.h>
+#endif
 
 /**
  * @file
@@ -60,12 +64,23 @@ SRD_PRIV int max_session_id = -1;
  */
 SRD_API int srd_session_new(struct srd_session **sess)
 {
+	unsigned int i;
+
 	if (!sess)
 		return SRD_ERR_ARG;
 
 	*sess = g_malloc(sizeof(struct srd_session));
 	(*sess)->session_id = ++max_session_id;
 	(*sess)->di_list = (*sess)->callbacks = NULL;
+	for (i = 0; i < G_N_ELEMENTS((*sess)->output_callbacks); i++)
+		(*sess)->output_callbacks[i] = NULL;
+	(*sess)->change_index.valid = FALSE;
+	(*sess)->change_index.positions = g_array_new(FALSE, FALSE, sizeof(uint64_t));
+	(*sess)->send_queue_size = 0;
+	(*sess)->stack_queue_size = 0;
+	(*sess)->send_pending = g_ptr_array_new();
+	g_mutex_init(&(*sess)->callback_mutex);
+	(*sess)->profile = NULL;
 
 	/* Keep a list of all sessions, so we can clean up as needed. */
 	sessions = g_slist_append(sessions, *sess);
@@ -122,17 +137,15 @@ static int srd_inst_send_meta(struct srd_decoder_inst *di, int key,
 		/* This is the only key we pass on to the decoder for now. */
 		return SRD_OK;
 
-	gstate = PyGILState_Ensure();
-
-	if (PyObject_HasAttrString(di->py_inst, "metadata")) {
+	if (di->hooks & SRD_HOOK_METADATA) {
+		gstate = PyGILState_Ensure();
 		py_ret = PyObject_CallMethod(di->py_inst, "metadata", "lK",
 				(long)SRD_CONF_SAMPLERATE,
 				(unsigned long long)g_variant_get_uint64(data));
 		Py_XDECREF(py_ret);
+		PyGILState_Release(gstate);
 	}
 
-	PyGILState_Release(gstate);
-
 	/* Push metadata to all the PDs stacked on top of this one. */
 	for (l = di->next_di; l; l = l->next) {
 		next_di = l->data;
@@ -201,6 +214,58 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 	return ret;
 }
 
+/**
+ * Determine the positions in a chunk where the sample data changes.
+ *
+ * Building the index gets abandoned when the data changes too often for
+ * the index to be of any help, or to keep its size within reason.
+ *
+ * @param idx The change index to (re-)build. Must not be NULL.
+ * @param inbuf The chunk's sample data.
+ * @param inbuflen The length of the chunk's sample data in bytes.
+ * @param unitsize The number of bytes per sample.
+ */
+static void change_index_build(struct srd_change_index *idx,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	uint64_t pos, num_samples, max_changes, step, w, p;
+	const uint8_t *sample_pos;
+
+	idx->valid = FALSE;
+	idx->inbuf = NULL;
+	g_array_set_size(idx->positions, 0);
+	if (!inbuf || !unitsize || unitsize > 8)
+		return;
+
+	num_samples = inbuflen / unitsize;
+	max_changes = num_samples / 16;
+	step = (unitsize & (unitsize - 1)) ? 0 : 8 / unitsize;
+
+	pos = 1;
+	while (pos < num_samples) {
+		sample_pos = inbuf + pos * unitsize;
+		/* Skip words of unchanged samples. */
+		if (step && pos + step <= num_samples) {
+			memcpy(&w, sample_pos, 8);
+			memcpy(&p, sample_pos - unitsize, 8);
+			if (w == p) {
+				pos += step;
+				continue;
+			}
+		}
+		if (memcmp(sample_pos, sample_pos - unitsize, unitsize)) {
+			if (idx->positions->len >= max_changes)
+				return;
+			g_array_append_val(idx->positions, pos);
+		}
+		pos++;
+	}
+
+	idx->inbuf = inbuf;
+	idx->unitsize = unitsize;
+	idx->valid = TRUE;
+}
+
 /**
  * Send a chunk of logic sample data to a running decoder session.
  *
@@ -212,6 +277,18 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
  * has been configured, it is the minimum number of bytes needed to store
  * the default channels.
  *
+ * The decoder stacks of the session work on the chunk concurrently, the
+ * call returns when all of them are done. When several of them fail,
+ * the error of the first decoder instance in the session's list of
+ * instances gets returned.
+ *
+ * All decoders of a process share one Python interpreter. The search
+ * for sample data which matches .wait() conditions runs in parallel,
+ * the decoders' Python code is serialized by the interpreter's lock.
+ * Frontends which want to use several CPU cores for independent
+ * decoder stacks can run them in separate processes, each of which
+ * initializes its own libsigrokdecode instance.
+ *
  * The calls to this function must provide the samples that shall be
  * used by the protocol decoder
  *  - in the correct order ([...]5, 6, 4, 7, 8[...] is a bug),
@@ -264,20 +341,820 @@ SRD_API int srd_session_send(struct srd_session *sess,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
 {
 	GSList *d;
-	int ret;
+	guint i;
+	int ret, inst_ret;
 
 	if (!sess)
 		return SRD_ERR_ARG;
 
-	for (d = sess->di_list; d; d = d->next) {
-		if ((ret = srd_inst_decode(d->data, abs_start_samplenum,
-				abs_end_samplenum, inbuf, inbuflen, unitsize)) != SRD_OK)
-			return ret;
+	/*
+	 * Several instances inspect this chunk, share its changes. Not
+	 * for queued chunks, which outlive this call (as copies).
+	 */
+	if (sess->di_list && sess->di_list->next && !sess->send_queue_size)
+		change_index_build(&sess->change_index, inbuf, inbuflen, unitsize);
+
+	ret = SRD_OK;
+	if (sess->send_queue_size) {
+		/* Queueing returns early (unless the queue is full). */
+		for (d = sess->di_list; d; d = d->next) {
+			if ((ret = srd_inst_decode(d->data, abs_start_samplenum,
+					abs_end_samplenum, inbuf, inbuflen, unitsize)) != SRD_OK)
+				break;
+		}
+	} else {
+		/*
+		 * Have all decoder stacks work on the chunk concurrently,
+		 * then wait for all of them. Report the first error in
+		 * the order of the instance list.
+		 */
+		g_ptr_array_set_size(sess->send_pending, 0);
+		for (d = sess->di_list; d; d = d->next) {
+			inst_ret = srd_inst_decode_begin(d->data,
+				abs_start_samplenum, abs_end_samplenum,
+				inbuf, inbuflen, unitsize);
+			g_ptr_array_add(sess->send_pending,
+				inst_ret == SRD_OK ? d->data : NULL);
+			if (inst_ret != SRD_OK && ret == SRD_OK)
+				ret = inst_ret;
+		}
+		for (i = 0, d = sess->di_list; d; i++, d = d->next) {
+			if (!g_ptr_array_index(sess->send_pending, i))
+				continue;
+			inst_ret = srd_inst_decode_end(d->data);
+			if (inst_ret != SRD_OK && ret == SRD_OK)
+				ret = inst_ret;
+		}
 	}
 
+	sess->change_index.valid = FALSE;
+	sess->change_index.inbuf = NULL;
+
+	return ret;
+}
+
+/**
+ * Set the number of chunks which can be queued per decoder instance.
+ *
+ * By default, srd_session_send() only returns after the decoders have
+ * processed the chunk. This costs two thread switches per chunk, which
+ * becomes noticeable with many small chunks. When a queue size is set,
+ * srd_session_send() copies the chunk into a queue of pending chunks
+ * and returns immediately, unless the queue is full. The decoders'
+ * worker threads process queued chunks in order, and without a detour
+ * through the caller's thread. Decoder output for a chunk can happen
+ * after srd_session_send() has returned.
+ *
+ * srd_session_send_rle() and srd_session_send_eof() wait until all
+ * queued chunks were processed.
+ *
+ * Decoder errors are reported late: When a decoder fails on a queued
+ * chunk, the error is returned by a later srd_session_send() (or
+ * srd_session_send_rle()) call, or by srd_session_send_eof().
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param num_chunks The number of chunks which can be queued per
+ *                   decoder instance, 0 to disable queueing.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_queue_set(struct srd_session *sess,
+		unsigned int num_chunks)
+{
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	sess->send_queue_size = num_chunks;
+
 	return SRD_OK;
 }
 
+/**
+ * Set the number of items which can be queued per stacked decoder.
+ *
+ * By default, the output which a decoder puts for the decoders stacked
+ * on top of it gets processed right away, in the context of the lower
+ * decoder. A slow upper decoder then stalls all decoders below it.
+ * When a queue size is set, each stacked decoder instance runs on a
+ * worker thread of its own, and receives its input through a queue of
+ * the given size. The lower decoder only waits when the queue is full.
+ * Stack levels can overlap where the Python runtime allows it.
+ *
+ * The lower decoder's output gets copied when it is queued (lists,
+ * tuples and dicts, also nested ones), so decoders can keep modifying
+ * their lists after put() returned. Other mutable objects are passed by
+ * reference, and must not be modified after they were put().
+ *
+ * Input and flush requests keep their order at each stack level.
+ * srd_session_send_eof() returns after all stack levels have handled
+ * their input. Decoder output callbacks can get called from different
+ * threads, but never concurrently.
+ *
+ * Takes effect when the session gets started.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param num_items The number of input items which can be queued per
+ *                  stacked decoder instance, 0 to disable pipelining.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_stack_queue_set(struct srd_session *sess,
+		unsigned int num_items)
+{
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	sess->stack_queue_size = num_items;
+
+	return SRD_OK;
+}
+
+/** @cond PRIVATE */
+
+/* The profiler's view of the calling thread (NULL: not registered). */
+static GPrivate prof_thread_key = G_PRIVATE_INIT(NULL);
+
+/** @endcond */
+
+/* Number of frames on a Python stack. Takes a reference to the frame. */
+static unsigned int frame_depth(PyObject *py_frame)
+{
+	PyObject *py_back;
+	unsigned int depth;
+
+	depth = 0;
+	while (py_frame && py_frame != Py_None) {
+		depth++;
+		py_back = PyObject_GetAttrString(py_frame, "f_back");
+		Py_DECREF(py_frame);
+		py_frame = py_back;
+	}
+	Py_XDECREF(py_frame);
+	PyErr_Clear();
+
+	return depth;
+}
+
+/* Append a frame's name: the source file, its directory and the function. */
+static void frame_name_append(GString *s, PyObject *py_frame)
+{
+	PyObject *py_code;
+	char *file, *func, *dir, *dir_base, *file_base;
+
+	file = func = NULL;
+	py_code = PyObject_GetAttrString(py_frame, "f_code");
+	if (py_code) {
+		py_attr_as_str(py_code, "co_filename", &file);
+		py_attr_as_str(py_code, "co_name", &func);
+		Py_DECREF(py_code);
+	}
+	PyErr_Clear();
+
+	if (file) {
+		dir = g_path_get_dirname(file);
+		dir_base = g_path_get_basename(dir);
+		file_base = g_path_get_basename(file);
+		g_string_append_printf(s, "%s/%s:", dir_base, file_base);
+		g_free(file_base);
+		g_free(dir_base);
+		g_free(dir);
+	}
+	g_string_append(s, func ? func : "?");
+
+	g_free(file);
+	g_free(func);
+}
+
+/*
+ * Get the entry of a stack of instances in a state (SRD_PROF_PYTHON or
+ * SRD_PROF_SCAN). Caller holds the profile's mutex.
+ */
+static struct srd_prof_stack *profile_stack_get(struct srd_profile *prof,
+		const char *key, int state)
+{
+	struct srd_prof_stack *stack;
+	char *name;
+
+	name = g_strconcat(key, state == SRD_PROF_SCAN ? ";[scan]" : "", NULL);
+	if ((stack = g_hash_table_lookup(prof->stacks, name))) {
+		g_free(name);
+		return stack;
+	}
+	stack = g_malloc0(sizeof(*stack));
+	stack->samples = g_hash_table_new_full(g_str_hash, g_str_equal,
+		g_free, g_free);
+	g_hash_table_insert(prof->stacks, name, stack);
+
+	return stack;
+}
+
+static void profile_stack_free(struct srd_prof_stack *stack)
+{
+	g_hash_table_destroy(stack->samples);
+	g_free(stack);
+}
+
+/*
+ * Charge the time since the last change to the calling thread's current
+ * stack of instances and state. Gets called by the thread itself, before
+ * it changes either of them.
+ */
+static void profile_charge(struct srd_prof_thread *pt)
+{
+	struct srd_profile *prof;
+	struct srd_prof_level *level;
+	uint64_t now;
+	int state;
+
+	now = srd_time_ns();
+	state = g_atomic_int_get(&pt->state);
+	if (state != SRD_PROF_BLOCKED && pt->levels->len) {
+		prof = pt->profile;
+		level = &g_array_index(pt->levels, struct srd_prof_level,
+			pt->levels->len - 1);
+		g_mutex_lock(&prof->mutex);
+		if (!prof->terminate) {
+			if (!level->stacks[state])
+				level->stacks[state] = profile_stack_get(prof,
+					level->key, state);
+			level->stacks[state]->time_ns += now - pt->since;
+		}
+		g_mutex_unlock(&prof->mutex);
+	}
+	pt->since = now;
+}
+
+/*
+ * Take a sample of a thread which runs decoders: The instances and
+ * Python functions on its stack, outermost first, separated by ';'.
+ * The sample is counted for the thread's current stack of instances.
+ */
+static void profile_sample_thread(struct srd_profile *prof,
+		struct srd_prof_thread *pt, PyObject *py_frames)
+{
+	PyObject *py_id, *py_frame;
+	GPtrArray *frames;
+	GString *s;
+	struct srd_prof_level *level;
+	struct srd_prof_stack *stack;
+	unsigned int i, l;
+	int state;
+	uint64_t *count;
+
+	state = g_atomic_int_get(&pt->state);
+	if (state == SRD_PROF_BLOCKED || !pt->levels->len)
+		return;
+
+	py_id = PyLong_FromUnsignedLong(pt->thread_id);
+	py_frame = py_id ? PyDict_GetItem(py_frames, py_id) : NULL;
+	Py_XDECREF(py_id);
+	if (!py_frame)
+		return;
+
+	/* Collect the frames, innermost first. */
+	frames = g_ptr_array_new_with_free_func((GDestroyNotify)Py_DecRef);
+	Py_INCREF(py_frame);
+	while (py_frame && py_frame != Py_None) {
+		g_ptr_array_add(frames, py_frame);
+		py_frame = PyObject_GetAttrString(py_frame, "f_back");
+	}
+	Py_XDECREF(py_frame);
+	PyErr_Clear();
+
+	/* Instances start at the stack depth at which they got called. */
+	s = g_string_sized_new(256);
+	for (i = 0, l = 0; i < frames->len; i++) {
+		for (; l < pt->levels->len; l++) {
+			level = &g_array_index(pt->levels, struct srd_prof_level, l);
+			if (level->depth > i)
+				break;
+			g_string_append_printf(s, "%s;", level->di->inst_id);
+		}
+		frame_name_append(s, g_ptr_array_index(frames, frames->len - 1 - i));
+		g_string_append_c(s, ';');
+	}
+	g_ptr_array_free(frames, TRUE);
+	if (state == SRD_PROF_SCAN)
+		g_string_append(s, "[scan];");
+	if (!s->len) {
+		g_string_free(s, TRUE);
+		return;
+	}
+	g_string_truncate(s, s->len - 1);
+
+	level = &g_array_index(pt->levels, struct srd_prof_level,
+		pt->levels->len - 1);
+	g_mutex_lock(&prof->mutex);
+	stack = profile_stack_get(prof, level->key, state);
+	if ((count = g_hash_table_lookup(stack->samples, s->str))) {
+		g_string_free(s, TRUE);
+	} else {
+		count = g_malloc0(sizeof(*count));
+		g_hash_table_insert(stack->samples, g_string_free(s, FALSE), count);
+	}
+	(*count)++;
+	stack->num_samples++;
+	g_mutex_unlock(&prof->mutex);
+}
+
+/* Sample all threads which run decoders. Caller holds the GIL. */
+static void profile_sample(struct srd_profile *prof)
+{
+	PyObject *py_func, *py_frames;
+	guint i;
+
+	if (!prof->threads->len)
+		return;
+
+	py_func = PySys_GetObject("_current_frames");
+	py_frames = py_func ? PyObject_CallObject(py_func, NULL) : NULL;
+	if (!py_frames || !PyDict_Check(py_frames)) {
+		srd_dbg("Cannot get the stacks of Python threads.");
+		Py_XDECREF(py_frames);
+		PyErr_Clear();
+		return;
+	}
+
+	for (i = 0; i < prof->threads->len; i++) {
+		profile_sample_thread(prof, g_ptr_array_index(prof->threads, i),
+			py_frames);
+	}
+	Py_DECREF(py_frames);
+}
+
+static gpointer profile_thread(gpointer data)
+{
+	struct srd_profile *prof;
+	PyGILState_STATE gstate;
+	gint64 end;
+
+	prof = data;
+
+	g_mutex_lock(&prof->mutex);
+	while (!prof->terminate) {
+		end = g_get_monotonic_time() + prof->interval_us;
+		while (!prof->terminate && g_get_monotonic_time() < end)
+			g_cond_wait_until(&prof->cond, &prof->mutex, end);
+		if (prof->terminate)
+			break;
+		g_mutex_unlock(&prof->mutex);
+
+		gstate = PyGILState_Ensure();
+		profile_sample(prof);
+		PyGILState_Release(gstate);
+
+		g_mutex_lock(&prof->mutex);
+	}
+	g_mutex_unlock(&prof->mutex);
+
+	return NULL;
+}
+
+static void profile_stop(struct srd_profile *prof)
+{
+	if (!prof->thread)
+		return;
+
+	g_mutex_lock(&prof->mutex);
+	prof->terminate = TRUE;
+	g_cond_signal(&prof->cond);
+	g_mutex_unlock(&prof->mutex);
+	g_thread_join(prof->thread);
+	prof->thread = NULL;
+}
+
+static void profile_free(struct srd_session *sess)
+{
+	struct srd_profile *prof;
+
+	if (!(prof = sess->profile))
+		return;
+
+	profile_stop(prof);
+	g_ptr_array_free(prof->threads, TRUE);
+	g_hash_table_destroy(prof->stacks);
+	g_cond_clear(&prof->cond);
+	g_mutex_clear(&prof->mutex);
+	g_free(prof);
+	sess->profile = NULL;
+}
+
+/**
+ * Start or stop the sampling profiler of a session.
+ *
+ * While the profiler runs, the threads which run the session's decoders
+ * measure the time spent in each decoder instance, including stacked
+ * decoders which run synchronously within the put() calls of the
+ * decoder below them. Time which decoders spend checking wait()
+ * conditions in C shows up as "[scan]" (as the scan_ns counter of
+ * srd_inst_stats_get() does), time in which they wait for input or
+ * for the GIL is not accounted. The Python stacks of the threads get sampled
+ * periodically, the samples split the time of an instance across the
+ * Python functions which were executing.
+ *
+ * Decoders which already run when the profiler gets started are not
+ * seen, so start it before sending sample data to the session. The
+ * results accumulate until the session gets destroyed, also across
+ * stop and restart of the profiler. See srd_session_profile_get().
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param interval_us The sampling interval in microseconds, 0 to stop
+ *                    the profiler.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_profile_set(struct srd_session *sess,
+		unsigned int interval_us)
+{
+	struct srd_profile *prof;
+	PyGILState_STATE gstate;
+
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	if (!interval_us) {
+		if (sess->profile)
+			profile_stop(sess->profile);
+		return SRD_OK;
+	}
+
+	if (!(prof = sess->profile)) {
+		prof = g_malloc0(sizeof(*prof));
+		g_mutex_init(&prof->mutex);
+		g_cond_init(&prof->cond);
+		prof->threads = g_ptr_array_new();
+		prof->stacks = g_hash_table_new_full(g_str_hash, g_str_equal,
+			g_free, (GDestroyNotify)profile_stack_free);
+		/* Decoder threads look the profiler up with the GIL held. */
+		gstate = PyGILState_Ensure();
+		sess->profile = prof;
+		PyGILState_Release(gstate);
+	}
+
+	g_mutex_lock(&prof->mutex);
+	prof->interval_us = interval_us;
+	g_mutex_unlock(&prof->mutex);
+
+	if (!prof->thread) {
+		srd_dbg("Starting profiler of session %d, interval %u us.",
+			sess->session_id, interval_us);
+		g_mutex_lock(&prof->mutex);
+		prof->terminate = FALSE;
+		g_mutex_unlock(&prof->mutex);
+		prof->thread = g_thread_new("srd-profile", profile_thread, prof);
+	}
+
+	return SRD_OK;
+}
+
+/**
+ * Get the results of a session's sampling profiler.
+ *
+ * The results are in the "collapsed stack" format which flamegraph
+ * tools accept: One line per stack, which lists the decoder instance
+ * IDs and Python functions (as "dir/file.py:function") from the
+ * outermost to the innermost, separated by ';', followed by a space
+ * and the time spent in the stack in microseconds. Lines are sorted.
+ *
+ * @param sess The session to use. Must not be NULL.
+ *
+ * @return A newly allocated string which the caller must g_free(), or
+ *         NULL if the profiler was never started for the session.
+ *
+ * @since 0.6.0
+ */
+SRD_API char *srd_session_profile_get(struct srd_session *sess)
+{
+	GHashTable *totals;
+	GHashTableIter iter, sample_iter;
+	GList *keys, *l;
+	GString *s;
+	struct srd_prof_stack *stack;
+	gpointer key, value;
+	uint64_t *total, time_us;
+
+	if (!sess || !sess->profile)
+		return NULL;
+
+	/* Split the time of each stack of instances across its samples. */
+	totals = g_hash_table_new_full(g_str_hash, g_str_equal, NULL, g_free);
+	g_mutex_lock(&sess->profile->mutex);
+	g_hash_table_iter_init(&iter, sess->profile->stacks);
+	while (g_hash_table_iter_next(&iter, &key, &value)) {
+		stack = value;
+		time_us = stack->time_ns / 1000;
+		if (!stack->num_samples) {
+			total = g_malloc(sizeof(*total));
+			*total = time_us;
+			g_hash_table_insert(totals, key, total);
+			continue;
+		}
+		g_hash_table_iter_init(&sample_iter, stack->samples);
+		while (g_hash_table_iter_next(&sample_iter, &key, &value)) {
+			if (!(total = g_hash_table_lookup(totals, key))) {
+				total = g_malloc0(sizeof(*total));
+				g_hash_table_insert(totals, key, total);
+			}
+			*total += time_us * *(uint64_t *)value / stack->num_samples;
+		}
+	}
+
+	s = g_string_sized_new(1024);
+	keys = g_list_sort(g_hash_table_get_keys(totals), (GCompareFunc)strcmp);
+	for (l = keys; l; l = l->next) {
+		total = g_hash_table_lookup(totals, l->data);
+		g_string_append_printf(s, "%s %" PRIu64 "\n",
+			(const char *)l->data, *total);
+	}
+	g_mutex_unlock(&sess->profile->mutex);
+	g_list_free(keys);
+	g_hash_table_destroy(totals);
+
+	return g_string_free(s, FALSE);
+}
+
+/**
+ * Register the calling thread with the session's profiler (if any).
+ *
+ * Gets called by threads which run decoders, with the GIL held.
+ *
+ * @param di The decoder instance at the bottom of the thread's stack.
+ *
+ * @private
+ */
+SRD_PRIV void srd_profile_thread_begin(struct srd_decoder_inst *di)
+{
+	struct srd_profile *prof;
+	struct srd_prof_thread *pt;
+	struct srd_prof_level level;
+
+	prof = di->sess ? di->sess->profile : NULL;
+	if (!prof || g_private_get(&prof_thread_key))
+		return;
+
+	pt = g_malloc0(sizeof(*pt));
+	pt->profile = prof;
+	pt->thread_id = PyThread_get_thread_ident();
+	pt->levels = g_array_new(FALSE, TRUE, sizeof(struct srd_prof_level));
+	memset(&level, 0, sizeof(level));
+	level.di = di;
+	level.key = g_strdup(di->inst_id);
+	g_array_append_val(pt->levels, level);
+	pt->state = SRD_PROF_PYTHON;
+	pt->since = srd_time_ns();
+	g_ptr_array_add(prof->threads, pt);
+	g_private_set(&prof_thread_key, pt);
+}
+
+/**
+ * Unregister the calling thread from the profiler. Caller holds the GIL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_profile_thread_end(void)
+{
+	struct srd_prof_thread *pt;
+	guint l;
+
+	if (!(pt = g_private_get(&prof_thread_key)))
+		return;
+
+	profile_charge(pt);
+	g_ptr_array_remove(pt->profile->threads, pt);
+	for (l = 0; l < pt->levels->len; l++)
+		g_free(g_array_index(pt->levels, struct srd_prof_level, l).key);
+	g_array_free(pt->levels, TRUE);
+	g_free(pt);
+	g_private_set(&prof_thread_key, NULL);
+}
+
+/**
+ * Have the profiler attribute the Python code which gets called next
+ * to a (stacked) decoder instance. Caller holds the GIL.
+ *
+ * @param di The decoder instance.
+ *
+ * @return TRUE if the calling thread gets profiled, and srd_profile_pop()
+ *         needs to be called when the instance's code returns.
+ *
+ * @private
+ */
+SRD_PRIV gboolean srd_profile_push(struct srd_decoder_inst *di)
+{
+	struct srd_prof_thread *pt;
+	struct srd_prof_level level, *parent;
+	PyObject *py_func;
+
+	if (!(pt = g_private_get(&prof_thread_key)))
+		return FALSE;
+
+	profile_charge(pt);
+	parent = &g_array_index(pt->levels, struct srd_prof_level,
+		pt->levels->len - 1);
+	py_func = PySys_GetObject("_getframe");
+	memset(&level, 0, sizeof(level));
+	level.di = di;
+	level.depth = frame_depth(py_func ? PyObject_CallObject(py_func, NULL) : NULL);
+	level.key = g_strconcat(parent->key, ";", di->inst_id, NULL);
+	g_array_append_val(pt->levels, level);
+
+	return TRUE;
+}
+
+/**
+ * Undo srd_profile_push(). Caller holds the GIL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_profile_pop(void)
+{
+	struct srd_prof_thread *pt;
+
+	if (!(pt = g_private_get(&prof_thread_key)) || pt->levels->len < 2)
+		return;
+
+	profile_charge(pt);
+	g_free(g_array_index(pt->levels, struct srd_prof_level,
+		pt->levels->len - 1).key);
+	g_array_set_size(pt->levels, pt->levels->len - 1);
+}
+
+/**
+ * Tell the profiler what the calling thread does (SRD_PROF_*).
+ *
+ * @param state The thread's state.
+ *
+ * @private
+ */
+SRD_PRIV void srd_profile_state_set(int state)
+{
+	struct srd_prof_thread *pt;
+
+	if (!(pt = g_private_get(&prof_thread_key)) || pt->state == state)
+		return;
+
+	profile_charge(pt);
+	g_atomic_int_set(&pt->state, state);
+}
+
+/**
+ * Send a chunk of run-length encoded logic sample data to a running
+ * decoder session.
+ *
+ * The chunk consists of runs of identical samples. For each run, the
+ * sample value (unitsize bytes) and the number of samples in the run
+ * are provided. Decoders get to see the same samples (and the same
+ * absolute sample numbers) as if the expanded data was sent by means
+ * of srd_session_send(), but the sample data needs not get expanded,
+ * and conditions of .wait() calls get checked per run where possible.
+ *
+ * The sample numbers of all calls must be consecutive, like they must
+ * be for srd_session_send(). Calls to both routines can be mixed.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param abs_start_samplenum The absolute starting sample number for the
+ *              chunk's sample set, relative to the start of capture.
+ * @param values The runs' sample values, unitsize bytes each. Must not
+ *              be NULL.
+ * @param run_lengths The number of samples in each run. Must not be
+ *              NULL, and must not contain zero lengths.
+ * @param num_runs The number of runs. Must be > 0.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_rle(struct srd_session *sess,
+		uint64_t abs_start_samplenum, const uint8_t *values,
+		const uint64_t *run_lengths, uint64_t num_runs, uint64_t unitsize)
+{
+	GSList *d;
+	uint64_t i, *run_ends, end;
+	int ret;
+
+	if (!sess || !values || !run_lengths || !num_runs || !unitsize)
+		return SRD_ERR_ARG;
+
+	/* Translate run lengths to (chunk relative) end positions. */
+	run_ends = g_try_new(uint64_t, num_runs);
+	if (!run_ends)
+		return SRD_ERR_MALLOC;
+	end = 0;
+	for (i = 0; i < num_runs; i++) {
+		if (!run_lengths[i] || end + run_lengths[i] < end) {
+			g_free(run_ends);
+			return SRD_ERR_ARG;
+		}
+		end += run_lengths[i];
+		run_ends[i] = end;
+	}
+
+	ret = SRD_OK;
+	for (d = sess->di_list; d; d = d->next) {
+		if ((ret = srd_inst_decode_rle(d->data, abs_start_samplenum,
+				abs_start_samplenum + end, values, run_ends,
+				num_runs, unitsize)) != SRD_OK)
+			break;
+	}
+
+	g_free(run_ends);
+
+	return ret;
+}
+
+/** @private */
+#define SEND_FILE_DEFAULT_WINDOW	(4 * 1024 * 1024)
+
+/**
+ * Send the logic sample data of a capture file to a running decoder
+ * session.
+ *
+ * The file holds raw sample data of the given unitsize, like the
+ * buffers which get passed to srd_session_send(). It gets mapped into
+ * memory, and the decoders get fed directly from the mapping, in windows
+ * of the given size. This avoids reading the capture into heap buffers,
+ * and allows to decode files which exceed the available memory.
+ *
+ * The file's first sample gets the sample number 'abs_start_samplenum'.
+ * Trailing bytes which don't form a complete sample are ignored. The end
+ * of the stream is not communicated, callers can send further data, and
+ * need to call srd_session_send_eof() when done.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param filename The name of the capture file. Must not be NULL.
+ * @param abs_start_samplenum The absolute sample number of the file's
+ *              first sample, relative to the start of capture.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ * @param window_size The number of samples to send per chunk. A value
+ *              of 0 selects a default size.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_file(struct srd_session *sess,
+		const char *filename, uint64_t abs_start_samplenum,
+		uint64_t unitsize, uint64_t window_size)
+{
+	GMappedFile *file;
+	GError *error;
+	const uint8_t *data;
+	uint64_t num_samples, pos, count;
+	int ret;
+
+	if (!sess || !filename || !unitsize)
+		return SRD_ERR_ARG;
+
+	error = NULL;
+	file = g_mapped_file_new(filename, FALSE, &error);
+	if (!file) {
+		srd_err("Cannot map capture file '%s': %s.", filename,
+			error->message);
+		g_error_free(error);
+		return SRD_ERR;
+	}
+
+	data = (const uint8_t *)g_mapped_file_get_contents(file);
+	num_samples = g_mapped_file_get_length(file) / unitsize;
+	if (g_mapped_file_get_length(file) % unitsize)
+		srd_warn("Ignoring incomplete last sample in capture file '%s'.",
+			filename);
+
+	if (!window_size)
+		window_size = MAX(SEND_FILE_DEFAULT_WINDOW / unitsize, 1);
+
+#ifdef HAVE_POSIX_MADVISE
+	if (num_samples)
+		posix_madvise((void *)data, num_samples * unitsize,
+			POSIX_MADV_SEQUENTIAL);
+#endif
+
+	srd_dbg("Sending capture file '%s': %" PRIu64 " samples, unitsize %"
+		PRIu64 ", window %" PRIu64 ".", filename, num_samples,
+		unitsize, window_size);
+
+	ret = SRD_OK;
+	for (pos = 0; pos < num_samples; pos += count) {
+		count = MIN(window_size, num_samples - pos);
+		ret = srd_session_send(sess, abs_start_samplenum + pos,
+			abs_start_samplenum + pos + count, data + pos * unitsize,
+			count * unitsize, unitsize);
+		if (ret != SRD_OK)
+			break;
+	}
+
+	g_mapped_file_unref(file);
+
+	return ret;
+}
+
 /**
  * Communicate the end of the stream of sample data to the session.
  *
@@ -357,6 +1234,7 @@ SRD_API int srd_session_terminate_reset(struct srd_session *sess)
 SRD_API int srd_session_destroy(struct srd_session *sess)
 {
 	int session_id;
+	unsigned int i;
 
 	if (!sess)
 		return SRD_ERR_ARG;
@@ -364,8 +1242,16 @@ SRD_API int srd_session_destroy(struct srd_session *sess)
 	session_id = sess->session_id;
 	if (sess->di_list)
 		srd_inst_free_all(sess);
+	profile_free(sess);
 	if (sess->callbacks)
 		g_slist_free_full(sess->callbacks, g_free);
+	for (i = 0; i < G_N_ELEMENTS(sess->output_callbacks); i++) {
+		if (sess->output_callbacks[i])
+			g_ptr_array_free(sess->output_callbacks[i], TRUE);
+	}
+	g_array_free(sess->change_index.positions, TRUE);
+	g_ptr_array_free(sess->send_pending, TRUE);
+	g_mutex_clear(&sess->callback_mutex);
 	sessions = g_slist_remove(sessions, sess);
 	g_free(sess);
 
@@ -374,6 +1260,19 @@ SRD_API int srd_session_destroy(struct srd_session *sess)
 	return SRD_OK;
 }
 
+/* Keep a callback, and have it listed for its output type. */
+static void output_callback_add(struct srd_session *sess,
+		struct srd_pd_callback *pd_cb)
+{
+	GPtrArray **cbs;
+
+	sess->callbacks = g_slist_append(sess->callbacks, pd_cb);
+	cbs = &sess->output_callbacks[pd_cb->output_type];
+	if (!*cbs)
+		*cbs = g_ptr_array_new();
+	g_ptr_array_add(*cbs, pd_cb);
+}
+
 /**
  * Register/add a decoder output callback function.
  *
@@ -383,8 +1282,9 @@ SRD_API int srd_session_destroy(struct srd_session *sess)
  *
  * @param sess The output session in which to register the callback.
  *             Must not be NULL.
- * @param output_type The output type this callback will receive. Only one
- *                    callback per output type can be registered.
+ * @param output_type The output type this callback will receive. Several
+ *                    callbacks can be registered per output type, they
+ *                    get called in the order of their registration.
  * @param cb The function to call. Must not be NULL.
  * @param cb_data Private data for the callback function. Can be NULL.
  *
@@ -398,6 +1298,11 @@ SRD_API int srd_pd_output_callback_add(struct srd_session *sess,
 	if (!sess)
 		return SRD_ERR_ARG;
 
+	if (output_type < 0 || output_type >= NUM_OUTPUT_TYPES) {
+		srd_err("Invalid output type %d.", output_type);
+		return SRD_ERR_ARG;
+	}
+
 	srd_dbg("Registering new callback for output type %s.",
 		output_type_name(output_type));
 
@@ -405,31 +1310,82 @@ SRD_API int srd_pd_output_callback_add(struct srd_session *sess,
 	pd_cb->output_type = output_type;
 	pd_cb->cb = cb;
 	pd_cb->cb_data = cb_data;
-	sess->callbacks = g_slist_append(sess->callbacks, pd_cb);
+	pd_cb->batch_cb = NULL;
+	output_callback_add(sess, pd_cb);
 
 	return SRD_OK;
 }
 
-/** @private */
-SRD_PRIV struct srd_pd_callback *srd_pd_output_callback_find(
-		struct srd_session *sess, int output_type)
+/**
+ * Register/add a decoder output callback function which receives
+ * several records at once.
+ *
+ * Decoder output gets collected per decoder instance, and is passed to
+ * the callback when a number of records has accumulated, when the
+ * decoder instances got flushed after a chunk of input data was handled,
+ * and at the end of the input stream. The records and their content are
+ * only valid during the callback's execution.
+ *
+ * Only annotations (SRD_OUTPUT_ANN) are supported yet.
+ *
+ * @param sess The output session in which to register the callback.
+ *             Must not be NULL.
+ * @param output_type The output type this callback will receive. Several
+ *                    callbacks can be registered per output type, they
+ *                    get called in the order of their registration.
+ * @param batch_cb The function to call. Must not be NULL.
+ * @param cb_data Private data for the callback function. Can be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_pd_output_callback_add_batch(struct srd_session *sess,
+		int output_type, srd_pd_output_batch_callback batch_cb,
+		void *cb_data)
 {
-	GSList *l;
-	struct srd_pd_callback *tmp, *pd_cb;
+	struct srd_pd_callback *pd_cb;
 
-	if (!sess)
-		return NULL;
+	if (!sess || !batch_cb)
+		return SRD_ERR_ARG;
 
-	pd_cb = NULL;
-	for (l = sess->callbacks; l; l = l->next) {
-		tmp = l->data;
-		if (tmp->output_type == output_type) {
-			pd_cb = tmp;
-			break;
-		}
+	if (output_type != SRD_OUTPUT_ANN) {
+		srd_err("Batch callbacks are not supported for output type %s.",
+			output_type_name(output_type));
+		return SRD_ERR_ARG;
 	}
 
-	return pd_cb;
+	srd_dbg("Registering new batch callback for output type %s.",
+		output_type_name(output_type));
+
+	pd_cb = g_malloc(sizeof(struct srd_pd_callback));
+	pd_cb->output_type = output_type;
+	pd_cb->cb = NULL;
+	pd_cb->cb_data = cb_data;
+	pd_cb->batch_cb = batch_cb;
+	output_callback_add(sess, pd_cb);
+
+	return SRD_OK;
+}
+
+/**
+ * Get the frontend callbacks for an output type.
+ *
+ * @param sess The session. Can be NULL.
+ * @param output_type The output type.
+ *
+ * @return The callbacks in the order of their registration, or NULL
+ *         when none were registered for the output type.
+ *
+ * @private
+ */
+SRD_PRIV GPtrArray *srd_pd_output_callbacks_find(struct srd_session *sess,
+		int output_type)
+{
+	if (!sess || output_type < 0 || output_type >= NUM_OUTPUT_TYPES)
+		return NULL;
+
+	return sess->output_callbacks[output_type];
 }
 
 /** @} */
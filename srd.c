@@ -22,12 +22,17 @@
 #include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
 #include "libsigrokdecode.h"
 #include <glib.h>
+#include <inttypes.h>
 
 /** @cond PRIVATE */
 
 /* Python module search paths */
 SRD_PRIV GSList *searchpaths = NULL;
 
+/* Timed startup phases (struct srd_startup_record), if enabled. */
+static GSList *startup_profile = NULL;
+static gboolean startup_profiling = FALSE;
+
 /* session.c */
 extern SRD_PRIV GSList *sessions;
 extern SRD_PRIV int max_session_id;
@@ -112,6 +117,100 @@ static int searchpath_add_xdg_dir(const char *datadir)
 	return ret;
 }
 
+static const char *const startup_phase_names[] = {
+	[SRD_STARTUP_PYTHON_INIT] = "Python initialization",
+	[SRD_STARTUP_SEARCHPATHS] = "search paths",
+	[SRD_STARTUP_LOAD_ALL] = "loading all decoders",
+	[SRD_STARTUP_DECODER_INDEX] = "index lookup",
+	[SRD_STARTUP_DECODER_IMPORT] = "import",
+	[SRD_STARTUP_DECODER_METADATA] = "metadata",
+};
+
+static void startup_record_free(void *data)
+{
+	struct srd_startup_record *rec = data;
+
+	g_free(rec->name);
+	g_free(rec);
+}
+
+static void startup_profile_clear(void)
+{
+	g_slist_free_full(startup_profile, startup_record_free);
+	startup_profile = NULL;
+}
+
+/* Number of memory blocks which Python allocated, 0 if not initialized. */
+static int64_t py_allocated_blocks(void)
+{
+	PyObject *py_func, *py_blocks;
+	int64_t blocks;
+	PyGILState_STATE gstate;
+
+	if (!Py_IsInitialized())
+		return 0;
+
+	gstate = PyGILState_Ensure();
+
+	blocks = 0;
+	py_func = PySys_GetObject("getallocatedblocks");
+	if (py_func && (py_blocks = PyObject_CallObject(py_func, NULL))) {
+		blocks = PyLong_AsLongLong(py_blocks);
+		Py_DECREF(py_blocks);
+	}
+	PyErr_Clear();
+
+	PyGILState_Release(gstate);
+
+	return blocks;
+}
+
+/**
+ * Start timing a phase of the startup (if startup profiling is enabled).
+ *
+ * @param mark The start of the phase, for srd_startup_end().
+ *
+ * @private
+ */
+SRD_PRIV void srd_startup_begin(struct srd_startup_mark *mark)
+{
+	mark->active = startup_profiling;
+	if (!mark->active)
+		return;
+
+	mark->py_blocks = py_allocated_blocks();
+	mark->start = g_get_monotonic_time();
+}
+
+/**
+ * Record a phase of the startup which srd_startup_begin() started.
+ *
+ * @param mark The start of the phase.
+ * @param phase The phase (enum srd_startup_phase).
+ * @param name The decoder's module name for decoder phases, or NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_startup_end(const struct srd_startup_mark *mark,
+		int phase, const char *name)
+{
+	struct srd_startup_record *rec;
+
+	if (!mark->active || !startup_profiling)
+		return;
+
+	rec = g_malloc0(sizeof(struct srd_startup_record));
+	rec->phase = phase;
+	rec->name = g_strdup(name);
+	rec->duration = g_get_monotonic_time() - mark->start;
+	rec->py_blocks = py_allocated_blocks() - mark->py_blocks;
+	startup_profile = g_slist_append(startup_profile, rec);
+
+	srd_info("Startup: %s%s%s took %" PRIu64 " us, %+" PRId64
+		" Python memory blocks.", name ? name : "", name ? " " : "",
+		startup_phase_names[phase], rec->duration, rec->py_blocks);
+}
+
 static void print_versions(void)
 {
 	GString *s;
@@ -220,6 +319,7 @@ SRD_API int srd_init(const char *path)
 {
 	const char *const *sys_datadirs;
 	const char *env_path;
+	struct srd_startup_mark mark;
 	size_t i;
 	int ret;
 
@@ -228,6 +328,10 @@ SRD_API int srd_init(const char *path)
 		return SRD_ERR;
 	}
 
+	if (g_getenv("SIGROKDECODE_PROFILE_STARTUP"))
+		startup_profiling = TRUE;
+	startup_profile_clear();
+
 	print_versions();
 
 	srd_dbg("Initializing libsigrokdecode.");
@@ -236,7 +340,11 @@ SRD_API int srd_init(const char *path)
 	PyImport_AppendInittab("sigrokdecode", PyInit_sigrokdecode);
 
 	/* Initialize the Python interpreter. */
+	srd_startup_begin(&mark);
 	Py_InitializeEx(0);
+	srd_startup_end(&mark, SRD_STARTUP_PYTHON_INIT, NULL);
+
+	srd_startup_begin(&mark);
 
 	/* Locations relative to the XDG system data directories. */
 	sys_datadirs = g_get_system_data_dirs();
@@ -302,6 +410,8 @@ SRD_API int srd_init(const char *path)
 		g_strfreev(dir_list);
 	}
 
+	srd_startup_end(&mark, SRD_STARTUP_SEARCHPATHS, NULL);
+
 #if PY_VERSION_HEX < 0x03090000
 	/*
 	 * Initialize and acquire the Python GIL. In Python 3.7+ this
@@ -350,8 +460,10 @@ SRD_API int srd_exit(void)
 	sessions = NULL;
 
 	srd_decoder_unload_all();
+	srd_decoder_index_free();
 	g_slist_free_full(searchpaths, g_free);
 	searchpaths = NULL;
+	startup_profile_clear();
 
 	/*
 	 * Acquire the GIL, otherwise Py_Finalize() might have issues.
@@ -441,4 +553,50 @@ SRD_API GSList *srd_searchpaths_get(void)
 	return paths;
 }
 
+/**
+ * Enable or disable the startup profile.
+ *
+ * When enabled, the duration of each phase of srd_init() and of loading
+ * decoders gets recorded, as well as the change of the number of memory
+ * blocks which Python allocated. The records are also logged with
+ * loglevel SRD_LOG_INFO. Setting the SIGROKDECODE_PROFILE_STARTUP
+ * environment variable enables the startup profile, too.
+ *
+ * This must be called before srd_init() to have the initialization
+ * profiled.
+ *
+ * @param enable TRUE to enable the startup profile, FALSE to disable it.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_startup_profile_set(gboolean enable)
+{
+	startup_profiling = enable;
+
+	return SRD_OK;
+}
+
+/**
+ * Return the startup profile.
+ *
+ * This is a GSList of pointers to struct srd_startup_record items, in
+ * the order in which the phases ended. Decoder phases are recorded when
+ * decoders get loaded, and when a decoder which was loaded from the
+ * decoder index gets imported. The records of phases which are part of
+ * srd_decoder_load_all() precede its SRD_STARTUP_LOAD_ALL record.
+ *
+ * The list is owned by the library. It is cleared by srd_init() and
+ * srd_exit().
+ *
+ * @return The startup profile, NULL if it is empty.
+ *
+ * @since 0.6.0
+ */
+SRD_API const GSList *srd_startup_profile_get(void)
+{
+	return startup_profile;
+}
+
 /** @} */
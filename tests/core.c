@@ -86,6 +86,35 @@ START_TEST(test_init_exit_3)
 }
 END_TEST
 
+/*
+ * Check whether the startup profile has records of the initialization
+ * and of a loaded decoder.
+ */
+START_TEST(test_startup_profile)
+{
+	const GSList *l;
+	const struct srd_startup_record *rec;
+	gboolean python_init, metadata;
+
+	srd_startup_profile_set(TRUE);
+	srd_init(DECODERS_TESTDIR);
+	fail_unless(srd_decoder_load("uart") == SRD_OK);
+	python_init = metadata = FALSE;
+	for (l = srd_startup_profile_get(); l; l = l->next) {
+		rec = l->data;
+		if (rec->phase == SRD_STARTUP_PYTHON_INIT)
+			python_init = rec->duration > 0 && !rec->name;
+		if (rec->phase == SRD_STARTUP_DECODER_METADATA)
+			metadata = rec->name && g_str_equal(rec->name, "uart");
+	}
+	fail_unless(python_init, "No record of the Python initialization.");
+	fail_unless(metadata, "No record of the uart metadata.");
+	srd_exit();
+	fail_unless(srd_startup_profile_get() == NULL);
+	srd_startup_profile_set(FALSE);
+}
+END_TEST
+
 Suite *suite_core(void)
 {
 	Suite *s;
@@ -100,5 +129,10 @@ Suite *suite_core(void)
 	tcase_add_test(tc, test_init_exit_3);
 	suite_add_tcase(s, tc);
 
+	tc = tcase_create("startup_profile");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_startup_profile);
+	suite_add_tcase(s, tc);
+
 	return s;
 }
@@ -18,8 +18,11 @@
  */
 
 #include <config.h>
-#include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <libsigrokdecode-internal.h> /* First, to avoid compiler warning. */
+#include <libsigrokdecode.h>
 #include <stdlib.h>
+#include <glib/gstdio.h>
+#include <utime.h>
 #include <check.h>
 #include "lib.h"
 
@@ -148,6 +151,218 @@ START_TEST(test_load_nonexisting_pd_dir)
 }
 END_TEST
 
+/*
+ * Check whether a PD gets loaded from the decoder index, with the same
+ * metadata as when its module gets imported, and whether the module
+ * gets imported when the PD is instantiated.
+ */
+START_TEST(test_load_index)
+{
+	struct srd_session *sess;
+	struct srd_decoder *dec;
+	char *path, *longname;
+	guint num_channels, num_options, num_annotations;
+
+	path = g_build_filename(g_get_tmp_dir(), "srd-test-decoders.index", NULL);
+	g_remove(path);
+	g_setenv("SIGROKDECODE_INDEX", path, TRUE);
+
+	srd_init(DECODERS_TESTDIR);
+	fail_unless(srd_decoder_load("uart") == SRD_OK);
+	dec = srd_decoder_get_by_id("uart");
+	fail_unless(dec != NULL && dec->py_mod != NULL);
+	longname = g_strdup(dec->longname);
+	num_channels = g_slist_length(dec->opt_channels);
+	num_options = g_slist_length(dec->options);
+	num_annotations = g_slist_length(dec->annotations);
+	srd_exit();
+
+	srd_init(DECODERS_TESTDIR);
+	fail_unless(srd_decoder_load("uart") == SRD_OK);
+	dec = srd_decoder_get_by_id("uart");
+	fail_unless(dec != NULL);
+	fail_unless(dec->py_mod == NULL, "uart was not loaded from the index.");
+	fail_unless(g_str_equal(dec->longname, longname));
+	fail_unless(g_slist_length(dec->opt_channels) == num_channels);
+	fail_unless(g_slist_length(dec->options) == num_options);
+	fail_unless(g_slist_length(dec->annotations) == num_annotations);
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+	fail_unless(dec->py_mod != NULL, "uart was not imported.");
+	srd_exit();
+
+	g_setenv("SIGROKDECODE_INDEX", "", TRUE);
+	g_remove(path);
+	g_free(longname);
+	g_free(path);
+}
+END_TEST
+
+/* A decoder for test_load_index_common(), its metadata is irrelevant. */
+static const char *idxtest_pd =
+	"import sigrokdecode as srd\n"
+	"\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = 'idxtest'\n"
+	"    name = 'idxtest'\n"
+	"    longname = 'Index test'\n"
+	"    desc = 'Decoder index test.'\n"
+	"    license = 'gplv2+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Debug/trace']\n"
+	"\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"\n"
+	"    def start(self):\n"
+	"        pass\n"
+	"\n"
+	"    def decode(self):\n"
+	"        pass\n";
+
+/* Load idxtest, return whether it was loaded from the index. */
+static gboolean idxtest_load_indexed(const char *dir)
+{
+	struct srd_decoder *dec;
+	gboolean indexed;
+
+	srd_init(dir);
+	fail_unless(srd_decoder_load("idxtest") == SRD_OK);
+	dec = srd_decoder_get_by_id("idxtest");
+	fail_unless(dec != NULL);
+	indexed = dec->py_mod == NULL;
+	srd_exit();
+
+	return indexed;
+}
+
+/*
+ * Check whether the decoder index notices modifications of the modules
+ * in the 'common' directory, also when neither the size nor the mtime
+ * of the file changes.
+ */
+START_TEST(test_load_index_common)
+{
+	char *dir, *path, *pd_dir, *common_dir, *pd_file, *init_file, *helper;
+	struct utimbuf times;
+	GStatBuf st;
+
+	dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(dir != NULL, "Cannot create a temporary directory.");
+	pd_dir = g_build_filename(dir, "idxtest", NULL);
+	common_dir = g_build_filename(dir, "common", NULL);
+	g_mkdir(pd_dir, 0700);
+	g_mkdir(common_dir, 0700);
+	init_file = g_build_filename(pd_dir, "__init__.py", NULL);
+	g_file_set_contents(init_file, "from .pd import Decoder\n", -1, NULL);
+	pd_file = g_build_filename(pd_dir, "pd.py", NULL);
+	g_file_set_contents(pd_file, idxtest_pd, -1, NULL);
+	helper = g_build_filename(common_dir, "helper.py", NULL);
+	g_file_set_contents(helper, "VALUE = 1\n", -1, NULL);
+	path = g_build_filename(dir, "decoders.index", NULL);
+	g_setenv("SIGROKDECODE_INDEX", path, TRUE);
+	g_setenv("PYTHONDONTWRITEBYTECODE", "1", TRUE);
+
+	fail_unless(!idxtest_load_indexed(dir), "idxtest was not imported.");
+	fail_unless(idxtest_load_indexed(dir), "idxtest was not indexed.");
+
+	/* Same size, same mtime. */
+	fail_unless(g_stat(helper, &st) == 0);
+	g_file_set_contents(helper, "VALUE = 2\n", -1, NULL);
+	times.actime = st.st_atime;
+	times.modtime = st.st_mtime;
+	g_utime(helper, &times);
+	fail_unless(!idxtest_load_indexed(dir),
+		"Modified common module went unnoticed.");
+	fail_unless(idxtest_load_indexed(dir), "idxtest was not indexed.");
+
+	g_unsetenv("PYTHONDONTWRITEBYTECODE");
+	g_setenv("SIGROKDECODE_INDEX", "", TRUE);
+	g_remove(path);
+	g_remove(helper);
+	g_remove(pd_file);
+	g_remove(init_file);
+	g_rmdir(common_dir);
+	g_rmdir(pd_dir);
+	g_rmdir(dir);
+	g_free(helper);
+	g_free(pd_file);
+	g_free(init_file);
+	g_free(common_dir);
+	g_free(pd_dir);
+	g_free(path);
+	g_free(dir);
+}
+END_TEST
+
+/* Create a bundle with the idxtest decoder as 'listed' and 'unlisted'. */
+static void bundle_create(const char *path)
+{
+	PyObject *py_main;
+	PyGILState_STATE gstate;
+	int ret;
+
+	srd_init(NULL);
+	gstate = PyGILState_Ensure();
+	py_main = PyImport_AddModule("__main__");
+	PyModule_AddObject(py_main, "bundle_path", PyUnicode_FromString(path));
+	PyModule_AddObject(py_main, "pd_source", PyUnicode_FromString(idxtest_pd));
+	ret = PyRun_SimpleString(
+		"import zipfile\n"
+		"with zipfile.ZipFile(bundle_path, 'w') as zf:\n"
+		"    for name in ('listed', 'unlisted'):\n"
+		"        zf.writestr(name + '/__init__.py', 'from .pd import Decoder\\n')\n"
+		"        zf.writestr(name + '/pd.py', pd_source.replace('idxtest', name))\n"
+		"    zf.writestr('MANIFEST', '# test bundle\\nlisted\\n')\n");
+	PyGILState_Release(gstate);
+	srd_exit();
+	fail_unless(ret == 0, "Cannot create the bundle.");
+}
+
+/*
+ * Check whether srd_decoder_load_all() loads the decoders which the
+ * MANIFEST of a decoder bundle lists (and only those), also from the
+ * decoder index.
+ */
+START_TEST(test_load_bundle)
+{
+	char *dir, *path, *index;
+	struct srd_decoder *dec;
+	int i;
+
+	dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(dir != NULL, "Cannot create a temporary directory.");
+	path = g_build_filename(dir, "decoders.zip", NULL);
+	index = g_build_filename(dir, "decoders.index", NULL);
+	bundle_create(path);
+	g_setenv("SIGROKDECODE_INDEX", index, TRUE);
+
+	for (i = 0; i < 2; i++) {
+		srd_init(path);
+		fail_unless(srd_decoder_load_all() == SRD_OK);
+		dec = srd_decoder_get_by_id("listed");
+		fail_unless(dec != NULL, "Bundled decoder not loaded.");
+		fail_unless(g_str_equal(dec->longname, "Index test"));
+		/* The first run imports, the second one uses the index. */
+		fail_unless((dec->py_mod == NULL) == (i == 1),
+			"Unexpected index use in run %d.", i);
+		fail_unless(srd_decoder_get_by_id("unlisted") == NULL,
+			"Decoder which MANIFEST doesn't list got loaded.");
+		srd_exit();
+	}
+
+	g_setenv("SIGROKDECODE_INDEX", "", TRUE);
+	g_remove(index);
+	g_remove(path);
+	g_rmdir(dir);
+	g_free(index);
+	g_free(path);
+	g_free(dir);
+}
+END_TEST
+
 /*
  * Check whether srd_decoder_unload_all() works.
  * If it returns != SRD_OK (or segfaults) this test will fail.
@@ -438,6 +653,9 @@ Suite *suite_decoder(void)
 	tcase_add_test(tc, test_load_valid_and_bogus);
 	tcase_add_test(tc, test_load_multiple);
 	tcase_add_test(tc, test_load_nonexisting_pd_dir);
+	tcase_add_test(tc, test_load_index);
+	tcase_add_test(tc, test_load_index_common);
+	tcase_add_test(tc, test_load_bundle);
 	suite_add_tcase(s, tc);
 
 	tc = tcase_create("unload");
@@ -19,7 +19,10 @@
 
 #include <config.h>
 #include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <inttypes.h>
 #include <stdlib.h>
+#include <string.h>
+#include <glib/gstdio.h>
 #include <check.h>
 #include "lib.h"
 
@@ -140,6 +143,204 @@ START_TEST(test_inst_option_set_bogus)
 }
 END_TEST
 
+/*
+ * Check whether srd_inst_stats_get() works.
+ * If the counters don't reflect the decoded samples (or it segfaults)
+ * this test will fail.
+ */
+START_TEST(test_inst_stats_get)
+{
+	int ret;
+	struct srd_session *sess;
+	struct srd_decoder_inst *inst;
+	struct srd_inst_stats stats;
+	GHashTable *options, *channels;
+	uint8_t samples[1000];
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load_all();
+	srd_session_new(&sess);
+	options = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+			(GDestroyNotify)g_variant_unref);
+	inst = srd_inst_new(sess, "uart", options);
+	fail_unless(inst != NULL, "srd_inst_new() failed.");
+	g_hash_table_destroy(options);
+
+	ret = srd_inst_stats_get(inst, &stats);
+	fail_unless(ret == SRD_OK, "srd_inst_stats_get() failed: %d.", ret);
+	fail_unless(stats.wait_calls == 0, "Counters of a new instance are set.");
+
+	channels = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+			(GDestroyNotify)g_variant_unref);
+	g_hash_table_insert(channels, g_strdup("rx"), g_variant_new_int32(0));
+	ret = srd_inst_channel_set_all(inst, channels);
+	fail_unless(ret == SRD_OK, "srd_inst_channel_set_all() failed: %d.", ret);
+	g_hash_table_destroy(channels);
+
+	memset(samples, 0xff, sizeof(samples));
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+		g_variant_new_uint64(115200 * 10));
+	srd_session_start(sess);
+	ret = srd_session_send(sess, 0, sizeof(samples), samples,
+		sizeof(samples), 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+
+	ret = srd_inst_stats_get(inst, &stats);
+	fail_unless(ret == SRD_OK, "srd_inst_stats_get() failed: %d.", ret);
+	fail_unless(stats.wait_calls > 0, "No wait() calls counted.");
+	fail_unless(stats.samples_scanned > 0, "No scanned samples counted.");
+	fail_unless(stats.samples_scanned <= sizeof(samples),
+		"Too many scanned samples: %" PRIu64 ".", stats.samples_scanned);
+
+	/* NULL instance, NULL stats. */
+	ret = srd_inst_stats_get(NULL, &stats);
+	fail_unless(ret != SRD_OK, "srd_inst_stats_get(NULL, ...) succeeded.");
+	ret = srd_inst_stats_get(inst, NULL);
+	fail_unless(ret != SRD_OK, "srd_inst_stats_get(..., NULL) succeeded.");
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/* A decoder which reports its matches, using wait() or wait_many(). */
+static const char *waittest_pd =
+	"import sigrokdecode as srd\n"
+	"\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = 'waittest'\n"
+	"    name = 'waittest'\n"
+	"    longname = 'wait() test'\n"
+	"    desc = 'Reports the matches of wait() or wait_many().'\n"
+	"    license = 'gplv2+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Debug/trace']\n"
+	"    channels = (\n"
+	"        {'id': 'd0', 'name': 'D0', 'desc': 'Data 0'},\n"
+	"        {'id': 'd1', 'name': 'D1', 'desc': 'Data 1'},\n"
+	"    )\n"
+	"    options = (\n"
+	"        {'id': 'mode', 'desc': 'Mode', 'default': 'wait',\n"
+	"            'values': ('wait', 'many', 'level')},\n"
+	"    )\n"
+	"    annotations = (('match', 'Match'),)\n"
+	"\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"\n"
+	"    def start(self):\n"
+	"        self.out_ann = self.register(srd.OUTPUT_ANN)\n"
+	"\n"
+	"    def report(self, samplenum, mask, pins):\n"
+	"        text = '%d %d %s' % (samplenum, mask, ''.join(map(str, pins)))\n"
+	"        self.put(samplenum, samplenum, self.out_ann, [0, [text]])\n"
+	"\n"
+	"    def decode(self):\n"
+	"        conds = [{0: 'e'}, {1: 'f'}, {'skip': 37}]\n"
+	"        while True:\n"
+	"            if self.options['mode'] == 'wait':\n"
+	"                pins = self.wait(conds)\n"
+	"                mask = sum(1 << i for i, m in enumerate(self.matched) if m)\n"
+	"                self.report(self.samplenum, mask, pins)\n"
+	"            elif self.options['mode'] == 'many':\n"
+	"                nums, masks, pins = self.wait_many(conds, 5)\n"
+	"                assert self.samplenum == nums[-1]\n"
+	"                for i in range(len(nums)):\n"
+	"                    self.report(nums[i], masks[i], pins[2 * i:2 * i + 2])\n"
+	"            else:\n"
+	"                nums, masks, pins = self.wait_many({0: 'h'}, 5)\n"
+	"                self.report(nums[0], len(nums), pins[0:2])\n"
+	"                self.wait({'skip': 1})\n";
+
+/* Decode a capture with the waittest decoder, return the annotations. */
+static char *waittest_decode(const char *mode, const GArray *samples)
+{
+	struct srd_session *sess;
+	struct srdtest_anns *anns;
+	char *options, *text;
+
+	srd_session_new(&sess);
+	options = g_strdup_printf("mode=%s", mode);
+	srdtest_inst_new(sess, "waittest", "d0=0,d1=1", options);
+	g_free(options);
+	anns = srdtest_anns_new();
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_ann_cb, anns);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+		g_variant_new_uint64(1000000));
+	srd_session_start(sess);
+	srdtest_send(sess, (const uint8_t *)samples->data, samples->len, 1000);
+	srd_session_destroy(sess);
+	text = srdtest_anns_text(anns);
+	srdtest_anns_free(anns);
+
+	return text;
+}
+
+/*
+ * Check whether wait_many() returns the same matches as repeated wait()
+ * calls, also across chunk boundaries, and whether conditions which only
+ * check levels don't return the same sample several times.
+ */
+START_TEST(test_inst_wait_many)
+{
+	GArray *samples;
+	char *dir, *pd_dir, *file, *text_wait, *text_many, *text_level;
+	char **lines, **fields;
+	int i;
+
+	dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(dir != NULL, "Cannot create a temporary directory.");
+	pd_dir = g_build_filename(dir, "waittest", NULL);
+	g_mkdir(pd_dir, 0700);
+	file = g_build_filename(pd_dir, "__init__.py", NULL);
+	g_file_set_contents(file, "from .pd import Decoder\n", -1, NULL);
+	g_free(file);
+	file = g_build_filename(pd_dir, "pd.py", NULL);
+	g_file_set_contents(file, waittest_pd, -1, NULL);
+	g_free(file);
+	g_setenv("PYTHONDONTWRITEBYTECODE", "1", TRUE);
+
+	samples = srdtest_uart_capture("wait_many() test", 9);
+	srd_init(dir);
+	text_wait = waittest_decode("wait", samples);
+	text_many = waittest_decode("many", samples);
+	text_level = waittest_decode("level", samples);
+	srd_exit();
+
+	fail_unless(*text_wait != '\0', "No matches reported.");
+	fail_unless(g_str_equal(text_wait, text_many),
+		"wait_many() and wait() differ:\n%s\n%s", text_many, text_wait);
+	lines = g_strsplit(text_level, "\n", 0);
+	fail_unless(lines[0] && *lines[0], "No level matches reported.");
+	for (i = 0; lines[i] && *lines[i]; i++) {
+		/* "<inst> <range> <class> <samplenum> <num_matches> <pins>" */
+		fields = g_strsplit(lines[i], " ", 0);
+		fail_unless(g_strv_length(fields) == 6 && g_str_equal(fields[4], "1"),
+			"Sample returned several times: %s", lines[i]);
+		g_strfreev(fields);
+	}
+	g_strfreev(lines);
+
+	g_unsetenv("PYTHONDONTWRITEBYTECODE");
+	file = g_build_filename(pd_dir, "__init__.py", NULL);
+	g_remove(file);
+	g_free(file);
+	file = g_build_filename(pd_dir, "pd.py", NULL);
+	g_remove(file);
+	g_free(file);
+	g_rmdir(pd_dir);
+	g_rmdir(dir);
+	g_free(pd_dir);
+	g_free(dir);
+	g_free(text_wait);
+	g_free(text_many);
+	g_free(text_level);
+	g_array_free(samples, TRUE);
+}
+END_TEST
+
 Suite *suite_inst(void)
 {
 	Suite *s;
@@ -159,5 +360,15 @@ Suite *suite_inst(void)
 	tcase_add_test(tc, test_inst_option_set_bogus);
 	suite_add_tcase(s, tc);
 
+	tc = tcase_create("wait");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_inst_wait_many);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("stats");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_inst_stats_get);
+	suite_add_tcase(s, tc);
+
 	return s;
 }
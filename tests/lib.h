@@ -20,9 +20,32 @@
 #ifndef LIBSIGROKDECODE_TESTS_LIB_H
 #define LIBSIGROKDECODE_TESTS_LIB_H
 
+/* Annotations which decoders put, collected per instance. */
+struct srdtest_anns {
+	/* Maps an instance ID to its annotations (GString, a line each). */
+	GHashTable *insts;
+	unsigned int count;
+};
+
 void srdtest_setup(void);
 void srdtest_teardown(void);
 
+struct srd_decoder_inst *srdtest_inst_new(struct srd_session *sess,
+		const char *id, const char *channels, const char *options);
+void srdtest_send(struct srd_session *sess, const uint8_t *samples,
+		uint64_t num_samples, uint64_t chunk_size);
+GArray *srdtest_uart_capture(const char *text,
+		unsigned int samples_per_bit);
+GArray *srdtest_i2c_capture(const char *transfers,
+		unsigned int samples_per_bit);
+void srdtest_string_free(GString *s);
+struct srdtest_anns *srdtest_anns_new(void);
+void srdtest_anns_free(struct srdtest_anns *anns);
+char *srdtest_anns_text(struct srdtest_anns *anns);
+void srdtest_ann_cb(struct srd_proto_data *pdata, void *cb_data);
+void srdtest_ann_batch_cb(struct srd_proto_data *pdata,
+		unsigned int num_pdata, void *cb_data);
+
 Suite *suite_core(void);
 Suite *suite_decoder(void);
 Suite *suite_inst(void);
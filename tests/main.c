@@ -19,7 +19,9 @@
 
 #include <config.h>
 #include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <inttypes.h>
 #include <stdlib.h>
+#include <string.h>
 #include <check.h>
 #include "lib.h"
 
@@ -27,12 +29,281 @@ void srdtest_setup(void)
 {
 	/* Silence libsigrokdecode while the unit tests run. */
 	srd_log_loglevel_set(SRD_LOG_NONE);
+
+	/* Tests which check the decoder index enable it themselves. */
+	g_setenv("SIGROKDECODE_INDEX", "", TRUE);
 }
 
 void srdtest_teardown(void)
 {
 }
 
+/*
+ * Create a decoder instance. Channels and options are given as
+ * "name=value" lists separated by ',' (or NULL). Option values which
+ * are numbers are passed as integers, all others as strings.
+ */
+struct srd_decoder_inst *srdtest_inst_new(struct srd_session *sess,
+		const char *id, const char *channels, const char *options)
+{
+	struct srd_decoder_inst *di;
+	GHashTable *table;
+	GVariant *value;
+	char **items, **kv, *end;
+	gint64 num;
+	int i;
+
+	fail_unless(srd_decoder_load(id) == SRD_OK, "Cannot load %s.", id);
+
+	table = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+			(GDestroyNotify)g_variant_unref);
+	items = g_strsplit(options ? options : "", ",", 0);
+	for (i = 0; items[i] && *items[i]; i++) {
+		kv = g_strsplit(items[i], "=", 2);
+		num = g_ascii_strtoll(kv[1], &end, 10);
+		value = *end ? g_variant_new_string(kv[1]) : g_variant_new_int64(num);
+		g_hash_table_insert(table, g_strdup(kv[0]), g_variant_ref_sink(value));
+		g_strfreev(kv);
+	}
+	g_strfreev(items);
+	di = srd_inst_new(sess, id, table);
+	fail_unless(di != NULL, "Cannot create a %s instance.", id);
+	g_hash_table_destroy(table);
+
+	table = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+			(GDestroyNotify)g_variant_unref);
+	items = g_strsplit(channels ? channels : "", ",", 0);
+	for (i = 0; items[i] && *items[i]; i++) {
+		kv = g_strsplit(items[i], "=", 2);
+		value = g_variant_new_int32(atoi(kv[1]));
+		g_hash_table_insert(table, g_strdup(kv[0]), g_variant_ref_sink(value));
+		g_strfreev(kv);
+	}
+	g_strfreev(items);
+	if (g_hash_table_size(table))
+		fail_unless(srd_inst_channel_set_all(di, table) == SRD_OK,
+			"Cannot set the channels of %s.", id);
+	g_hash_table_destroy(table);
+
+	return di;
+}
+
+/* Feed samples to a session in chunks of the given size, then EOF. */
+void srdtest_send(struct srd_session *sess, const uint8_t *samples,
+		uint64_t num_samples, uint64_t chunk_size)
+{
+	uint64_t offset, count;
+	int ret;
+
+	for (offset = 0; offset < num_samples; offset += count) {
+		count = MIN(chunk_size, num_samples - offset);
+		ret = srd_session_send(sess, offset, offset + count,
+			samples + offset, count, 1);
+		fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	}
+	ret = srd_session_send_eof(sess);
+	fail_unless(ret == SRD_OK, "srd_session_send_eof() failed: %d.", ret);
+}
+
+/* Append the bits of an UART frame (8N1, LSB first) to a channel. */
+static void uart_frame(GArray *samples, guint *pos, unsigned int channel,
+		uint8_t byte, unsigned int samples_per_bit)
+{
+	unsigned int bit, i, level;
+	uint8_t idle;
+
+	idle = 0xff;
+	for (bit = 0; bit < 10; bit++) {
+		if (bit == 0)
+			level = 0;
+		else if (bit == 9)
+			level = 1;
+		else
+			level = (byte >> (bit - 1)) & 1;
+		for (i = 0; i < samples_per_bit; i++, (*pos)++) {
+			while (*pos >= samples->len)
+				g_array_append_val(samples, idle);
+			if (!level)
+				samples->data[*pos] &= ~(1 << channel);
+		}
+	}
+}
+
+/*
+ * Create an 8N1 UART capture, one byte per sample: The text is sent on
+ * channel 0, and the text with every byte inverted on channel 1 (with
+ * a small delay). Lines idle high.
+ */
+GArray *srdtest_uart_capture(const char *text,
+		unsigned int samples_per_bit)
+{
+	GArray *samples;
+	guint pos[2];
+	size_t i;
+	uint8_t idle;
+
+	samples = g_array_new(FALSE, FALSE, sizeof(uint8_t));
+	pos[0] = 20 * samples_per_bit;
+	pos[1] = 23 * samples_per_bit + samples_per_bit / 3;
+	for (i = 0; text[i]; i++) {
+		uart_frame(samples, &pos[0], 0, text[i], samples_per_bit);
+		uart_frame(samples, &pos[1], 1, ~text[i], samples_per_bit);
+		pos[0] += (i % 3) * samples_per_bit;
+		pos[1] += ((i + 1) % 2) * samples_per_bit;
+	}
+	idle = 0xff;
+	while (samples->len < MAX(pos[0], pos[1]) + 20 * samples_per_bit)
+		g_array_append_val(samples, idle);
+
+	return samples;
+}
+
+/* Append samples with the given SCL (channel 0) and SDA (channel 1) levels. */
+static void i2c_levels(GArray *samples, int scl, int sda, unsigned int count)
+{
+	uint8_t value;
+
+	value = (scl ? 1 : 0) | (sda ? 2 : 0);
+	while (count--)
+		g_array_append_val(samples, value);
+}
+
+/*
+ * Create an I2C capture, one byte per sample, SCL on channel 0 and SDA
+ * on channel 1. The transfers are given as space separated tokens: "S"
+ * (start), "P" (stop), or hex bytes. Bytes get ACKed, unless they have
+ * an 'n' suffix (NACK).
+ */
+GArray *srdtest_i2c_capture(const char *transfers,
+		unsigned int samples_per_bit)
+{
+	GArray *samples;
+	char **tokens, *end;
+	unsigned int half, value;
+	int i, bit, sda;
+	gboolean idle;
+
+	samples = g_array_new(FALSE, FALSE, sizeof(uint8_t));
+	half = samples_per_bit / 2;
+	i2c_levels(samples, 1, 1, 4 * samples_per_bit);
+	idle = TRUE;
+	sda = 1;
+	tokens = g_strsplit(transfers, " ", 0);
+	for (i = 0; tokens[i]; i++) {
+		/* SCL falls first, then SDA may change. */
+		if (!idle)
+			i2c_levels(samples, 0, sda, half);
+		if (g_str_equal(tokens[i], "S")) {
+			if (!idle) {
+				/* Repeated start. */
+				i2c_levels(samples, 0, 1, half);
+				i2c_levels(samples, 1, 1, half);
+			}
+			i2c_levels(samples, 1, 0, half);
+			i2c_levels(samples, 0, 0, half);
+			idle = FALSE;
+			sda = 0;
+		} else if (g_str_equal(tokens[i], "P")) {
+			i2c_levels(samples, 0, 0, half);
+			i2c_levels(samples, 1, 0, half);
+			i2c_levels(samples, 1, 1, 2 * samples_per_bit);
+			idle = TRUE;
+			sda = 1;
+		} else {
+			value = strtoul(tokens[i], &end, 16) << 1;
+			value |= *end == 'n';
+			for (bit = 8; bit >= 0; bit--) {
+				if (bit < 8)
+					i2c_levels(samples, 0, sda, 1);
+				sda = (value >> bit) & 1;
+				i2c_levels(samples, 0, sda, half);
+				i2c_levels(samples, 1, sda, half);
+			}
+		}
+	}
+	g_strfreev(tokens);
+	i2c_levels(samples, 1, 1, 4 * samples_per_bit);
+
+	return samples;
+}
+
+static int compare_strings(gconstpointer a, gconstpointer b)
+{
+	return strcmp(a, b);
+}
+
+void srdtest_string_free(GString *s)
+{
+	g_string_free(s, TRUE);
+}
+
+struct srdtest_anns *srdtest_anns_new(void)
+{
+	struct srdtest_anns *anns;
+
+	anns = g_malloc0(sizeof(*anns));
+	anns->insts = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+			(GDestroyNotify)srdtest_string_free);
+
+	return anns;
+}
+
+void srdtest_anns_free(struct srdtest_anns *anns)
+{
+	g_hash_table_destroy(anns->insts);
+	g_free(anns);
+}
+
+/*
+ * Get the collected annotations as text, one line per annotation. The
+ * instances are listed in the order of their IDs, the annotations of
+ * each instance in the order in which they were put.
+ */
+char *srdtest_anns_text(struct srdtest_anns *anns)
+{
+	GList *keys, *l;
+	GString *s;
+
+	s = g_string_new(NULL);
+	keys = g_list_sort(g_hash_table_get_keys(anns->insts), compare_strings);
+	for (l = keys; l; l = l->next)
+		g_string_append(s, ((GString *)g_hash_table_lookup(anns->insts, l->data))->str);
+	g_list_free(keys);
+
+	return g_string_free(s, FALSE);
+}
+
+/* Output callback (SRD_OUTPUT_ANN) which collects into srdtest_anns. */
+void srdtest_ann_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srdtest_anns *anns;
+	struct srd_proto_data_annotation *pda;
+	const char *inst_id;
+	GString *s;
+
+	anns = cb_data;
+	pda = pdata->data;
+	inst_id = pdata->pdo->di->inst_id;
+	if (!(s = g_hash_table_lookup(anns->insts, inst_id))) {
+		s = g_string_new(NULL);
+		g_hash_table_insert(anns->insts, g_strdup(inst_id), s);
+	}
+	g_string_append_printf(s, "%s %" PRIu64 "-%" PRIu64 " %d %s\n",
+		inst_id, pdata->start_sample, pdata->end_sample,
+		pda->ann_class, pda->ann_text[0]);
+	anns->count++;
+}
+
+/* Batch variant of srdtest_ann_cb(). */
+void srdtest_ann_batch_cb(struct srd_proto_data *pdata,
+		unsigned int num_pdata, void *cb_data)
+{
+	unsigned int i;
+
+	for (i = 0; i < num_pdata; i++)
+		srdtest_ann_cb(&pdata[i], cb_data);
+}
+
 int main(void)
 {
 	int ret;
@@ -22,6 +22,8 @@
 #include <libsigrokdecode.h>
 #include <stdint.h>
 #include <stdlib.h>
+#include <string.h>
+#include <glib/gstdio.h>
 #include <check.h>
 #include "lib.h"
 
@@ -230,6 +232,33 @@ START_TEST(test_session_metadata_set_bogus)
 }
 END_TEST
 
+/*
+ * Check whether the optional methods of a decoder instance get detected.
+ * The UART decoder implements metadata(), but not flush().
+ */
+START_TEST(test_session_inst_hooks)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *di;
+	unsigned int required;
+
+	srd_init(NULL);
+	srd_decoder_load("uart");
+	srd_session_new(&sess);
+	di = srd_inst_new(sess, "uart", NULL);
+	fail_unless(di != NULL, "srd_inst_new() failed.");
+	required = SRD_HOOK_START | SRD_HOOK_DECODE | SRD_HOOK_RESET;
+	fail_unless((di->hooks & required) == required,
+		"Required methods not detected: 0x%x.", di->hooks);
+	fail_unless(di->hooks & SRD_HOOK_METADATA, "metadata() not detected.");
+	fail_unless(!(di->hooks & SRD_HOOK_FLUSH), "Bogus flush() detected.");
+	fail_unless(di->hooks == di->decoder->hooks,
+		"Instance and class methods differ.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
 /*
  * Check whether srd_session_terminate_reset() succeeds on newly created
  * sessions, as well as after calling start() and meta(). No data is fed
@@ -260,6 +289,596 @@ START_TEST(test_session_reset_nodata)
 }
 END_TEST
 
+/*
+ * Check whether srd_session_send_rle() fails with invalid input.
+ * If it returns SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_send_rle_bogus)
+{
+	struct srd_session *sess;
+	uint8_t values[] = { 0x00, 0x01, 0x00 };
+	uint64_t lengths[] = { 10, 1, 5 };
+	uint64_t lengths_bogus[] = { 10, 0, 5 };
+	int ret;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+
+	/* Valid input, no decoder instances. */
+	ret = srd_session_send_rle(sess, 0, values, lengths, 3, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send_rle() failed: %d.", ret);
+
+	/* NULL session. */
+	ret = srd_session_send_rle(NULL, 0, values, lengths, 3, 1);
+	fail_unless(ret != SRD_OK, "srd_session_send_rle(NULL, ...) succeeded.");
+
+	/* NULL values, NULL run lengths, no runs, unitsize 0. */
+	ret = srd_session_send_rle(sess, 0, NULL, lengths, 3, 1);
+	fail_unless(ret != SRD_OK, "srd_session_send_rle() succeeded without values.");
+	ret = srd_session_send_rle(sess, 0, values, NULL, 3, 1);
+	fail_unless(ret != SRD_OK, "srd_session_send_rle() succeeded without lengths.");
+	ret = srd_session_send_rle(sess, 0, values, lengths, 0, 1);
+	fail_unless(ret != SRD_OK, "srd_session_send_rle() succeeded without runs.");
+	ret = srd_session_send_rle(sess, 0, values, lengths, 3, 0);
+	fail_unless(ret != SRD_OK, "srd_session_send_rle() succeeded with unitsize 0.");
+
+	/* Zero length run. */
+	ret = srd_session_send_rle(sess, 0, values, lengths_bogus, 3, 1);
+	fail_unless(ret != SRD_OK, "srd_session_send_rle() accepted an empty run.");
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_session_send_file() fails with invalid input.
+ * If it returns SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_send_file_bogus)
+{
+	struct srd_session *sess;
+	int ret;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+
+	/* NULL session, NULL filename, unitsize 0. */
+	ret = srd_session_send_file(NULL, "capture.bin", 0, 1, 0);
+	fail_unless(ret != SRD_OK, "srd_session_send_file(NULL, ...) succeeded.");
+	ret = srd_session_send_file(sess, NULL, 0, 1, 0);
+	fail_unless(ret != SRD_OK, "srd_session_send_file() succeeded without file.");
+	ret = srd_session_send_file(sess, "capture.bin", 0, 0, 0);
+	fail_unless(ret != SRD_OK, "srd_session_send_file() succeeded with unitsize 0.");
+
+	/* Non-existing file. */
+	ret = srd_session_send_file(sess, "/nonexisting/capture.bin", 0, 1, 0);
+	fail_unless(ret != SRD_OK, "srd_session_send_file() succeeded without file.");
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_session_send_queue_set() works.
+ * If it returns != SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_send_queue_set)
+{
+	struct srd_session *sess;
+	int ret;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	ret = srd_session_send_queue_set(sess, 8);
+	fail_unless(ret == SRD_OK, "srd_session_send_queue_set() failed: %d.", ret);
+	ret = srd_session_send_queue_set(sess, 0);
+	fail_unless(ret == SRD_OK, "srd_session_send_queue_set() failed: %d.", ret);
+	ret = srd_session_send_queue_set(NULL, 8);
+	fail_unless(ret != SRD_OK, "srd_session_send_queue_set(NULL, ...) succeeded.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_session_stack_queue_set() works.
+ * If it returns != SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_stack_queue_set)
+{
+	struct srd_session *sess;
+	int ret;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	ret = srd_session_stack_queue_set(sess, 16);
+	fail_unless(ret == SRD_OK, "srd_session_stack_queue_set() failed: %d.", ret);
+	ret = srd_session_stack_queue_set(sess, 0);
+	fail_unless(ret == SRD_OK, "srd_session_stack_queue_set() failed: %d.", ret);
+	ret = srd_session_stack_queue_set(NULL, 16);
+	fail_unless(ret != SRD_OK, "srd_session_stack_queue_set(NULL, ...) succeeded.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether the sampling profiler attributes time to the decoder
+ * instance which runs, whether the share of "[scan]" time matches the
+ * instance's counters, and whether invalid input is rejected.
+ */
+START_TEST(test_session_profile)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *di;
+	struct srd_inst_stats stats;
+	uint8_t samples[10000];
+	uint64_t i, offset, time_us, scan_us, total_us;
+	char *profile, **lines, *space;
+	double share, expected;
+	int ret;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	fail_unless(srd_session_profile_get(sess) == NULL,
+		"Got a profile without running the profiler.");
+	ret = srd_session_profile_set(NULL, 100);
+	fail_unless(ret != SRD_OK, "srd_session_profile_set(NULL, ...) succeeded.");
+	fail_unless(srd_session_profile_get(NULL) == NULL,
+		"srd_session_profile_get(NULL) succeeded.");
+
+	di = srdtest_inst_new(sess, "uart", "rx=0", NULL);
+	for (i = 0; i < sizeof(samples); i++)
+		samples[i] = (i / 9) % 3 ? 1 : 0;
+
+	ret = srd_session_profile_set(sess, 100);
+	fail_unless(ret == SRD_OK, "srd_session_profile_set() failed: %d.", ret);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+		g_variant_new_uint64(1000000));
+	srd_session_start(sess);
+	for (offset = 0; offset < 200 * sizeof(samples); offset += sizeof(samples)) {
+		ret = srd_session_send(sess, offset, offset + sizeof(samples),
+			samples, sizeof(samples), 1);
+		fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	}
+	ret = srd_session_profile_set(sess, 0);
+	fail_unless(ret == SRD_OK, "Stopping the profiler failed: %d.", ret);
+
+	profile = srd_session_profile_get(sess);
+	fail_unless(profile != NULL, "srd_session_profile_get() failed.");
+	lines = g_strsplit(profile, "\n", 0);
+	scan_us = total_us = 0;
+	for (i = 0; lines[i] && *lines[i]; i++) {
+		/* Stacks without samples have no Python functions. */
+		fail_unless(g_str_has_prefix(lines[i], "uart-1;")
+			|| g_str_has_prefix(lines[i], "uart-1 "),
+			"Unexpected profile line: %s", lines[i]);
+		space = strrchr(lines[i], ' ');
+		fail_unless(space != NULL, "Malformed line: %s", lines[i]);
+		time_us = g_ascii_strtoull(space + 1, NULL, 10);
+		total_us += time_us;
+		if (strstr(lines[i], ";[scan] "))
+			scan_us += time_us;
+	}
+	g_strfreev(lines);
+	g_free(profile);
+
+	/* The profile and the counters measure the same time. */
+	srd_inst_stats_get(di, &stats);
+	fail_unless(total_us > 0 && stats.scan_ns + stats.python_ns > 0,
+		"No time was accounted.");
+	share = (double)scan_us / total_us;
+	expected = (double)stats.scan_ns / (stats.scan_ns + stats.python_ns);
+	fail_unless(share > expected - 0.1 && share < expected + 0.1,
+		"[scan] share %.2f, expected %.2f.", share, expected);
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/* How uart_decode() feeds the session and collects the annotations. */
+#define DECODE_RLE	(1 << 0)	/* Send run-length encoded chunks. */
+#define DECODE_QUEUE	(1 << 1)	/* Queue chunks (send_queue_set). */
+#define DECODE_BATCH	(1 << 2)	/* Use a batch ANN callback. */
+#define DECODE_PYTHON	(1 << 3)	/* Add a PYTHON callback, too. */
+
+static void python_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	(void)pdata;
+	(*(unsigned int *)cb_data)++;
+}
+
+/* Decode a UART capture with several instances, return the annotations. */
+static char *uart_decode(const GArray *samples, unsigned int num_insts,
+		unsigned int flags)
+{
+	struct srd_session *sess;
+	struct srdtest_anns *anns;
+	const uint8_t *data;
+	uint8_t *values;
+	uint64_t *lengths, offset, count, i, num_runs;
+	unsigned int num_python;
+	char *text;
+	int ret;
+
+	srd_session_new(&sess);
+	for (i = 0; i < num_insts; i++)
+		srdtest_inst_new(sess, "uart", "rx=0,tx=1", NULL);
+	num_python = 0;
+	if (flags & DECODE_PYTHON)
+		srd_pd_output_callback_add(sess, SRD_OUTPUT_PYTHON,
+			python_cb, &num_python);
+	anns = srdtest_anns_new();
+	if (flags & DECODE_BATCH)
+		srd_pd_output_callback_add_batch(sess, SRD_OUTPUT_ANN,
+			srdtest_ann_batch_cb, anns);
+	else
+		srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN,
+			srdtest_ann_cb, anns);
+	if (flags & DECODE_QUEUE)
+		srd_session_send_queue_set(sess, 4);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+		g_variant_new_uint64(115200 * 9));
+	srd_session_start(sess);
+	data = (const uint8_t *)samples->data;
+	if (!(flags & DECODE_RLE)) {
+		srdtest_send(sess, data, samples->len, 1000);
+	} else {
+		/* Chunks of 1000 samples, runs don't cross chunk boundaries. */
+		values = g_malloc(1000);
+		lengths = g_malloc(1000 * sizeof(uint64_t));
+		for (offset = 0; offset < samples->len; offset += count) {
+			count = MIN(1000, samples->len - offset);
+			num_runs = 0;
+			for (i = 0; i < count; i++) {
+				if (i && data[offset + i] == values[num_runs - 1]) {
+					lengths[num_runs - 1]++;
+					continue;
+				}
+				values[num_runs] = data[offset + i];
+				lengths[num_runs++] = 1;
+			}
+			ret = srd_session_send_rle(sess, offset, values,
+				lengths, num_runs, 1);
+			fail_unless(ret == SRD_OK,
+				"srd_session_send_rle() failed: %d.", ret);
+		}
+		g_free(values);
+		g_free(lengths);
+		ret = srd_session_send_eof(sess);
+		fail_unless(ret == SRD_OK,
+			"srd_session_send_eof() failed: %d.", ret);
+	}
+	srd_session_destroy(sess);
+	if (flags & DECODE_PYTHON)
+		fail_unless(num_python > 0, "No PYTHON output.");
+	text = srdtest_anns_text(anns);
+	srdtest_anns_free(anns);
+
+	return text;
+}
+
+/*
+ * Check whether srd_session_send_rle() yields the same annotations as
+ * srd_session_send() with the expanded samples.
+ */
+START_TEST(test_session_send_rle)
+{
+	GArray *samples;
+	char *text, *text_rle;
+
+	srd_init(NULL);
+	samples = srdtest_uart_capture("Run-length encoded UART data", 9);
+	text = uart_decode(samples, 1, 0);
+	text_rle = uart_decode(samples, 1, DECODE_RLE);
+	fail_unless(*text != '\0', "No annotations.");
+	fail_unless(g_str_equal(text, text_rle),
+		"RLE decode differs:\n%s\n%s", text_rle, text);
+	g_free(text);
+	g_free(text_rle);
+	g_array_free(samples, TRUE);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether chunks which get queued (srd_session_send_queue_set())
+ * yield the same annotations as synchronously handled chunks, also
+ * with a batch callback (which gets flushed after each chunk).
+ */
+START_TEST(test_session_send_queued)
+{
+	GArray *samples;
+	char *text, *text_queued;
+	unsigned int i, flags[] = {
+		DECODE_QUEUE,
+		DECODE_QUEUE | DECODE_BATCH,
+		DECODE_QUEUE | DECODE_BATCH | DECODE_RLE,
+	};
+
+	srd_init(NULL);
+	samples = srdtest_uart_capture("Queued chunks of UART data", 9);
+	text = uart_decode(samples, 1, 0);
+	fail_unless(*text != '\0', "No annotations.");
+	for (i = 0; i < G_N_ELEMENTS(flags); i++) {
+		text_queued = uart_decode(samples, 1, flags[i]);
+		fail_unless(g_str_equal(text, text_queued),
+			"Queued decode (flags %u) differs:\n%s\n%s",
+			flags[i], text_queued, text);
+		g_free(text_queued);
+	}
+	g_free(text);
+	g_array_free(samples, TRUE);
+	srd_exit();
+}
+END_TEST
+
+/* Decode an I2C capture with eeprom24xx stacked on top of i2c. */
+static char *eeprom_decode(const GArray *samples, unsigned int stack_queue)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *di_i2c, *di_eeprom;
+	struct srdtest_anns *anns;
+	char *text;
+
+	srd_session_new(&sess);
+	di_i2c = srdtest_inst_new(sess, "i2c", "scl=0,sda=1", NULL);
+	di_eeprom = srdtest_inst_new(sess, "eeprom24xx", NULL, NULL);
+	srd_inst_stack(sess, di_i2c, di_eeprom);
+	anns = srdtest_anns_new();
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_ann_cb, anns);
+	srd_session_stack_queue_set(sess, stack_queue);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+		g_variant_new_uint64(1000000));
+	srd_session_start(sess);
+	srdtest_send(sess, (const uint8_t *)samples->data, samples->len, 1000);
+	srd_session_destroy(sess);
+	text = srdtest_anns_text(anns);
+	srdtest_anns_free(anns);
+
+	return text;
+}
+
+/*
+ * Check whether several instances with queued chunks, which deliver
+ * annotations to a batch callback and PYTHON output to another one,
+ * don't deadlock (callback_mutex vs. Python GIL), and yield the same
+ * annotations as synchronous decoding.
+ */
+START_TEST(test_session_send_queued_callbacks)
+{
+	GArray *samples;
+	char *data, *text, *text_queued;
+
+	srd_init(NULL);
+	/* Enough chunks for the instances to contend a lot. */
+	data = g_strnfill(2000, 'U');
+	samples = srdtest_uart_capture(data, 9);
+	g_free(data);
+	text = uart_decode(samples, 3, 0);
+	text_queued = uart_decode(samples, 3,
+		DECODE_QUEUE | DECODE_BATCH | DECODE_PYTHON);
+	fail_unless(*text != '\0', "No annotations.");
+	fail_unless(g_str_equal(text, text_queued),
+		"Queued decode differs:\n%s\n%s", text_queued, text);
+	g_free(text);
+	g_free(text_queued);
+	g_array_free(samples, TRUE);
+	srd_exit();
+}
+END_TEST
+
+/* A decoder which fails within the last chunk which gets sent to it. */
+static const char *failtest_pd =
+	"import sigrokdecode as srd\n"
+	"\n"
+	"class Decoder(srd.Decoder):\n"
+	"    api_version = 3\n"
+	"    id = 'failtest'\n"
+	"    name = 'failtest'\n"
+	"    longname = 'Failure test'\n"
+	"    desc = 'Decoder failure test.'\n"
+	"    license = 'gplv2+'\n"
+	"    inputs = ['logic']\n"
+	"    outputs = []\n"
+	"    tags = ['Debug/trace']\n"
+	"\n"
+	"    def reset(self):\n"
+	"        pass\n"
+	"\n"
+	"    def start(self):\n"
+	"        pass\n"
+	"\n"
+	"    def decode(self):\n"
+	"        while True:\n"
+	"            self.wait({'skip': 100})\n"
+	"            if self.samplenum >= 3500:\n"
+	"                raise Exception('Failing on purpose.')\n";
+
+/*
+ * Check whether a decoder failure within the last queued chunk gets
+ * reported by srd_session_send_eof(), like the synchronous send of
+ * that chunk reports it.
+ */
+START_TEST(test_session_send_queued_error)
+{
+	struct srd_session *sess;
+	char *dir, *pd_dir, *init_file, *pd_file;
+	uint8_t samples[1000];
+	uint64_t offset;
+	unsigned int i, queue_sizes[] = { 0, 4 };
+	int ret;
+
+	dir = g_dir_make_tmp("srd-test-XXXXXX", NULL);
+	fail_unless(dir != NULL, "Cannot create a temporary directory.");
+	pd_dir = g_build_filename(dir, "failtest", NULL);
+	g_mkdir(pd_dir, 0700);
+	init_file = g_build_filename(pd_dir, "__init__.py", NULL);
+	g_file_set_contents(init_file, "from .pd import Decoder\n", -1, NULL);
+	pd_file = g_build_filename(pd_dir, "pd.py", NULL);
+	g_file_set_contents(pd_file, failtest_pd, -1, NULL);
+	g_setenv("PYTHONDONTWRITEBYTECODE", "1", TRUE);
+
+	srd_init(dir);
+	memset(samples, 0, sizeof(samples));
+	for (i = 0; i < G_N_ELEMENTS(queue_sizes); i++) {
+		srd_session_new(&sess);
+		srdtest_inst_new(sess, "failtest", NULL, NULL);
+		srd_session_send_queue_set(sess, queue_sizes[i]);
+		srd_session_start(sess);
+		for (offset = 0; offset < 4000; offset += sizeof(samples)) {
+			ret = srd_session_send(sess, offset,
+				offset + sizeof(samples), samples,
+				sizeof(samples), 1);
+			if (offset < 3000 || queue_sizes[i])
+				fail_unless(ret == SRD_OK, "srd_session_send() "
+					"failed: %d (queue %u).", ret, queue_sizes[i]);
+			else
+				fail_unless(ret != SRD_OK,
+					"Failure of the last chunk went unnoticed.");
+		}
+		ret = srd_session_send_eof(sess);
+		if (queue_sizes[i])
+			fail_unless(ret != SRD_OK,
+				"Failure of the last queued chunk went unnoticed.");
+		srd_session_destroy(sess);
+	}
+	srd_exit();
+
+	g_unsetenv("PYTHONDONTWRITEBYTECODE");
+	g_remove(pd_file);
+	g_remove(init_file);
+	g_rmdir(pd_dir);
+	g_rmdir(dir);
+	g_free(pd_file);
+	g_free(init_file);
+	g_free(pd_dir);
+	g_free(dir);
+}
+END_TEST
+
+/*
+ * Check whether stacked decoders which run on worker threads of their
+ * own (srd_session_stack_queue_set()) yield the same annotations as
+ * synchronously stacked decoders.
+ */
+START_TEST(test_session_stack_queued)
+{
+	GString *transfers;
+	GArray *samples;
+	char *text, *text_queued;
+	int i;
+
+	/* Page writes, and random reads of the written data. */
+	transfers = g_string_new(NULL);
+	for (i = 0; i < 16; i++) {
+		g_string_append_printf(transfers,
+			"S a0 %02x 0%x 1%x 2%x 3%x P ", i * 8, i, i, i, i);
+		g_string_append_printf(transfers,
+			"S a0 %02x S a1 0%x 1%x 2%x 3%xn P ", i * 8, i, i, i, i);
+	}
+	g_string_truncate(transfers, transfers->len - 1);
+	samples = srdtest_i2c_capture(transfers->str, 10);
+	g_string_free(transfers, TRUE);
+
+	srd_init(NULL);
+	text = eeprom_decode(samples, 0);
+	text_queued = eeprom_decode(samples, 4);
+	fail_unless(strstr(text, "eeprom24xx") != NULL,
+		"No eeprom24xx annotations:\n%s", text);
+	fail_unless(g_str_equal(text, text_queued),
+		"Queued stack differs:\n%s\n%s", text_queued, text);
+	g_free(text);
+	g_free(text_queued);
+	g_array_free(samples, TRUE);
+	srd_exit();
+}
+END_TEST
+
+static void output_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	(void)pdata;
+	(void)cb_data;
+}
+
+/*
+ * Check whether several callbacks can be registered for an output type,
+ * and whether invalid output types are rejected.
+ */
+START_TEST(test_session_callback_add_multiple)
+{
+	struct srd_session *sess;
+	int ret;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	ret = srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, output_cb, NULL);
+	fail_unless(ret == SRD_OK, "srd_pd_output_callback_add() failed: %d.", ret);
+	ret = srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, output_cb, NULL);
+	fail_unless(ret == SRD_OK, "Second callback for the same type failed: %d.", ret);
+	ret = srd_pd_output_callback_add(sess, -1, output_cb, NULL);
+	fail_unless(ret != SRD_OK, "Callback for output type -1 was accepted.");
+	ret = srd_pd_output_callback_add(sess, 1000, output_cb, NULL);
+	fail_unless(ret != SRD_OK, "Callback for output type 1000 was accepted.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+static void ann_batch_cb(struct srd_proto_data *pdata,
+		unsigned int num_pdata, void *cb_data)
+{
+	(void)pdata;
+	(void)num_pdata;
+	(void)cb_data;
+}
+
+/*
+ * Check whether srd_pd_output_callback_add_batch() works.
+ * If it returns != SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_callback_add_batch)
+{
+	struct srd_session *sess;
+	int ret;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	ret = srd_pd_output_callback_add_batch(sess, SRD_OUTPUT_ANN,
+		ann_batch_cb, NULL);
+	fail_unless(ret == SRD_OK, "srd_pd_output_callback_add_batch() failed: %d.", ret);
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_pd_output_callback_add_batch() fails with bogus
+ * arguments, and for output types which it doesn't support.
+ */
+START_TEST(test_session_callback_add_batch_bogus)
+{
+	struct srd_session *sess;
+	int ret;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	ret = srd_pd_output_callback_add_batch(NULL, SRD_OUTPUT_ANN,
+		ann_batch_cb, NULL);
+	fail_unless(ret != SRD_OK, "srd_pd_output_callback_add_batch(NULL, ...) succeeded.");
+	ret = srd_pd_output_callback_add_batch(sess, SRD_OUTPUT_ANN, NULL, NULL);
+	fail_unless(ret != SRD_OK, "NULL batch callback was accepted.");
+	ret = srd_pd_output_callback_add_batch(sess, SRD_OUTPUT_BINARY,
+		ann_batch_cb, NULL);
+	fail_unless(ret != SRD_OK, "Batch callback for binary output was accepted.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
 Suite *suite_session(void)
 {
 	Suite *s;
@@ -280,6 +899,24 @@ Suite *suite_session(void)
 	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
 	tcase_add_test(tc, test_session_metadata_set);
 	tcase_add_test(tc, test_session_metadata_set_bogus);
+	tcase_add_test(tc, test_session_inst_hooks);
+	tcase_add_test(tc, test_session_callback_add_multiple);
+	tcase_add_test(tc, test_session_callback_add_batch);
+	tcase_add_test(tc, test_session_callback_add_batch_bogus);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("send");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_session_send_rle);
+	tcase_add_test(tc, test_session_send_rle_bogus);
+	tcase_add_test(tc, test_session_send_file_bogus);
+	tcase_add_test(tc, test_session_send_queue_set);
+	tcase_add_test(tc, test_session_send_queued);
+	tcase_add_test(tc, test_session_send_queued_callbacks);
+	tcase_add_test(tc, test_session_send_queued_error);
+	tcase_add_test(tc, test_session_stack_queue_set);
+	tcase_add_test(tc, test_session_stack_queued);
+	tcase_add_test(tc, test_session_profile);
 	suite_add_tcase(s, tc);
 
 	tc = tcase_create("reset");
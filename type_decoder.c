@@ -21,15 +21,32 @@
 #include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
 #include "libsigrokdecode.h"
 #include <inttypes.h>
-
-/** @cond PRIVATE */
-extern SRD_PRIV GSList *sessions;
-/** @endcond */
+#include <stddef.h>
+#include <structmember.h>
 
 typedef struct {
         PyObject_HEAD
+	/* The decoder instance which this object belongs to. */
+	struct srd_decoder_inst *di;
+	/* Storage of self.samplenum and self.matched. */
+	PyObject *py_samplenum;
+	PyObject *py_matched;
+	/* The most recent .wait() result, re-used when no longer referenced. */
+	PyObject *py_pinvalues;
 } srd_Decoder;
 
+/* Number of annotations which get collected for a batch callback. */
+#define ANN_BATCH_SIZE 256
+
+/* Get an item of an index array, NULL for out of range indices. */
+static inline void *index_lookup(const GPtrArray *index, long idx)
+{
+	if (!index || idx < 0 || (gulong)idx >= index->len)
+		return NULL;
+
+	return g_ptr_array_index(index, idx);
+}
+
 /* This is only used for nicer srd_dbg() output. */
 SRD_PRIV const char *output_type_name(unsigned int idx)
 {
@@ -45,25 +62,17 @@ SRD_PRIV const char *output_type_name(unsigned int idx)
 	return names[MIN(idx, G_N_ELEMENTS(names) - 1)];
 }
 
-static void release_annotation(struct srd_proto_data_annotation *pda)
-{
-	if (!pda)
-		return;
-	if (pda->ann_text)
-		g_strfreev(pda->ann_text);
-}
-
-static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
-		struct srd_proto_data *pdata)
+/*
+ * Check the layout of a decoder's annotation data, get the annotation
+ * class and the (not yet converted) list of texts. The caller must hold
+ * the Python GIL.
+ */
+static int check_annotation(struct srd_decoder_inst *di, PyObject *obj,
+		int *out_class, PyObject **out_texts)
 {
 	PyObject *py_tmp;
 	struct srd_pd_output *pdo;
-	struct srd_proto_data_annotation *pda;
 	int ann_class;
-	char **ann_text;
-	PyGILState_STATE gstate;
-
-	gstate = PyGILState_Ensure();
 
 	/* Should be a list of [annotation class, [string, ...]]. */
 	if (!PyList_Check(obj)) {
@@ -91,7 +100,7 @@ static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
 		goto err;
 	}
 	ann_class = PyLong_AsLong(py_tmp);
-	if (!(pdo = g_slist_nth_data(di->decoder->annotations, ann_class))) {
+	if (!(pdo = index_lookup(di->decoder->annotation_index, ann_class))) {
 		srd_err("Protocol decoder %s submitted data to unregistered annotation class %d.",
 				di->decoder->name, ann_class);
 		goto err;
@@ -104,41 +113,120 @@ static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
 				di->decoder->name);
 		goto err;
 	}
-	if (py_strseq_to_char(py_tmp, &ann_text) != SRD_OK) {
-		srd_err("Protocol decoder %s submitted annotation list, but second element was malformed.",
-				di->decoder->name);
-		goto err;
-	}
 
-	pda = pdata->data;
-	pda->ann_class = ann_class;
-	pda->ann_text = ann_text;
+	*out_class = ann_class;
+	*out_texts = py_tmp;
 
-	PyGILState_Release(gstate);
+	return SRD_OK;
+
+err:
+	return SRD_ERR_PYTHON;
+}
+
+/*
+ * Add an annotation to the instance's pending output, for delivery to
+ * the frontend's callback. Texts are taken from the decoder's table of
+ * interned strings, or are copied to the batch's string arena when the
+ * table is exhausted. The caller must hold the Python GIL.
+ */
+static int batch_annotation(struct srd_decoder_inst *di, PyObject *obj,
+		const struct srd_proto_data *pdata)
+{
+	PyObject *py_texts, *py_item, *py_bytes;
+	struct srd_ann_batch *batch;
+	struct srd_proto_data_annotation pda;
+	const char *text;
+	Py_ssize_t num_texts, i;
+	guint text_start;
+	int ann_class;
+
+	if (check_annotation(di, obj, &ann_class, &py_texts) != SRD_OK)
+		return SRD_ERR_PYTHON;
+
+	batch = annotation_batch_get(di);
+	text_start = batch->texts->len;
+	num_texts = PyList_Size(py_texts);
+	for (i = 0; i < num_texts; i++) {
+		py_item = PyList_GetItem(py_texts, i);
+		if (!PyUnicode_Check(py_item))
+			goto err;
+		text = srd_decoder_string_intern(di->decoder, py_item);
+		if (!text) {
+			if (PyErr_Occurred())
+				goto err;
+			py_bytes = PyUnicode_AsUTF8String(py_item);
+			if (!py_bytes)
+				goto err;
+			text = g_string_chunk_insert(batch->strings,
+				PyBytes_AsString(py_bytes));
+			Py_DECREF(py_bytes);
+		}
+		g_ptr_array_add(batch->texts, (gpointer)text);
+	}
+	g_ptr_array_add(batch->texts, NULL);
+
+	/* Texts get assigned when the batch is delivered. */
+	pda.ann_class = ann_class;
+	pda.ann_text = NULL;
+	g_array_append_val(batch->pda, pda);
+	g_array_append_val(batch->text_start, text_start);
+	g_array_append_vals(batch->pdata, pdata, 1);
 
 	return SRD_OK;
 
 err:
-	PyGILState_Release(gstate);
+	g_ptr_array_set_size(batch->texts, text_start);
+	srd_exception_catch("Failed to obtain string item");
+	srd_err("Protocol decoder %s submitted annotation list, but second element was malformed.",
+			di->decoder->name);
 
 	return SRD_ERR_PYTHON;
 }
 
-static void release_logic(struct srd_proto_data_logic *pdl)
+/*
+ * Get a reference to the data of a bytes-like object. bytes objects get
+ * used in place, bytearray and memoryview objects (which are mutable,
+ * and can be resized) get converted to bytes. The returned object keeps
+ * the data alive, the caller must release it (with the GIL held) when
+ * the data is no longer used. Returns NULL for other types of objects.
+ */
+static PyObject *get_bytes_like(PyObject *py_obj, const uint8_t **data,
+		Py_ssize_t *size)
 {
-	if (!pdl)
-		return;
-	g_free((void *)pdl->data);
+	PyObject *py_ref;
+
+	if (PyBytes_Check(py_obj)) {
+		Py_INCREF(py_obj);
+		py_ref = py_obj;
+	} else if (PyByteArray_Check(py_obj) || PyMemoryView_Check(py_obj)) {
+		py_ref = PyBytes_FromObject(py_obj);
+		if (!py_ref) {
+			PyErr_Clear();
+			return NULL;
+		}
+	} else {
+		return NULL;
+	}
+
+	*data = (const uint8_t *)PyBytes_AsString(py_ref);
+	*size = PyBytes_Size(py_ref);
+
+	return py_ref;
 }
 
+/*
+ * Convert a decoder's logic output. The data is not copied, the caller
+ * must release the returned reference after the data was used.
+ */
 static int convert_logic(struct srd_decoder_inst *di, PyObject *obj,
-		struct srd_proto_data *pdata)
+		struct srd_proto_data *pdata, PyObject **py_ref)
 {
 	struct srd_proto_data_logic *pdl;
-	PyObject *py_tmp;
+	PyObject *py_tmp, *py_buf;
 	Py_ssize_t size;
 	int logic_group;
-	char *group_name, *buf;
+	char *group_name;
+	const uint8_t *buf;
 	PyGILState_STATE gstate;
 
 	gstate = PyGILState_Ensure();
@@ -166,38 +254,35 @@ static int convert_logic(struct srd_decoder_inst *di, PyObject *obj,
 		goto err;
 	}
 	logic_group = PyLong_AsLong(py_tmp);
-	if (!(group_name = g_slist_nth_data(di->decoder->logic_output_channels, logic_group))) {
+	if (!(group_name = index_lookup(di->decoder->logic_output_index, logic_group))) {
 		srd_err("Protocol decoder %s submitted SRD_OUTPUT_LOGIC with "
 			"unregistered logic group %d.", di->decoder->name, logic_group);
 		goto err;
 	}
 
-	/* Second element should be bytes. */
+	/* Second element should be bytes (or bytes-like). */
 	py_tmp = PyList_GetItem(obj, 1);
-	if (!PyBytes_Check(py_tmp)) {
+	if (!(py_buf = get_bytes_like(py_tmp, &buf, &size))) {
 		srd_err("Protocol decoder %s submitted SRD_OUTPUT_LOGIC list, "
 			"but second element was not bytes.", di->decoder->name);
 		goto err;
 	}
 
 	/* Consider an empty set of bytes a bug. */
-	if (PyBytes_Size(py_tmp) == 0) {
+	if (size == 0) {
 		srd_err("Protocol decoder %s submitted SRD_OUTPUT_LOGIC "
 				"with empty data set.", di->decoder->name);
+		Py_DECREF(py_buf);
 		goto err;
 	}
 
-	if (PyBytes_AsStringAndSize(py_tmp, &buf, &size) == -1)
-		goto err;
-
 	PyGILState_Release(gstate);
 
 	pdl = pdata->data;
 	pdl->logic_group = logic_group;
 	/* pdl->repeat_count is set by the caller as it depends on the sample range */
-	if (!(pdl->data = g_try_malloc(size)))
-		return SRD_ERR_MALLOC;
-	memcpy((void *)pdl->data, (const void *)buf, size);
+	pdl->data = buf;
+	*py_ref = py_buf;
 
 	return SRD_OK;
 
@@ -207,21 +292,19 @@ err:
 	return SRD_ERR_PYTHON;
 }
 
-static void release_binary(struct srd_proto_data_binary *pdb)
-{
-	if (!pdb)
-		return;
-	g_free((void *)pdb->data);
-}
-
+/*
+ * Convert a decoder's binary output. The data is not copied, the caller
+ * must release the returned reference after the data was used.
+ */
 static int convert_binary(struct srd_decoder_inst *di, PyObject *obj,
-		struct srd_proto_data *pdata)
+		struct srd_proto_data *pdata, PyObject **py_ref)
 {
 	struct srd_proto_data_binary *pdb;
-	PyObject *py_tmp;
+	PyObject *py_tmp, *py_buf;
 	Py_ssize_t size;
 	int bin_class;
-	char *class_name, *buf;
+	char *class_name;
+	const uint8_t *buf;
 	PyGILState_STATE gstate;
 
 	gstate = PyGILState_Ensure();
@@ -249,38 +332,35 @@ static int convert_binary(struct srd_decoder_inst *di, PyObject *obj,
 		goto err;
 	}
 	bin_class = PyLong_AsLong(py_tmp);
-	if (!(class_name = g_slist_nth_data(di->decoder->binary, bin_class))) {
+	if (!(class_name = index_lookup(di->decoder->binary_index, bin_class))) {
 		srd_err("Protocol decoder %s submitted SRD_OUTPUT_BINARY with unregistered binary class %d.",
 				di->decoder->name, bin_class);
 		goto err;
 	}
 
-	/* Second element should be bytes. */
+	/* Second element should be bytes (or bytes-like). */
 	py_tmp = PyList_GetItem(obj, 1);
-	if (!PyBytes_Check(py_tmp)) {
+	if (!(py_buf = get_bytes_like(py_tmp, &buf, &size))) {
 		srd_err("Protocol decoder %s submitted SRD_OUTPUT_BINARY list, but second element was not bytes.",
 				di->decoder->name);
 		goto err;
 	}
 
 	/* Consider an empty set of bytes a bug. */
-	if (PyBytes_Size(py_tmp) == 0) {
+	if (size == 0) {
 		srd_err("Protocol decoder %s submitted SRD_OUTPUT_BINARY with empty data set.",
 				di->decoder->name);
+		Py_DECREF(py_buf);
 		goto err;
 	}
 
-	if (PyBytes_AsStringAndSize(py_tmp, &buf, &size) == -1)
-		goto err;
-
 	PyGILState_Release(gstate);
 
 	pdb = pdata->data;
 	pdb->bin_class = bin_class;
 	pdb->size = size;
-	if (!(pdb->data = g_try_malloc(pdb->size)))
-		return SRD_ERR_MALLOC;
-	memcpy((void *)pdb->data, (const void *)buf, pdb->size);
+	pdb->data = buf;
+	*py_ref = py_buf;
 
 	return SRD_OK;
 
@@ -290,63 +370,22 @@ err:
 	return SRD_ERR_PYTHON;
 }
 
-static inline struct srd_decoder_inst *srd_sess_inst_find_by_obj(
-	struct srd_session *sess, const GSList *stack, const PyObject *obj)
-{
-	const GSList *l;
-	struct srd_decoder_inst *tmp, *di;
-
-	if (!sess)
-		return NULL;
-
-	di = NULL;
-	for (l = stack ? stack : sess->di_list; di == NULL && l != NULL; l = l->next) {
-		tmp = l->data;
-		if (tmp->py_inst == obj)
-			di = tmp;
-		else if (tmp->next_di)
-			di = srd_sess_inst_find_by_obj(sess, tmp->next_di, obj);
-	}
-
-	return di;
-}
-
 /**
  * Find a decoder instance by its Python object.
  *
  * I.e. find that instance's instantiation of the sigrokdecode.Decoder class.
- * This will recurse to find the instance anywhere in the stack tree of all
- * sessions.
+ * The decoder instance gets attached to the object when it is created, see
+ * srd_Decoder_inst_set().
  *
- * @param stack Pointer to a GSList of struct srd_decoder_inst, indicating the
- *              stack to search. To start searching at the bottom level of
- *              decoder instances, pass NULL.
  * @param obj The Python class instantiation.
  *
  * @return Pointer to struct srd_decoder_inst, or NULL if not found.
  *
  * @since 0.1.0
  */
-static inline struct srd_decoder_inst *srd_inst_find_by_obj(
-		const GSList *stack, const PyObject *obj)
+static inline struct srd_decoder_inst *srd_inst_find_by_obj(PyObject *obj)
 {
-	struct srd_decoder_inst *di;
-	struct srd_session *sess;
-	GSList *l;
-
-	/* Performance shortcut: Handle the most common case first. */
-	sess = sessions->data;
-	di = sess->di_list->data;
-	if (di->py_inst == obj)
-		return di;
-
-	di = NULL;
-	for (l = sessions; di == NULL && l != NULL; l = l->next) {
-		sess = l->data;
-		di = srd_sess_inst_find_by_obj(sess, stack, obj);
-	}
-
-	return di;
+	return ((srd_Decoder *)obj)->di;
 }
 
 static int convert_meta(struct srd_proto_data *pdata, PyObject *obj)
@@ -396,6 +435,41 @@ static void release_meta(GVariant *gvar)
 	g_variant_unref(gvar);
 }
 
+/*
+ * Pass an output record to the (non-batch) callbacks of its type.
+ * Callbacks don't run concurrently, even when several decoder threads
+ * generate output. Must be called without holding the Python GIL.
+ */
+static void output_callbacks_call(struct srd_session *sess,
+		const GPtrArray *cbs, struct srd_proto_data *pdata)
+{
+	struct srd_pd_callback *cb;
+	guint i;
+
+	g_mutex_lock(&sess->callback_mutex);
+	for (i = 0; i < cbs->len; i++) {
+		cb = g_ptr_array_index(cbs, i);
+		if (cb->cb)
+			cb->cb(pdata, cb->cb_data);
+	}
+	g_mutex_unlock(&sess->callback_mutex);
+}
+
+/* Check whether output can be held back for later delivery. */
+static gboolean batch_callbacks_only(const GPtrArray *cbs)
+{
+	struct srd_pd_callback *cb;
+	guint i;
+
+	for (i = 0; i < cbs->len; i++) {
+		cb = g_ptr_array_index(cbs, i);
+		if (!cb->batch_cb)
+			return FALSE;
+	}
+
+	return TRUE;
+}
+
 PyDoc_STRVAR(Decoder_put_doc,
 	"Put an annotation for the specified span of samples.\n"
 	"\n"
@@ -406,23 +480,26 @@ PyDoc_STRVAR(Decoder_put_doc,
 static PyObject *Decoder_put(PyObject *self, PyObject *args)
 {
 	GSList *l;
-	PyObject *py_data, *py_res;
+	PyObject *py_data, *py_res, *py_buf;
 	struct srd_decoder_inst *di, *next_di;
 	struct srd_pd_output *pdo;
 	struct srd_proto_data pdata;
-	struct srd_proto_data_annotation pda;
 	struct srd_proto_data_binary pdb;
 	struct srd_proto_data_logic pdl;
 	uint64_t start_sample, end_sample;
 	int output_id;
+	GPtrArray *cbs;
 	struct srd_pd_callback *cb;
+	guint i;
+	uint64_t start;
+	gboolean profiled;
 	PyGILState_STATE gstate;
 
 	py_data = NULL;
 
 	gstate = PyGILState_Ensure();
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		/* Shouldn't happen. */
 		srd_dbg("put(): self instance not found.");
 		goto err;
@@ -438,12 +515,11 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 		goto err;
 	}
 
-	if (!(l = g_slist_nth(di->pd_output, output_id))) {
+	if (!(pdo = index_lookup(di->pd_output_index, output_id))) {
 		srd_err("Protocol decoder %s submitted invalid output ID %d.",
 			di->decoder->name, output_id);
 		goto err;
 	}
-	pdo = l->data;
 
 	/* Upon SRD_OUTPUT_PYTHON for stacked PDs, we have a nicer log message later. */
 	if (pdo->output_type != SRD_OUTPUT_PYTHON && di->next_di != NULL) {
@@ -453,6 +529,8 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 			 pdo->proto_id);
 	}
 
+	di->stats.put_calls[pdo->output_type]++;
+
 	pdata.start_sample = start_sample;
 	pdata.end_sample = end_sample;
 	pdata.pdo = pdo;
@@ -461,17 +539,19 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 	switch (pdo->output_type) {
 	case SRD_OUTPUT_ANN:
 		/* Annotations are only fed to callbacks. */
-		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
-			pdata.data = &pda;
-			/* Convert from PyDict to srd_proto_data_annotation. */
-			if (convert_annotation(di, py_data, &pdata) != SRD_OK) {
+		if ((cbs = srd_pd_output_callbacks_find(di->sess, pdo->output_type))) {
+			/* Convert from PyList to srd_proto_data_annotation. */
+			if (batch_annotation(di, py_data, &pdata) != SRD_OK) {
 				/* An error was already logged. */
 				break;
 			}
-			Py_BEGIN_ALLOW_THREADS
-			cb->cb(&pdata, cb->cb_data);
-			Py_END_ALLOW_THREADS
-			release_annotation(pdata.data);
+			/* Batch callbacks get several records at once. */
+			if (!batch_callbacks_only(cbs)
+					|| di->ann_batch->pdata->len >= ANN_BATCH_SIZE) {
+				Py_BEGIN_ALLOW_THREADS
+				annotation_batch_flush(di);
+				Py_END_ALLOW_THREADS
+			}
 		}
 		break;
 	case SRD_OUTPUT_PYTHON:
@@ -482,65 +562,84 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 				 start_sample,
 				 end_sample, output_type_name(pdo->output_type),
 				 output_id, pdo->proto_id, next_di->inst_id);
+			if (next_di->stack_queue) {
+				srd_inst_stack_push(next_di, start_sample,
+					end_sample, py_data);
+				continue;
+			}
+			profiled = srd_profile_push(next_di);
+			start = srd_time_ns();
 			py_res = PyObject_CallMethod(next_di->py_inst, "decode",
 				"KKO", start_sample, end_sample, py_data);
+			next_di->stats.python_ns += srd_time_ns() - start;
+			if (profiled)
+				srd_profile_pop();
 			if (!py_res) {
 				srd_exception_catch("Calling %s decode() failed",
 							next_di->inst_id);
 			}
 			Py_XDECREF(py_res);
 		}
-		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
+		if ((cbs = srd_pd_output_callbacks_find(di->sess, pdo->output_type))) {
 			/*
 			 * Frontends aren't really supposed to get Python
 			 * callbacks, but it's useful for testing.
 			 */
 			pdata.data = py_data;
-			cb->cb(&pdata, cb->cb_data);
+			Py_BEGIN_ALLOW_THREADS
+			g_mutex_lock(&di->sess->callback_mutex);
+			Py_END_ALLOW_THREADS
+			for (i = 0; i < cbs->len; i++) {
+				cb = g_ptr_array_index(cbs, i);
+				if (cb->cb)
+					cb->cb(&pdata, cb->cb_data);
+			}
+			g_mutex_unlock(&di->sess->callback_mutex);
 		}
 		break;
 	case SRD_OUTPUT_BINARY:
-		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
+		if ((cbs = srd_pd_output_callbacks_find(di->sess, pdo->output_type))) {
 			pdata.data = &pdb;
 			/* Convert from PyDict to srd_proto_data_binary. */
-			if (convert_binary(di, py_data, &pdata) != SRD_OK) {
+			if (convert_binary(di, py_data, &pdata, &py_buf) != SRD_OK) {
 				/* An error was already logged. */
 				break;
 			}
 			Py_BEGIN_ALLOW_THREADS
-			cb->cb(&pdata, cb->cb_data);
+			output_callbacks_call(di->sess, cbs, &pdata);
 			Py_END_ALLOW_THREADS
-			release_binary(pdata.data);
+			Py_DECREF(py_buf);
 		}
 		break;
 	case SRD_OUTPUT_LOGIC:
-		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
+		if ((cbs = srd_pd_output_callbacks_find(di->sess, pdo->output_type))) {
 			pdata.data = &pdl;
 			/* Convert from PyDict to srd_proto_data_logic. */
-			if (convert_logic(di, py_data, &pdata) != SRD_OK) {
+			if (convert_logic(di, py_data, &pdata, &py_buf) != SRD_OK) {
 				/* An error was already logged. */
 				break;
 			}
 			if (end_sample <= start_sample) {
 				srd_err("Ignored SRD_OUTPUT_LOGIC with invalid sample range.");
+				Py_DECREF(py_buf);
 				break;
 			}
 			pdl.repeat_count = (end_sample - start_sample) - 1;
 			Py_BEGIN_ALLOW_THREADS
-			cb->cb(&pdata, cb->cb_data);
+			output_callbacks_call(di->sess, cbs, &pdata);
 			Py_END_ALLOW_THREADS
-			release_logic(pdata.data);
+			Py_DECREF(py_buf);
 		}
 		break;
 	case SRD_OUTPUT_META:
-		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
+		if ((cbs = srd_pd_output_callbacks_find(di->sess, pdo->output_type))) {
 			/* Annotations need converting from PyObject. */
 			if (convert_meta(&pdata, py_data) != SRD_OK) {
 				/* An exception was already set up. */
 				break;
 			}
 			Py_BEGIN_ALLOW_THREADS
-			cb->cb(&pdata, cb->cb_data);
+			output_callbacks_call(di->sess, cbs, &pdata);
 			Py_END_ALLOW_THREADS
 			release_meta(pdata.data);
 		}
@@ -587,7 +686,7 @@ static PyObject *Decoder_register(PyObject *self,
 	meta_type_gv = NULL;
 	meta_name = meta_descr = NULL;
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		goto err;
 	}
@@ -639,7 +738,7 @@ static PyObject *Decoder_register(PyObject *self,
 	pdo = g_malloc(sizeof(struct srd_pd_output));
 
 	/* pdo_id is just a simple index, nothing is deleted from this list anyway. */
-	pdo->pdo_id = g_slist_length(di->pd_output);
+	pdo->pdo_id = di->pd_output_index->len;
 	pdo->output_type = output_type;
 	pdo->di = di;
 	pdo->proto_id = g_strdup(proto_id);
@@ -651,6 +750,7 @@ static PyObject *Decoder_register(PyObject *self,
 	}
 
 	di->pd_output = g_slist_append(di->pd_output, pdo);
+	g_ptr_array_add(di->pd_output_index, pdo);
 	py_new_output_id = Py_BuildValue("i", pdo->pdo_id);
 
 	PyGILState_Release(gstate);
@@ -704,6 +804,7 @@ static PyObject *get_current_pinvalues(const struct srd_decoder_inst *di)
 	uint8_t sample;
 	const uint8_t *sample_pos;
 	int byte_offset, bit_offset;
+	srd_Decoder *d;
 	PyObject *py_pinvalues;
 	PyGILState_STATE gstate;
 
@@ -714,7 +815,19 @@ static PyObject *get_current_pinvalues(const struct srd_decoder_inst *di)
 
 	gstate = PyGILState_Ensure();
 
-	py_pinvalues = PyTuple_New(di->dec_num_channels);
+	/*
+	 * Re-use the previously returned tuple when nobody but us holds
+	 * a reference to it any longer (which is the case when the
+	 * decoder unpacked the pin values into variables).
+	 */
+	d = (srd_Decoder *)di->py_inst;
+	py_pinvalues = d->py_pinvalues;
+	if (!py_pinvalues || Py_REFCNT(py_pinvalues) != 1 ||
+			PyTuple_Size(py_pinvalues) != di->dec_num_channels) {
+		py_pinvalues = PyTuple_New(di->dec_num_channels);
+		Py_XDECREF(d->py_pinvalues);
+		d->py_pinvalues = py_pinvalues;
+	}
 
 	for (i = 0; i < di->dec_num_channels; i++) {
 		/* A channelmap value of -1 means "unused optional channel". */
@@ -722,51 +835,110 @@ static PyObject *get_current_pinvalues(const struct srd_decoder_inst *di)
 			/* Value of unused channel is 0xff, instead of 0 or 1. */
 			PyTuple_SetItem(py_pinvalues, i, PyLong_FromUnsignedLong(0xff));
 		} else {
-			sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+			sample_pos = srd_inst_sample_pos(di, di->abs_cur_samplenum);
 			byte_offset = di->dec_channelmap[i] / 8;
 			bit_offset = di->dec_channelmap[i] % 8;
 			sample = *(sample_pos + byte_offset) & (1 << bit_offset) ? 1 : 0;
 			PyTuple_SetItem(py_pinvalues, i, PyLong_FromUnsignedLong(sample));
 		}
 	}
+	Py_INCREF(py_pinvalues);
 
 	PyGILState_Release(gstate);
 
 	return py_pinvalues;
 }
 
+/* Set self.samplenum, without a detour through the attribute lookup. */
+static void set_samplenum(struct srd_decoder_inst *di, uint64_t samplenum)
+{
+	srd_Decoder *d;
+	PyObject *py_old;
+
+	d = (srd_Decoder *)di->py_inst;
+	py_old = d->py_samplenum;
+	d->py_samplenum = PyLong_FromUnsignedLongLong(samplenum);
+	Py_XDECREF(py_old);
+}
+
+/**
+ * Set self.matched from the per-condition match results.
+ *
+ * The previous tuple gets updated in place when nobody but the decoder
+ * object references it.
+ *
+ * @param di The decoder instance.
+ * @param matched One byte per condition, non-zero when it matched. Can
+ *                be NULL when num_conditions is 0.
+ * @param num_conditions The number of conditions. self.matched is set
+ *                       to None when this is 0.
+ */
+static void set_matched(struct srd_decoder_inst *di, const uint8_t *matched,
+	unsigned int num_conditions)
+{
+	srd_Decoder *d;
+	PyObject *py_matched, *py_old;
+	unsigned int i;
+
+	d = (srd_Decoder *)di->py_inst;
+	py_old = d->py_matched;
+
+	if (!num_conditions) {
+		Py_INCREF(Py_None);
+		d->py_matched = Py_None;
+		Py_XDECREF(py_old);
+		return;
+	}
+
+	if (py_old && Py_REFCNT(py_old) == 1 && PyTuple_Check(py_old) &&
+			PyTuple_Size(py_old) == num_conditions) {
+		for (i = 0; i < num_conditions; i++)
+			PyTuple_SetItem(py_old, i, PyBool_FromLong(matched[i]));
+		return;
+	}
+
+	py_matched = PyTuple_New(num_conditions);
+	for (i = 0; i < num_conditions; i++)
+		PyTuple_SetItem(py_matched, i, PyBool_FromLong(matched[i]));
+	d->py_matched = py_matched;
+	Py_XDECREF(py_old);
+}
+
 /**
- * Create a list of terms in the specified condition.
+ * Create the terms of the specified condition.
  *
- * If there are no terms in the condition, 'term_list' will be NULL.
+ * The terms get appended to the decoder instance's term list. Each term
+ * keeps a reference to the dict item (key and value) it was created from.
+ * If there are no terms in the condition, the condition will be empty.
  *
  * @param di The decoder instance to use. Must not be NULL.
  * @param py_dict A Python dict containing terms. Must not be NULL.
- * @param term_list Pointer to a GSList which will be set to the newly
- *                  created list of terms. Must not be NULL.
+ * @param cond The condition which receives the terms. Must not be NULL.
  *
  * @return SRD_OK upon success, a negative error code otherwise.
  */
 static int create_term_list(struct srd_decoder_inst *di,
-	PyObject *py_dict, GSList **term_list)
+	PyObject *py_dict, struct srd_condition *cond)
 {
 	Py_ssize_t pos = 0;
 	PyObject *py_key, *py_value;
-	struct srd_term *term;
+	struct srd_term term;
 	int64_t num_samples_to_skip;
 	char *term_str;
 	PyGILState_STATE gstate;
 
-	if (!py_dict || !term_list)
+	if (!py_dict || !cond)
 		return SRD_ERR_ARG;
 
-	/* "Create" an empty GSList of terms. */
-	*term_list = NULL;
+	/* Start with an empty condition. */
+	cond->first_term = di->term_list->len;
+	cond->num_terms = 0;
 
 	gstate = PyGILState_Ensure();
 
 	/* Iterate over all items in the current dict. */
 	while (PyDict_Next(py_dict, &pos, &py_key, &py_value)) {
+		memset(&term, 0, sizeof(term));
 		/* Check whether the current key is a string or a number. */
 		if (PyLong_Check(py_key)) {
 			/* The key is a number. */
@@ -775,11 +947,10 @@ static int create_term_list(struct srd_decoder_inst *di,
 				srd_err("Failed to get the value.");
 				goto err;
 			}
-			term = g_malloc(sizeof(struct srd_term));
-			term->type = get_term_type(term_str);
-			term->channel = PyLong_AsLong(py_key);
-			if (term->channel < 0 || term->channel >= di->dec_num_channels)
-				term->type = SRD_TERM_ALWAYS_FALSE;
+			term.type = get_term_type(term_str);
+			term.channel = PyLong_AsLong(py_key);
+			if (term.channel < 0 || term.channel >= di->dec_num_channels)
+				term.type = SRD_TERM_ALWAYS_FALSE;
 			g_free(term_str);
 		} else if (PyUnicode_Check(py_key)) {
 			/* The key is a string. */
@@ -788,19 +959,23 @@ static int create_term_list(struct srd_decoder_inst *di,
 				srd_err("Failed to get number of samples to skip.");
 				goto err;
 			}
-			term = g_malloc(sizeof(struct srd_term));
-			term->type = SRD_TERM_SKIP;
-			term->num_samples_to_skip = num_samples_to_skip;
-			term->num_samples_already_skipped = 0;
+			term.type = SRD_TERM_SKIP;
+			term.num_samples_to_skip = num_samples_to_skip;
+			term.num_samples_already_skipped = 0;
 			if (num_samples_to_skip < 0)
-				term->type = SRD_TERM_ALWAYS_FALSE;
+				term.type = SRD_TERM_ALWAYS_FALSE;
 		} else {
 			srd_err("Term key is neither a string nor a number.");
 			goto err;
 		}
 
 		/* Add the term to the list of terms. */
-		*term_list = g_slist_append(*term_list, term);
+		Py_INCREF(py_key);
+		Py_INCREF(py_value);
+		term.py_key = py_key;
+		term.py_value = py_value;
+		g_array_append_val(di->term_list, term);
+		cond->num_terms++;
 	}
 
 	PyGILState_Release(gstate);
@@ -813,6 +988,230 @@ err:
 	return SRD_ERR;
 }
 
+/* Number of previously used condition lists which are kept per instance. */
+#define COND_CACHE_SIZE 8
+
+static gboolean same_py_item(PyObject *py_old, PyObject *py_new)
+{
+	int ret;
+
+	if (py_old == py_new)
+		return TRUE;
+	if (!py_old || Py_TYPE(py_old) != Py_TYPE(py_new))
+		return FALSE;
+
+	ret = PyObject_RichCompareBool(py_old, py_new, Py_EQ);
+	if (ret < 0) {
+		PyErr_Clear();
+		return FALSE;
+	}
+
+	return ret == 1;
+}
+
+/**
+ * Check whether a condition list was created from the same conditions.
+ *
+ * Compares the dict items of all conditions (in dict order) against the
+ * items which the terms were created from, by identity first, and by
+ * value for objects of the same type. Decoders may pass the same
+ * (possibly modified) objects, or new objects with the same content.
+ *
+ * @param condition_list The conditions to check. Must not be NULL.
+ * @param term_list The conditions' terms. Must not be NULL.
+ * @param py_conditionlist A Python list of dicts. Must not be NULL.
+ *
+ * @return TRUE if the condition list matches the Python conditions,
+ *         FALSE otherwise.
+ */
+static gboolean condition_list_unchanged(const GArray *condition_list,
+	const GArray *term_list, PyObject *py_conditionlist)
+{
+	Py_ssize_t pos, i, num_conditions;
+	PyObject *py_dict, *py_key, *py_value;
+	const struct srd_condition *cond;
+	const struct srd_term *term;
+
+	num_conditions = PyList_Size(py_conditionlist);
+	if (num_conditions != (Py_ssize_t)condition_list->len)
+		return FALSE;
+
+	for (i = 0; i < num_conditions; i++) {
+		py_dict = PyList_GetItem(py_conditionlist, i);
+		if (!PyDict_Check(py_dict))
+			return FALSE;
+		cond = &g_array_index(condition_list, struct srd_condition, i);
+		if (PyDict_Size(py_dict) != (Py_ssize_t)cond->num_terms)
+			return FALSE;
+		term = &g_array_index(term_list, struct srd_term, cond->first_term);
+		pos = 0;
+		while (PyDict_Next(py_dict, &pos, &py_key, &py_value)) {
+			if (!same_py_item(term->py_key, py_key))
+				return FALSE;
+			if (!same_py_item(term->py_value, py_value))
+				return FALSE;
+			term++;
+		}
+	}
+
+	return TRUE;
+}
+
+/**
+ * Calculate a hash of the content of a condition list.
+ *
+ * The hash covers the number of conditions, the number of terms per
+ * condition, and all keys and values in dict order.
+ *
+ * @param py_conditionlist A Python list of dicts. Must not be NULL.
+ * @param hash Pointer to the resulting hash value. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a negative error code for conditions
+ *         which can't get hashed.
+ */
+static int condition_list_hash(PyObject *py_conditionlist, uint64_t *hash)
+{
+	Py_ssize_t pos, i, num_conditions;
+	PyObject *py_dict, *py_key, *py_value;
+	Py_hash_t py_hash;
+	uint64_t h;
+
+	num_conditions = PyList_Size(py_conditionlist);
+	h = (uint64_t)num_conditions;
+	for (i = 0; i < num_conditions; i++) {
+		py_dict = PyList_GetItem(py_conditionlist, i);
+		if (!PyDict_Check(py_dict))
+			return SRD_ERR;
+		h = (h ^ (uint64_t)PyDict_Size(py_dict)) * 1000003;
+		pos = 0;
+		while (PyDict_Next(py_dict, &pos, &py_key, &py_value)) {
+			if ((py_hash = PyObject_Hash(py_key)) == -1)
+				goto err;
+			h = (h ^ (uint64_t)py_hash) * 1000003;
+			if ((py_hash = PyObject_Hash(py_value)) == -1)
+				goto err;
+			h = (h ^ (uint64_t)py_hash) * 1000003;
+		}
+	}
+	*hash = h;
+
+	return SRD_OK;
+
+err:
+	PyErr_Clear();
+
+	return SRD_ERR;
+}
+
+/* Exchange the instance's current condition list with a cache entry. */
+static void cond_cache_swap(struct srd_decoder_inst *di,
+	struct srd_cond_cache_entry *entry, uint64_t hash, gboolean have_hash)
+{
+	GArray *condition_list, *term_list;
+	struct srd_cond_program *cond_program;
+	uint64_t entry_hash;
+
+	condition_list = di->cond_list;
+	term_list = di->term_list;
+	cond_program = di->cond_program;
+	entry_hash = di->cond_cache->hash;
+
+	di->cond_list = entry->condition_list;
+	di->term_list = entry->term_list;
+	di->cond_program = entry->cond_program;
+	di->cond_cache->hash = hash;
+	di->cond_cache->have_hash = have_hash;
+
+	entry->condition_list = condition_list;
+	entry->term_list = term_list;
+	entry->cond_program = cond_program;
+	entry->hash = entry_hash;
+}
+
+/*
+ * Look up a previously used condition list which matches the Python
+ * conditions. The entry gets removed from the cache.
+ */
+static struct srd_cond_cache_entry *cond_cache_take(struct srd_decoder_inst *di,
+	uint64_t hash, PyObject *py_conditionlist)
+{
+	struct srd_cond_cache *cache;
+	struct srd_cond_cache_entry *entry;
+	GSList *l;
+
+	cache = di->cond_cache;
+	for (l = cache->entries; l; l = l->next) {
+		entry = l->data;
+		if (entry->hash != hash)
+			continue;
+		if (!condition_list_unchanged(entry->condition_list,
+				entry->term_list, py_conditionlist))
+			continue;
+		cache->entries = g_slist_delete_link(cache->entries, l);
+		cache->num_entries--;
+		return entry;
+	}
+
+	return NULL;
+}
+
+/*
+ * Add an entry (which holds the previously current condition list) to
+ * the cache, when that list was created from Python conditions. Evicts
+ * the least recently used entry when the cache is full.
+ */
+static void cond_cache_put(struct srd_decoder_inst *di,
+	struct srd_cond_cache_entry *entry, gboolean cacheable)
+{
+	struct srd_cond_cache *cache;
+	GSList *l;
+
+	cache = di->cond_cache;
+	if (!cacheable || !entry->condition_list->len) {
+		condition_cache_entry_free(entry);
+		return;
+	}
+
+	if (cache->num_entries >= COND_CACHE_SIZE) {
+		l = g_slist_last(cache->entries);
+		condition_cache_entry_free(l->data);
+		cache->entries = g_slist_delete_link(cache->entries, l);
+		cache->num_entries--;
+	}
+	cache->entries = g_slist_prepend(cache->entries, entry);
+	cache->num_entries++;
+}
+
+/*
+ * Move the current condition list to the cache (when it was created from
+ * Python conditions), and leave empty lists for the instance.
+ */
+static void cond_cache_stash(struct srd_decoder_inst *di)
+{
+	struct srd_cond_cache_entry *entry;
+
+	if (!di->cond_cache->have_hash || !di->cond_list->len)
+		return;
+
+	entry = g_malloc0(sizeof(*entry));
+	entry->condition_list = g_array_new(FALSE, TRUE, sizeof(struct srd_condition));
+	entry->term_list = g_array_new(FALSE, TRUE, sizeof(struct srd_term));
+	cond_cache_swap(di, entry, 0, FALSE);
+	cond_cache_put(di, entry, TRUE);
+}
+
+/* Prepare a kept condition list for another .wait() call. */
+static void condition_list_rewind(struct srd_decoder_inst *di)
+{
+	struct srd_term *term;
+	unsigned int i;
+
+	for (i = 0; i < di->term_list->len; i++) {
+		term = &g_array_index(di->term_list, struct srd_term, i);
+		term->num_samples_already_skipped = 0;
+	}
+}
+
 /**
  * Replace the current condition list with the new one.
  *
@@ -821,15 +1220,18 @@ err:
  *
  * @retval SRD_OK The new condition list was set successfully.
  * @retval SRD_ERR There was an error setting the new condition list.
- *                 The contents of di->condition_list are undefined.
+ *                 The contents of di->cond_list are undefined.
  * @retval 9999 TODO.
  */
 static int set_new_condition_list(PyObject *self, PyObject *args)
 {
 	struct srd_decoder_inst *di;
-	GSList *term_list;
+	struct srd_condition cond;
+	struct srd_cond_cache_entry *entry;
 	PyObject *py_conditionlist, *py_conds, *py_dict;
 	int i, num_conditions, ret;
+	uint64_t hash = 0;
+	gboolean have_hash, cacheable;
 	PyGILState_STATE gstate;
 
 	if (!self || !args)
@@ -838,7 +1240,7 @@ static int set_new_condition_list(PyObject *self, PyObject *args)
 	gstate = PyGILState_Ensure();
 
 	/* Get the decoder instance. */
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		goto err;
 	}
@@ -888,12 +1290,40 @@ static int set_new_condition_list(PyObject *self, PyObject *args)
 		goto err;
 	}
 
+	/* Keep the current condition list if the conditions didn't change. */
+	if (condition_list_unchanged(di->cond_list, di->term_list,
+			py_conditionlist)) {
+		condition_list_rewind(di);
+		Py_DecRef(py_conditionlist);
+		PyGILState_Release(gstate);
+		return SRD_OK;
+	}
+
+	/*
+	 * Re-activate a recently used condition list with the same content,
+	 * or move the current list to the cache and create a new one.
+	 */
+	have_hash = condition_list_hash(py_conditionlist, &hash) == SRD_OK;
+	cacheable = di->cond_cache->have_hash;
+	entry = have_hash ? cond_cache_take(di, hash, py_conditionlist) : NULL;
+	if (entry) {
+		cond_cache_swap(di, entry, hash, have_hash);
+		cond_cache_put(di, entry, cacheable);
+		condition_list_rewind(di);
+		Py_DecRef(py_conditionlist);
+		PyGILState_Release(gstate);
+		return SRD_OK;
+	}
+	cond_cache_stash(di);
+	di->cond_cache->hash = hash;
+	di->cond_cache->have_hash = have_hash;
+
 	/* Free the old condition list. */
 	condition_list_free(di);
 
 	ret = SRD_OK;
 
-	/* Iterate over the conditions, set di->condition_list accordingly. */
+	/* Iterate over the conditions, set di->cond_list accordingly. */
 	for (i = 0; i < num_conditions; i++) {
 		/* Get a condition (dict) from the condition list. */
 		py_dict = PyList_GetItem(py_conditionlist, i);
@@ -904,11 +1334,11 @@ static int set_new_condition_list(PyObject *self, PyObject *args)
 		}
 
 		/* Create the list of terms in this condition. */
-		if ((ret = create_term_list(di, py_dict, &term_list)) < 0)
+		if ((ret = create_term_list(di, py_dict, &cond)) < 0)
 			break;
 
 		/* Add the new condition to the PD instance's condition list. */
-		di->condition_list = g_slist_append(di->condition_list, term_list);
+		g_array_append_val(di->cond_list, cond);
 	}
 
 	Py_DecRef(py_conditionlist);
@@ -936,7 +1366,7 @@ ret_9999:
  *
  * @retval SRD_OK The new condition list was set successfully.
  * @retval SRD_ERR There was an error setting the new condition list.
- *                 The contents of di->condition_list are undefined.
+ *                 The contents of di->cond_list are undefined.
  *
  * This routine is a reduced and specialized version of the @ref
  * set_new_condition_list() and @ref create_term_list() routines which
@@ -949,16 +1379,30 @@ ret_9999:
  */
 static int set_skip_condition(struct srd_decoder_inst *di, uint64_t count)
 {
-	struct srd_term *term;
-	GSList *term_list;
+	struct srd_term term, *cur;
+	struct srd_condition cond;
+
+	/* Re-use a previous SKIP condition, only update the count. */
+	if (di->cond_list->len == 1 && di->term_list->len == 1) {
+		cur = &g_array_index(di->term_list, struct srd_term, 0);
+		if (cur->type == SRD_TERM_SKIP && !cur->py_key) {
+			cur->num_samples_to_skip = count;
+			cur->num_samples_already_skipped = 0;
+			return SRD_OK;
+		}
+	}
 
+	cond_cache_stash(di);
 	condition_list_free(di);
-	term = g_malloc(sizeof(*term));
-	term->type = SRD_TERM_SKIP;
-	term->num_samples_to_skip = count;
-	term->num_samples_already_skipped = 0;
-	term_list = g_slist_append(NULL, term);
-	di->condition_list = g_slist_append(di->condition_list, term_list);
+	di->cond_cache->have_hash = FALSE;
+	memset(&term, 0, sizeof(term));
+	term.type = SRD_TERM_SKIP;
+	term.num_samples_to_skip = count;
+	term.num_samples_already_skipped = 0;
+	g_array_append_val(di->term_list, term);
+	cond.first_term = 0;
+	cond.num_terms = 1;
+	g_array_append_val(di->cond_list, cond);
 
 	return SRD_OK;
 }
@@ -980,31 +1424,29 @@ PyDoc_STRVAR(Decoder_wait_doc,
 	"'skip' to advance over the given number of samples.\n"
 );
 
-static PyObject *Decoder_wait(PyObject *self, PyObject *args)
+/**
+ * Setup the condition list for a .wait() or .wait_many() call.
+ *
+ * @param self The decoder object.
+ * @param di The decoder instance.
+ * @param args The .wait() arguments (a tuple holding the conditions).
+ * @param no_conds Will be set to TRUE when the conditions are empty, and
+ *                 a SKIP condition was set up instead. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a negative error code otherwise.
+ */
+static int set_wait_conditions(PyObject *self, struct srd_decoder_inst *di,
+	PyObject *args, gboolean *no_conds)
 {
 	int ret;
 	uint64_t skip_count;
-	unsigned int i;
-	gboolean found_match;
-	struct srd_decoder_inst *di;
-	PyObject *py_pinvalues, *py_matched, *py_samplenum;
-	PyGILState_STATE gstate;
-
-	if (!self || !args)
-		return NULL;
 
-	gstate = PyGILState_Ensure();
-
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
-		PyErr_SetString(PyExc_Exception, "decoder instance not found");
-		PyGILState_Release(gstate);
-		Py_RETURN_NONE;
-	}
+	*no_conds = FALSE;
 
 	ret = set_new_condition_list(self, args);
 	if (ret < 0) {
 		srd_dbg("%s: %s: Aborting wait().", di->inst_id, __func__);
-		goto err;
+		return ret;
 	}
 	if (ret == 9999) {
 		/*
@@ -1016,7 +1458,7 @@ static PyObject *Decoder_wait(PyObject *self, PyObject *args)
 		 */
 		if (di->abs_cur_samplenum)
 			skip_count = 1;
-		else if (!di->condition_list)
+		else if (!di->cond_list->len)
 			skip_count = 0;
 		else
 			skip_count = 1;
@@ -1024,18 +1466,189 @@ static PyObject *Decoder_wait(PyObject *self, PyObject *args)
 		if (ret < 0) {
 			srd_dbg("%s: %s: Cannot setup condition-less wait().",
 				di->inst_id, __func__);
-			goto err;
+			return ret;
 		}
+		*no_conds = TRUE;
+	}
+
+	return SRD_OK;
+}
+
+/*
+ * Account for a wait() or wait_many() call: The decoder's Python code
+ * ran since the previous return from one of these methods.
+ */
+static void stats_wait_begin(struct srd_decoder_inst *di)
+{
+	srd_profile_state_set(SRD_PROF_BLOCKED);
+	di->stats.wait_calls++;
+	if (di->stats_python_start)
+		di->stats.python_ns += srd_time_ns() - di->stats_python_start;
+	di->stats_python_start = 0;
+}
+
+/* Account for the return from wait() or wait_many() to Python code. */
+static void stats_wait_end(struct srd_decoder_inst *di, unsigned int matches)
+{
+	di->stats.matches += matches;
+	di->stats_python_start = srd_time_ns();
+	srd_profile_state_set(SRD_PROF_PYTHON);
+}
+
+/*
+ * Wait for new samples to process, or a termination request. Returns
+ * with the data mutex held, and the timestamp at which it got taken.
+ */
+static uint64_t wait_new_samples(struct srd_decoder_inst *di)
+{
+	uint64_t start, now;
+
+	srd_profile_state_set(SRD_PROF_BLOCKED);
+	start = srd_time_ns();
+	g_mutex_lock(&di->data_mutex);
+	while (!di->got_new_samples && !di->want_wait_terminate)
+		g_cond_wait(&di->got_new_samples_cond, &di->data_mutex);
+	now = srd_time_ns();
+	di->stats.blocked_ns += now - start;
+	srd_profile_state_set(SRD_PROF_SCAN);
+
+	return now;
+}
+
+/* Account for the samples which the condition checks advanced over. */
+static void stats_scan_done(struct srd_decoder_inst *di, uint64_t start,
+	uint64_t samplenum)
+{
+	di->stats.scan_ns += srd_time_ns() - start;
+	if (di->abs_cur_samplenum > samplenum)
+		di->stats.samples_scanned += di->abs_cur_samplenum - samplenum;
+	srd_profile_state_set(SRD_PROF_BLOCKED);
+}
+
+/*
+ * Flush an instance from within .wait(). srd_inst_flush() takes the GIL
+ * itself where it calls into Python, and takes callback_mutex (which
+ * must never be locked with the GIL held) or waits for stack queues.
+ */
+static void wait_flush(struct srd_decoder_inst *di)
+{
+	Py_BEGIN_ALLOW_THREADS
+	srd_inst_flush(di);
+	Py_END_ALLOW_THREADS
+}
+
+/**
+ * Release the current chunk after all of its samples were handled.
+ *
+ * Gets called with the data mutex held, and releases it.
+ *
+ * @param di The decoder instance.
+ *
+ * @retval SRD_OK Keep waiting for more samples.
+ * @retval SRD_ERR Return from .wait(), because EOF was communicated (an
+ *                 EOFError exception was set), or termination was requested.
+ */
+static int wait_release_chunk(struct srd_decoder_inst *di)
+{
+	gboolean queued;
+
+	/*
+	 * Queued chunks are released here, which continues with the next
+	 * one (if any) right away. The flush which srd_inst_decode() runs
+	 * after synchronous chunks happens here, too.
+	 */
+	queued = di->chunk_queue && di->chunk_queue->count;
+	if (queued && srd_inst_next_chunk(di)) {
+		g_mutex_unlock(&di->data_mutex);
+		wait_flush(di);
+		return SRD_OK;
+	}
+
+	/* No match, reset state for the next chunk. */
+	di->got_new_samples = FALSE;
+	di->handled_all_samples = TRUE;
+	di->abs_start_samplenum = 0;
+	di->abs_end_samplenum = 0;
+	di->inbuf = NULL;
+	di->inbuflen = 0;
+	di->inbuf_run_ends = NULL;
+	di->inbuf_num_runs = 0;
+
+	/* Signal the main thread that we handled all samples. */
+	g_cond_signal(&di->handled_all_samples_cond);
+
+	if (queued) {
+		g_mutex_unlock(&di->data_mutex);
+		wait_flush(di);
+		return SRD_OK;
+	}
+
+	/*
+	 * When EOF was provided externally, communicate the
+	 * Python EOFError exception to .decode() and return
+	 * from the .wait() method call. This is motivated by
+	 * the use of Python context managers, so that .decode()
+	 * methods can "close" incompletely accumulated data
+	 * when the sample data is exhausted.
+	 */
+	if (di->communicate_eof) {
+		/* Advance self.samplenum to the (absolute) last sample number. */
+		set_samplenum(di, di->abs_cur_samplenum);
+		/* Raise an EOFError Python exception. */
+		srd_dbg("%s: %s: Raising EOF from wait().",
+			di->inst_id, __func__);
+		g_mutex_unlock(&di->data_mutex);
+		PyErr_SetString(PyExc_EOFError, "samples exhausted");
+		return SRD_ERR;
+	}
+
+	/*
+	 * When termination of wait() and decode() was requested,
+	 * then exit the loop after releasing the mutex.
+	 */
+	if (di->want_wait_terminate) {
+		srd_dbg("%s: %s: Will return from wait().",
+			di->inst_id, __func__);
+		g_mutex_unlock(&di->data_mutex);
+		return SRD_ERR;
+	}
+
+	g_mutex_unlock(&di->data_mutex);
+
+	return SRD_OK;
+}
+
+static PyObject *Decoder_wait(PyObject *self, PyObject *args)
+{
+	gboolean found_match, no_conds;
+	uint64_t start, samplenum;
+	struct srd_decoder_inst *di;
+	PyObject *py_pinvalues;
+	PyGILState_STATE gstate;
+
+	if (!self || !args)
+		return NULL;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		PyGILState_Release(gstate);
+		Py_RETURN_NONE;
 	}
 
+	stats_wait_begin(di);
+
+	if (set_wait_conditions(self, di, args, &no_conds) < 0)
+		goto err;
+
 	while (1) {
 
 		Py_BEGIN_ALLOW_THREADS
 
 		/* Wait for new samples to process, or termination request. */
-		g_mutex_lock(&di->data_mutex);
-		while (!di->got_new_samples && !di->want_wait_terminate)
-			g_cond_wait(&di->got_new_samples_cond, &di->data_mutex);
+		start = wait_new_samples(di);
+		samplenum = di->abs_cur_samplenum;
 
 		/*
 		 * Check whether any of the current condition(s) match.
@@ -1048,87 +1661,263 @@ static PyObject *Decoder_wait(PyObject *self, PyObject *args)
 
 		/* Ignore return value for now, should never be negative. */
 		(void)process_samples_until_condition_match(di, &found_match);
+		stats_scan_done(di, start, samplenum);
 
 		Py_END_ALLOW_THREADS
 
 		/* If there's a match, set self.samplenum etc. and return. */
 		if (found_match) {
 			/* Set self.samplenum to the (absolute) sample number that matched. */
-			py_samplenum = PyLong_FromUnsignedLongLong(di->abs_cur_samplenum);
-			PyObject_SetAttrString(di->py_inst, "samplenum", py_samplenum);
-			Py_DECREF(py_samplenum);
+			set_samplenum(di, di->abs_cur_samplenum);
 
 			if (di->match_array && di->match_array->len > 0) {
-				py_matched = PyTuple_New(di->match_array->len);
-				for (i = 0; i < di->match_array->len; i++)
-					PyTuple_SetItem(py_matched, i, PyBool_FromLong(di->match_array->data[i]));
-				PyObject_SetAttrString(di->py_inst, "matched", py_matched);
-				Py_DECREF(py_matched);
+				set_matched(di, (const uint8_t *)di->match_array->data,
+					di->match_array->len);
 				match_array_free(di);
 			} else {
-				PyObject_SetAttrString(di->py_inst, "matched", Py_None);
+				set_matched(di, NULL, 0);
 			}
 
 			py_pinvalues = get_current_pinvalues(di);
 
 			g_mutex_unlock(&di->data_mutex);
 
+			stats_wait_end(di, 1);
 			PyGILState_Release(gstate);
 
 			return py_pinvalues;
 		}
 
-		/* No match, reset state for the next chunk. */
-		di->got_new_samples = FALSE;
-		di->handled_all_samples = TRUE;
-		di->abs_start_samplenum = 0;
-		di->abs_end_samplenum = 0;
-		di->inbuf = NULL;
-		di->inbuflen = 0;
+		if (wait_release_chunk(di) != SRD_OK)
+			goto err;
+	}
+
+	PyGILState_Release(gstate);
 
-		/* Signal the main thread that we handled all samples. */
-		g_cond_signal(&di->handled_all_samples_cond);
+	Py_RETURN_NONE;
 
-		/*
-		 * When EOF was provided externally, communicate the
-		 * Python EOFError exception to .decode() and return
-		 * from the .wait() method call. This is motivated by
-		 * the use of Python context managers, so that .decode()
-		 * methods can "close" incompletely accumulated data
-		 * when the sample data is exhausted.
-		 */
-		if (di->communicate_eof) {
-			/* Advance self.samplenum to the (absolute) last sample number. */
-			py_samplenum = PyLong_FromUnsignedLongLong(di->abs_cur_samplenum);
-			PyObject_SetAttrString(di->py_inst, "samplenum", py_samplenum);
-			Py_DECREF(py_samplenum);
-			/* Raise an EOFError Python exception. */
-			srd_dbg("%s: %s: Raising EOF from wait().",
-				di->inst_id, __func__);
-			g_mutex_unlock(&di->data_mutex);
-			PyErr_SetString(PyExc_EOFError, "samples exhausted");
-			goto err;
+err:
+	stats_wait_end(di, 0);
+	PyGILState_Release(gstate);
+
+	return NULL;
+}
+
+/* Store the pin values of the current sample, like .wait() returns them. */
+static void store_current_pinvalues(const struct srd_decoder_inst *di,
+	uint8_t *pinvalues)
+{
+	int i;
+	const uint8_t *sample_pos;
+	int byte_offset, bit_offset;
+
+	sample_pos = srd_inst_sample_pos(di, di->abs_cur_samplenum);
+	for (i = 0; i < di->dec_num_channels; i++) {
+		/* Value of unused optional channels is 0xff. */
+		if (di->dec_channelmap[i] == -1) {
+			pinvalues[i] = 0xff;
+			continue;
 		}
+		byte_offset = di->dec_channelmap[i] / 8;
+		bit_offset = di->dec_channelmap[i] % 8;
+		pinvalues[i] = *(sample_pos + byte_offset) & (1 << bit_offset) ? 1 : 0;
+	}
+}
+
+/*
+ * The array.array type, looked up when the Decoder type gets created
+ * (once per Python interpreter, like the sigrokdecode module itself).
+ */
+static PyObject *py_array_type;
+
+/* Create an array.array of the given type code from raw (native) data. */
+static PyObject *new_py_array(const char *typecode, const void *data, size_t size)
+{
+	PyObject *py_bytes, *py_array;
+
+	if (!py_array_type) {
+		PyErr_SetString(PyExc_RuntimeError, "array type not available");
+		return NULL;
+	}
+	py_bytes = PyBytes_FromStringAndSize(data, size);
+	if (!py_bytes)
+		return NULL;
+	py_array = PyObject_CallFunction(py_array_type, "sO", typecode, py_bytes);
+	Py_DECREF(py_bytes);
+
+	return py_array;
+}
+
+PyDoc_STRVAR(Decoder_wait_many_doc,
+	"Wait for several occurrences of one or more conditions.\n"
+	"\n"
+	"Takes the same conditions as wait(), and the maximum number of\n"
+	"matches to return. Behaves like repeated wait() calls with the same\n"
+	"conditions, but only blocks until the first match. Subsequent\n"
+	"matches are taken from the currently available sample data, up to\n"
+	"max_matches. The next wait() or wait_many() call continues after\n"
+	"the last returned match. Conditions which only check pin levels\n"
+	"keep matching at the same sample (like repeated wait() calls do),\n"
+	"such a sample is returned once per call. Add edge or 'skip'\n"
+	"conditions to advance.\n"
+	"\n"
+	"Returns a tuple of three arrays: The sample numbers of the matches\n"
+	"(type 'Q'), bitmasks of the conditions which matched (type 'Q', bit\n"
+	"N for condition N, up to 64 conditions), and the pin values (type\n"
+	"'B', one item per channel and match, 0xff for unused channels).\n"
+	"self.samplenum and self.matched reflect the last match. EOFError\n"
+	"is raised when the samples are exhausted before the first match.\n"
+);
+
+static PyObject *Decoder_wait_many(PyObject *self, PyObject *args)
+{
+	Py_ssize_t max_matches;
+	unsigned int i, num_conditions;
+	uint64_t mask;
+	uint8_t *matched;
+	gboolean found_match, no_conds;
+	uint64_t start, samplenum;
+	struct srd_decoder_inst *di;
+	PyObject *py_conds, *py_args;
+	PyObject *py_samplenums, *py_masks, *py_pinvalues, *py_ret;
+	GArray *samplenums, *masks, *pinvalues;
+	PyGILState_STATE gstate;
+
+	if (!self || !args)
+		return NULL;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		PyGILState_Release(gstate);
+		Py_RETURN_NONE;
+	}
+
+	stats_wait_begin(di);
+
+	if (!PyArg_ParseTuple(args, "On", &py_conds, &max_matches))
+		goto err;
+	if (max_matches < 1) {
+		PyErr_SetString(PyExc_ValueError, "max_matches must be positive");
+		goto err;
+	}
+
+	py_args = Py_BuildValue("(O)", py_conds);
+	if (!py_args)
+		goto err;
+	if (set_wait_conditions(self, di, py_args, &no_conds) < 0) {
+		Py_DECREF(py_args);
+		goto err;
+	}
+	Py_DECREF(py_args);
+
+	samplenums = g_array_new(FALSE, FALSE, sizeof(uint64_t));
+	masks = g_array_new(FALSE, FALSE, sizeof(uint64_t));
+	pinvalues = g_array_new(FALSE, FALSE, sizeof(uint8_t));
+	num_conditions = 0;
+
+	while (1) {
+
+		Py_BEGIN_ALLOW_THREADS
+
+		/* Wait for new samples to process, or termination request. */
+		start = wait_new_samples(di);
+		samplenum = di->abs_cur_samplenum;
+
+		found_match = FALSE;
+		(void)process_samples_until_condition_match(di, &found_match);
+
+		/* Collect further matches from the current chunk. */
+		while (found_match) {
+			g_array_append_val(samplenums, di->abs_cur_samplenum);
+			mask = 0;
+			num_conditions = di->match_array ? di->match_array->len : 0;
+			for (i = 0; i < num_conditions && i < 64; i++) {
+				if (di->match_array->data[i])
+					mask |= (uint64_t)1 << i;
+			}
+			g_array_append_val(masks, mask);
+			g_array_set_size(pinvalues, pinvalues->len + di->dec_num_channels);
+			store_current_pinvalues(di, (uint8_t *)pinvalues->data +
+				pinvalues->len - di->dec_num_channels);
+			if (samplenums->len >= (guint)max_matches)
+				break;
+
+			/*
+			 * Start over like another .wait() call would. This
+			 * doesn't touch Python objects: the condition list is
+			 * kept, and condition-less calls re-use their SKIP term.
+			 */
+			if (no_conds)
+				set_skip_condition(di, 1);
+			else
+				condition_list_rewind(di);
+			match_array_free(di);
+			(void)process_samples_until_next_match(di, &found_match);
+
+			/*
+			 * Conditions which only check levels match the same
+			 * sample again (as another .wait() call would). Don't
+			 * return that sample several times, the next call
+			 * resumes there.
+			 */
+			if (found_match && di->abs_cur_samplenum ==
+					g_array_index(samplenums, uint64_t, samplenums->len - 1))
+				break;
+		}
+		stats_scan_done(di, start, samplenum);
+
+		Py_END_ALLOW_THREADS
+
+		/* If there were matches, set self.samplenum etc. and return. */
+		if (samplenums->len) {
+			set_samplenum(di, g_array_index(samplenums, uint64_t,
+				samplenums->len - 1));
+
+			mask = g_array_index(masks, uint64_t, masks->len - 1);
+			matched = g_malloc0(num_conditions + 1);
+			for (i = 0; i < num_conditions && i < 64; i++)
+				matched[i] = (mask >> i) & 1;
+			set_matched(di, matched, num_conditions);
+			g_free(matched);
+			match_array_free(di);
 
-		/*
-		 * When termination of wait() and decode() was requested,
-		 * then exit the loop after releasing the mutex.
-		 */
-		if (di->want_wait_terminate) {
-			srd_dbg("%s: %s: Will return from wait().",
-				di->inst_id, __func__);
 			g_mutex_unlock(&di->data_mutex);
-			goto err;
+
+			py_samplenums = new_py_array("Q", samplenums->data,
+				samplenums->len * sizeof(uint64_t));
+			py_masks = new_py_array("Q", masks->data,
+				masks->len * sizeof(uint64_t));
+			py_pinvalues = new_py_array("B", pinvalues->data,
+				pinvalues->len);
+			py_ret = NULL;
+			if (py_samplenums && py_masks && py_pinvalues)
+				py_ret = PyTuple_Pack(3, py_samplenums, py_masks, py_pinvalues);
+			Py_XDECREF(py_samplenums);
+			Py_XDECREF(py_masks);
+			Py_XDECREF(py_pinvalues);
+
+			stats_wait_end(di, samplenums->len);
+			g_array_free(samplenums, TRUE);
+			g_array_free(masks, TRUE);
+			g_array_free(pinvalues, TRUE);
+
+			PyGILState_Release(gstate);
+
+			return py_ret;
 		}
 
-		g_mutex_unlock(&di->data_mutex);
+		if (wait_release_chunk(di) != SRD_OK)
+			break;
 	}
 
-	PyGILState_Release(gstate);
-
-	Py_RETURN_NONE;
+	g_array_free(samplenums, TRUE);
+	g_array_free(masks, TRUE);
+	g_array_free(pinvalues, TRUE);
 
 err:
+	stats_wait_end(di, 0);
 	PyGILState_Release(gstate);
 
 	return NULL;
@@ -1164,7 +1953,7 @@ static PyObject *Decoder_has_channel(PyObject *self, PyObject *args)
 
 	gstate = PyGILState_Ensure();
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		goto err;
 	}
@@ -1213,6 +2002,10 @@ static PyMethodDef Decoder_methods[] = {
 	  Decoder_wait, METH_VARARGS,
 	  Decoder_wait_doc,
 	},
+	{ "wait_many",
+	  Decoder_wait_many, METH_VARARGS,
+	  Decoder_wait_many_doc,
+	},
 	{ "has_channel",
 	  Decoder_has_channel, METH_VARARGS,
 	  Decoder_has_channel_doc,
@@ -1227,20 +2020,83 @@ static PyMethodDef Decoder_methods[] = {
  *
  * @private
  */
+static PyMemberDef Decoder_members[] = {
+	{ "samplenum", T_OBJECT_EX, offsetof(srd_Decoder, py_samplenum), 0,
+	  "The (absolute) sample number of the most recent match." },
+	{ "matched", T_OBJECT_EX, offsetof(srd_Decoder, py_matched), 0,
+	  "Per condition of the most recent match, whether it matched." },
+	ALL_ZERO,
+};
+
+static void Decoder_dealloc(PyObject *self)
+{
+	srd_Decoder *d;
+	PyTypeObject *type;
+
+	d = (srd_Decoder *)self;
+	type = Py_TYPE(self);
+
+	Py_CLEAR(d->py_samplenum);
+	Py_CLEAR(d->py_matched);
+	Py_CLEAR(d->py_pinvalues);
+
+	/* Decoder objects are instances of (heap type) subclasses. */
+	if (PyType_GetFlags(type) & Py_TPFLAGS_HAVE_GC)
+		PyObject_GC_Del(self);
+	else
+		PyObject_Free(self);
+#if PY_VERSION_HEX >= 0x03080000
+	Py_DECREF(type);
+#endif
+}
+
+/**
+ * Attach a decoder instance to its Python object.
+ *
+ * @param py_inst The decoder instance's sigrokdecode.Decoder object.
+ *                Must not be NULL.
+ * @param di The decoder instance, or NULL to detach it.
+ *
+ * @private
+ */
+SRD_PRIV void srd_Decoder_inst_set(PyObject *py_inst,
+		struct srd_decoder_inst *di)
+{
+	((srd_Decoder *)py_inst)->di = di;
+}
+
 SRD_PRIV PyObject *srd_Decoder_type_new(void)
 {
 	PyType_Spec spec;
 	PyType_Slot slots[] = {
 		{ Py_tp_doc, Decoder_doc },
 		{ Py_tp_methods, Decoder_methods },
+		{ Py_tp_members, Decoder_members },
+		{ Py_tp_dealloc, Decoder_dealloc },
 		{ Py_tp_new, (void *)&PyType_GenericNew },
 		ALL_ZERO,
 	};
-	PyObject *py_obj;
+	PyObject *py_obj, *py_mod;
 	PyGILState_STATE gstate;
 
 	gstate = PyGILState_Ensure();
 
+	/*
+	 * wait_many() returns array.array objects. A reference from a
+	 * previous (finalized) interpreter is stale, don't release it.
+	 */
+	py_mod = PyImport_ImportModule("array");
+	if (!py_mod) {
+		PyGILState_Release(gstate);
+		return NULL;
+	}
+	py_array_type = PyObject_GetAttrString(py_mod, "array");
+	Py_DECREF(py_mod);
+	if (!py_array_type) {
+		PyGILState_Release(gstate);
+		return NULL;
+	}
+
 	spec.name = "sigrokdecode.Decoder";
 	spec.basicsize = sizeof(srd_Decoder);
 	spec.itemsize = 0;